@@ -1,5 +1,6 @@
 import os
 import time
+import asyncio
 import re
 import socket
 import sys
@@ -7,23 +8,153 @@ import configparser
 import sqlite3
 import math
 import threading
-
-def normalize(name):
+import queue
+import heapq
+import bisect
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import pathname2url
+import select
+import ctypes
+import ctypes.util
+import struct
+import unicodedata
+import signal
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- NAME KEYS ---
+# A player's key (clean_name) is their name without Quake color codes, with accents folded and
+# everything but lowercase letters and digits dropped: "^1Dark^7 [Lord]" -> "darklord".
+# Every lookup by name goes through name_key so online and database keys always agree.
+
+COLOR_CODE_PATTERN = re.compile(r'\^.')
+NAME_KEY_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+
+class NameKeyTable(dict):
+    """str.translate table that works out how to fold each character the first time it is seen."""
+    def __missing__(self, codepoint):
+        folded = unicodedata.normalize('NFKD', chr(codepoint)).lower()
+        kept = "".join(c for c in folded if c in NAME_KEY_CHARS) or None
+        self[codepoint] = kept
+        return kept
+
+NAME_KEY_TABLE = NameKeyTable()
+
+def decode_line(raw):
+    """Text of one line of server output. The log and RCON replies both come through here, so a
+    name gives the same key from either: UTF-8 when the bytes are valid UTF-8, otherwise Latin-1
+    (older clients send names in their Windows code page)."""
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+def decode_text(data):
+    return "\n".join(decode_line(line) for line in data.split(b'\n'))
+
+@lru_cache(maxsize=4096)
+def name_key(name):
     if not name: return ""
-    # 1. Strip color codes (^1, ^2, etc.)
-    name = re.sub(r'\^.', '', name) 
-    # 2. Lowercase
-    name = name.lower().strip()
-    # 3. Remove all non-alphanumeric (removes {}, [], _, |, etc.)
-    # This ensures "Cheemsune Miku" matches the messy log version
-    name = re.sub(r'[^a-z0-9]', '', name)
-    return name
+    # Most names in chat and kill lines have no color codes, so skip the regex for them
+    if '^' in name:
+        name = COLOR_CODE_PATTERN.sub('', name)
+    return name.translate(NAME_KEY_TABLE)
+
+# --- LOG LINE CLASSIFIER ---
+# Nearly every line is "<time> <Word>: ...". The first word picks the event directly, so
+# kills, item pickups and other engine noise are rejected without running any pattern.
+LINE_HEAD_PATTERN = re.compile(r'\s*(?:\d+:\d\d)?\s*(?:\d+:)?\s*([A-Za-z_]+)')
+
+EVENT_WORDS = {
+    "initgame": "init",
+    "clientuserinfochanged": "userinfo",
+    "player": "guid",
+    "clientinfo": "guid",
+    "duelstart": "duel_start",
+    "duelend": "duel_end",
+    "clientdisconnect": "disconnect",
+    "smod": "smod",
+    "say": "chat",
+    "tell": "chat",
+}
+
+IGNORED_WORDS = frozenset([
+    "kill", "item", "clientconnect", "clientbegin", "shutdowngame", "exit", "score",
+    "red", "blue", "warmup", "sayteam", "broadcast",
+])
+
+# Lines that don't start with a known word fall back to finding the first event keyword anywhere
+EVENT_PATTERN = re.compile(
+    r'(?P<init>InitGame:)'
+    r'|(?P<userinfo>ClientUserinfoChanged:)'
+    r'|(?P<guid>ja_guid\\)'
+    r'|(?P<duel_start>DuelStart:)'
+    r'|(?P<duel_end>(?i:DuelEnd:))'
+    r'|(?P<disconnect>ClientDisconnect:)'
+    r'|(?P<smod>SMOD smsay:)'
+    r'|(?P<chat>(?i:say|tell):)')
+
+USERINFO_PATTERN = re.compile(r'ClientUserinfoChanged: (\d+) n\\(.*?)\\t\\(\d+)')
+GUID_PATTERN = re.compile(r'(?:Player|ClientInfo)\s+(\d+).*?ja_guid\\([A-Z0-9]{32})')
+DUEL_START_PATTERN = re.compile(r'DuelStart: (.*?) challenged (.*?) to a private duel')
+DUEL_END_PATTERN = re.compile(r'DuelEnd:\s+(.*?)\s+has defeated\s+(.*?)\s+in a private duel', re.IGNORECASE)
+DISCONNECT_PATTERN = re.compile(r'ClientDisconnect:\s*(\d+)')
+SMOD_PATTERN = re.compile(r'SMOD smsay:\s+(.*?)\s+\(adminID:\s+(\d+)\).*?\):\s*(.*)$')
+CHAT_SID_PATTERN = re.compile(r'(\d+):\s*(?:say|tell):', re.IGNORECASE)
+CHAT_MESSAGE_PATTERN = re.compile(r':\s*"(.*)"\s*$')
+CHAT_NAME_PATTERN = re.compile(r'(?:say|tell):\s*(.*?)\s*:', re.IGNORECASE)
+
+def classify_line(line):
+    """Returns the event name a log line carries, or None if the plugin ignores it."""
+    head = LINE_HEAD_PATTERN.match(line)
+    if head:
+        word = head.group(1).lower()
+        event = EVENT_WORDS.get(word)
+        if event or word in IGNORED_WORDS:
+            return event
+    m = EVENT_PATTERN.search(line)
+    return m.lastgroup if m else None
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def match_rank(query, clean_name):
+    """Sort key for name search results: exact match, then prefix, then substring; shorter names first."""
+    if clean_name == query:
+        kind = 0
+    elif clean_name.startswith(query):
+        kind = 1
+    else:
+        kind = 2
+    return (kind, len(clean_name), clean_name)
+
+def search_player_names(conn, query, limit=5):
+    """Searches every player in the database for a partial clean name.
+    Returns (guid, name, clean_name) rows, best match first."""
+    if not query:
+        return []
+    if len(query) < 3:
+        # Too short for trigrams: prefix range on the clean_name index
+        where = "clean_name >= ? AND clean_name < ?"
+        params = (query, query + "\uffff")
+    else:
+        # Sharing every trigram doesn't guarantee a substring match, so instr() checks
+        grams = sorted(trigrams(query))
+        marks = ",".join("?" * len(grams))
+        where = f"""guid IN (SELECT guid FROM name_trigrams WHERE gram IN ({marks})
+                             GROUP BY guid HAVING COUNT(*) = ?) AND instr(clean_name, ?) > 0"""
+        params = (*grams, len(grams), query)
+    # Same order as match_rank: exact, prefix, substring, then shorter names first
+    return conn.execute(f"""SELECT guid, name, clean_name FROM players WHERE {where}
+                            ORDER BY clean_name != ?, substr(clean_name, 1, ?) != ?, length(clean_name), clean_name
+                            LIMIT ?""", (*params, query, len(query), query, limit)).fetchall()
 
 class Player:
     def __init__(self, sid, name, guid, rating=1500, rd=350, vol=0.06, clan="NONE", role="MEMBER", group="DEFAULT"):
         self.id = sid
         self.name = name
-        self.clean_name = normalize(name)
+        self.clean_name = name_key(name)
         self.guid = guid
         self.rating = rating
         self.rd = rd
@@ -40,15 +171,1600 @@ class Player:
         self.pending_limit = 5
         self.match_score = 0
         self.match_limit = 5
+        # The players row this player's stats are saved to, and its leaderboard counters
+        self.db_guid = None
+        self.db_name = name
+        self.matches_won = 0
+        self.tournament_wins = 0
+
+class PlayerRegistry:
+    """Players in memory, indexed by slot, clean name and GUID. Slot moves and removals must go
+    through here so the three indexes never disagree."""
+    def __init__(self):
+        self.slots = {}
+        self.names = {}
+        self.guids = {}
+
+    def __iter__(self):
+        # Iterate over a snapshot so callers may add or remove players while looping
+        return iter(list(self.names.values()))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, player):
+        return self.names.get(player.clean_name) is player
+
+    @staticmethod
+    def valid_guid(guid):
+        return bool(guid) and guid != "0" and len(guid) > 10
+
+    def by_slot(self, sid):
+        return self.slots.get(sid)
+
+    def by_name(self, clean_name):
+        return self.names.get(clean_name)
+
+    def by_guid(self, guid):
+        return self.guids.get(guid)
+
+    def search(self, query, where=None):
+        """Players whose clean name contains query, best match first. where() can filter candidates.
+        A plain scan: a server holds a few dozen players, too few for an index to pay for its
+        upkeep on every join and leave (the offline search has name_trigrams for that)."""
+        if not query:
+            return []
+        found = [x for n, x in self.names.items() if query in n]
+        if where:
+            found = [x for x in found if where(x)]
+        if len(found) > 1:
+            found.sort(key=lambda x: match_rank(query, x.clean_name))
+        return found
+
+    def find(self, query, where=None):
+        """The best match for query, or None."""
+        exact = self.names.get(query)
+        if exact and (where is None or where(exact)):
+            return exact
+        found = self.search(query, where)
+        return found[0] if found else None
+
+    def add(self, player):
+        old = self.names.get(player.clean_name)
+        if old is not None and old is not player:
+            self.remove(old)
+        self.names[player.clean_name] = player
+        if self.valid_guid(player.guid):
+            self.guids[player.guid] = player
+        sid, player.id = player.id, -1
+        self.set_slot(player, sid)
+        return player
+
+    def remove(self, player):
+        if self.names.get(player.clean_name) is player:
+            del self.names[player.clean_name]
+        if self.guids.get(player.guid) is player:
+            del self.guids[player.guid]
+        if self.slots.get(player.id) is player:
+            del self.slots[player.id]
+
+    def set_slot(self, player, sid):
+        """Moves a player to a slot (-1 for none). Whoever held that slot before is left without one."""
+        if self.slots.get(player.id) is player:
+            del self.slots[player.id]
+        if sid != -1:
+            previous = self.slots.get(sid)
+            if previous is not None and previous is not player:
+                previous.id = -1
+            self.slots[sid] = player
+        player.id = sid
+
+    def clear(self):
+        self.slots.clear()
+        self.names.clear()
+        self.guids.clear()
+
+class InotifyWatcher:
+    """Wakes up when the server log is written, using Linux inotify via libc."""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch the directory, not the file, so we also see the log being recreated or rotated
+        directory = os.path.dirname(os.path.abspath(path))
+        self.filename = os.path.basename(path).encode()
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        if libc.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+
+        # Lets another thread cut a wait short (e.g. the dispatcher asking for a skip)
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+
+    def wait(self, timeout):
+        """Blocks until our log file changes or the timeout expires. Returns True on a change."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            ready, _, _ = select.select([self.fd, self.wake_r], [], [], remaining)
+            if not ready:
+                return False
+            if self.wake_r in ready:
+                try:
+                    os.read(self.wake_r, 512)
+                except BlockingIOError:
+                    pass
+                return True
+            if self.changed():
+                return True
+
+    def changed(self):
+        """Reads the pending events without blocking. True if one of them is about our log."""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+
+        # Other files in the server directory (games.log, qconsole.log) also raise events
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            if name == self.filename or mask & self.IN_Q_OVERFLOW:
+                return True
+        return False
+
+    def wake(self):
+        os.write(self.wake_w, b'x')
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+            self.fd = -1
+
+class LogTailer:
+    """Follows the server log through one open descriptor, reading new data in large blocks.
+    Blocks on inotify where available, otherwise polls like before."""
+    def __init__(self, path, poll_interval=0.1, use_inotify=True, max_wait=1.0, block_size=65536):
+        self.path = path
+        self.poll_interval = poll_interval
+        # Even with inotify we re-check the file now and then in case an event was missed
+        self.max_wait = max_wait
+        self.block_size = block_size
+        self.fd = None
+        self.ident = None
+        self.pos = 0
+        self.partial = b''
+        self.lag_bytes = 0
+        self.max_lag_bytes = 0
+        self.rotations = 0
+        self.wakeup = threading.Event()
+        self.watcher = None
+
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.watcher = InotifyWatcher(path)
+            except (OSError, AttributeError) as e:
+                print(f"[SYSTEM] inotify unavailable ({e}), falling back to polling.")
 
-class MBIIDuelPlugin:
+        self.mode = "inotify" if self.watcher else "polling"
+
+    def _open(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        except OSError:
+            return False
+        st = os.fstat(fd)
+        self.fd, self.ident = fd, (st.st_dev, st.st_ino)
+        self.pos, self.partial = 0, b''
+        return True
+
+    def _close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _rotated(self):
+        """True when the log path now points at a different file than the one we hold open."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False # Gone for now; keep the old descriptor until a new log appears
+        return (st.st_dev, st.st_ino) != self.ident
+
+    def seek_end(self):
+        """Skips everything currently in the log (startup and InitGame)."""
+        if self.fd is not None and self._rotated():
+            self._close_fd()
+        if self.fd is None and not self._open():
+            return
+        self.pos = os.lseek(self.fd, 0, os.SEEK_END)
+        self.partial = b''
+
+    def _drain(self):
+        size = os.fstat(self.fd).st_size
+
+        # Truncated in place: start again from the top
+        if size < self.pos:
+            self.pos = os.lseek(self.fd, 0, os.SEEK_SET)
+            self.partial = b''
+
+        self.lag_bytes = size - self.pos
+        self.max_lag_bytes = max(self.max_lag_bytes, self.lag_bytes)
+        if size == self.pos:
+            return []
+
+        chunks = [self.partial]
+        while True:
+            chunk = os.read(self.fd, self.block_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self.pos += len(chunk)
+        data = b''.join(chunks)
+
+        # Leave a half-written line for the next pass instead of splitting it in two
+        cut = data.rfind(b'\n') + 1
+        self.partial = data[cut:]
+        if not cut:
+            return []
+        stripped = (decode_line(line).strip() for line in data[:cut].split(b'\n'))
+        return [line for line in stripped if line]
+
+    def read_lines(self):
+        """Returns the complete lines written since the last call, stripped and non-empty."""
+        if self.fd is None and not self._open():
+            return []
+
+        lines = self._drain()
+
+        # Rotation is detected by inode/device, so a replacement log that is already
+        # bigger than our bookmark is still noticed. Finish the old file first.
+        if self._rotated():
+            self._close_fd()
+            self.rotations += 1
+            if self._open():
+                lines.extend(self._drain())
+        return lines
+
+    def wait(self):
+        if self.watcher:
+            self.watcher.wait(self.max_wait)
+        else:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    async def wait_async(self):
+        """wait() for the asyncio core loop: the inotify descriptor is watched by the loop itself."""
+        if not self.watcher:
+            await asyncio.sleep(self.poll_interval)
+            return
+        loop = asyncio.get_running_loop()
+        changed = loop.create_future()
+        def readable():
+            if self.watcher.changed() and not changed.done():
+                changed.set_result(True)
+        loop.add_reader(self.watcher.fd, readable)
+        try:
+            await asyncio.wait_for(changed, self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(self.watcher.fd)
+
+    def wake(self):
+        """Interrupts a wait() in progress from another thread."""
+        if self.watcher:
+            self.watcher.wake()
+        else:
+            self.wakeup.set()
+
+    def close(self):
+        self._close_fd()
+        if self.watcher:
+            self.watcher.close()
+
+class LogReader(threading.Thread):
+    """Reader stage: tails the log and hands timestamped lines to the dispatcher through a
+    bounded queue, so a slow handler never stops new lines from being read and buffered."""
+    def __init__(self, tailer, line_queue, lag_warn=65536):
+        super().__init__(name="log-reader", daemon=True)
+        self.tailer = tailer
+        self.queue = line_queue
+        self.lag_warn = lag_warn
+        # Bumped every time we skip to the end of the log, so the dispatcher can drop
+        # lines that were queued before an InitGame
+        self.generation = 0
+        self.skip_requested = threading.Event()
+        self.stopped = threading.Event()
+
+        # Backpressure counters
+        self.lines_read = 0
+        self.queue_full_waits = 0
+        self.max_depth = 0
+        self.last_full_warning = 0
+
+    def request_skip(self):
+        """Asks the reader to jump to the end of the log (the dispatcher saw InitGame)."""
+        self.skip_requested.set()
+        self.tailer.wake()
+
+    def stop(self, timeout=5):
+        """Stops the reader and waits for it, so the tailer can be closed under it."""
+        self.stopped.set()
+        self.tailer.wake()
+        self.join(timeout)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                if self.skip_requested.is_set():
+                    self.skip_requested.clear()
+                    self.tailer.seek_end()
+                    self.generation += 1
+
+                lines = self.tailer.read_lines()
+                stamp = time.time()
+                for line in lines:
+                    item = (self.generation, stamp, line)
+                    try:
+                        self.queue.put_nowait(item)
+                    except queue.Full:
+                        self.queue_full_waits += 1
+                        if stamp - self.last_full_warning > 10:
+                            self.last_full_warning = stamp
+                            print(f"[SYSTEM] Line queue full ({self.queue.maxsize}). Reader waiting on dispatcher (x{self.queue_full_waits}).")
+                        # Wait in steps, so stop() still gets through if the dispatcher is gone
+                        while not self.stopped.is_set():
+                            try:
+                                self.queue.put(item, timeout=0.5)
+                                break
+                            except queue.Full:
+                                pass
+                self.lines_read += len(lines)
+                self.max_depth = max(self.max_depth, self.queue.qsize())
+
+                if self.tailer.lag_bytes > self.lag_warn:
+                    print(f"[SYSTEM] Log tailer was {self.tailer.lag_bytes} bytes behind (max {self.tailer.max_lag_bytes}).")
+
+                self.tailer.wait()
+            except Exception as e:
+                print(f"[CRITICAL ERROR] Reader failure: {e}")
+                self.stopped.wait(2)
+
+class JobConnection:
+    """The write connection as a transact job sees it. Counts the statements the job runs so
+    they show up in the writer's totals like queued ones."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = 0
+
+    def execute(self, sql, params=()):
+        self.statements += 1
+        return self.conn.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self.statements += len(seq_of_params)
+        return self.conn.executemany(sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+class DBWriter(threading.Thread):
+    """Owns the plugin's single write connection. Handlers queue their statements here and the
+    writer commits everything that arrives within commit_interval as one transaction."""
+    def __init__(self, db_filename, commit_interval=0.005, synchronous="NORMAL", wait_for_commit=False, max_batch=1000,
+                 busy_timeout=20.0, busy_retries=3):
+        super().__init__(name="db-writer", daemon=True)
+        self.db_filename = db_filename
+        self.commit_interval = commit_interval
+        self.synchronous = synchronous
+        # Other processes may share the database: SQLite waits busy_timeout seconds for their
+        # write lock, then we back off and try the batch again busy_retries times
+        self.busy_timeout = busy_timeout
+        self.busy_retries = busy_retries
+        # 'commit' durability: every write call returns only once its transaction is committed
+        self.wait_for_commit = wait_for_commit
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.closed = False
+        self.close_lock = threading.Lock()
+
+        # Counters
+        self.statements = 0
+        self.jobs = 0
+        self.commits = 0
+        self.errors = 0
+        self.busy = 0
+        self.commit_seconds = Histogram()
+        self.query_seconds = Histogram()
+        self.start()
+
+    def execute(self, sql, params=()):
+        """Queues a write statement."""
+        if self.wait_for_commit:
+            self._submit(sql, params, False)
+        else:
+            self.queue.put((sql, params, False, None))
+
+    def executemany(self, sql, seq_of_params):
+        if self.wait_for_commit:
+            self._submit(sql, list(seq_of_params), True)
+        else:
+            self.queue.put((sql, list(seq_of_params), True, None))
+
+    def query(self, sql, params=()):
+        """Runs a SELECT after every write queued before it and returns all rows."""
+        started = time.perf_counter()
+        try:
+            return self._submit(sql, params, False)
+        finally:
+            self.query_seconds.observe(time.perf_counter() - started)
+
+    def query_one(self, sql, params=()):
+        rows = self.query(sql, params)
+        return rows[0] if rows else None
+
+    def transact(self, func, *args):
+        """Runs func(conn, *args) on the write connection inside a batch transaction and returns
+        its result. The transaction holds the write lock from its first statement (BEGIN IMMEDIATE),
+        so nothing func reads can change before it writes, not even from another process."""
+        return self._submit(func, args, False)
+
+    def flush(self, timeout=None):
+        """Blocks until every write queued so far has been committed."""
+        self._submit(None, None, False, timeout)
+
+    def _submit(self, sql, params, many, timeout=None):
+        # [done, rows, error]
+        waiter = [threading.Event(), None, None]
+        # Checked under the lock close() takes, so nothing can be queued behind the stop marker
+        with self.close_lock:
+            if self.closed:
+                raise sqlite3.ProgrammingError("Cannot use a closed DBWriter.")
+            self.queue.put((sql, params, many, waiter))
+        waiter[0].wait(timeout)
+        if waiter[2]:
+            raise waiter[2]
+        return waiter[1]
+
+    def close(self, timeout=10):
+        """Commits whatever is still queued and stops the writer (flush-on-shutdown)."""
+        with self.close_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.join(timeout)
+
+    def run(self):
+        conn = sqlite3.connect(self.db_filename, timeout=self.busy_timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        ensure_sqrt(conn)
+
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.commit_interval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                # Someone is waiting on this batch: commit now instead of waiting out the window
+                if item[3] is not None or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self.commit_batch(conn, batch)
+
+        conn.close()
+
+    @staticmethod
+    def is_read(sql):
+        """True for a statement that can't write: a SELECT, or a PRAGMA that only reads a value."""
+        text = sql.lstrip().upper()
+        return text.startswith("SELECT") or text.startswith("PRAGMA") and "=" not in text
+
+    def begin(self, conn, batch):
+        """Starts the batch's transaction. Batches with a write or a transact job take the database
+        write lock up front; read-only ones (queries and flush markers) use a plain deferred BEGIN,
+        which under WAL never waits on another process's write lock."""
+        if all(sql is None or isinstance(sql, str) and self.is_read(sql) for sql, _, _, _ in batch):
+            conn.execute("BEGIN")
+            return
+        for attempt in range(self.busy_retries + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                # Still locked after busy_timeout: another process is holding on to it
+                if "locked" not in str(e) and "busy" not in str(e) or attempt == self.busy_retries:
+                    raise
+                self.busy += 1
+                print(f"[DB ERROR] Database busy, retrying ({attempt + 1}/{self.busy_retries})")
+                time.sleep(0.1 * 2 ** attempt)
+
+    def run_job(self, conn, func, args):
+        # A job that fails halfway takes its own writes back with it
+        conn.execute("SAVEPOINT job")
+        job = JobConnection(conn)
+        try:
+            result = func(job, *args)
+        except Exception:
+            conn.execute("ROLLBACK TO job")
+            raise
+        finally:
+            conn.execute("RELEASE job")
+        self.jobs += 1
+        self.statements += job.statements
+        return result
+
+    def commit_batch(self, conn, batch):
+        started = time.perf_counter()
+        try:
+            self.begin(conn, batch)
+            for sql, params, many, waiter in self.coalesce(batch):
+                if sql is None:
+                    continue # flush marker
+                try:
+                    if callable(sql):
+                        result = self.run_job(conn, sql, params)
+                        if waiter:
+                            waiter[1] = result
+                        continue
+                    if many:
+                        conn.executemany(sql, params)
+                    else:
+                        rows = conn.execute(sql, params).fetchall()
+                        if waiter:
+                            waiter[1] = rows
+                    self.statements += len(params) if many else 1
+                except Exception as e:
+                    # A bad statement only loses itself (or the run it was merged into), not the rest of the batch
+                    self.errors += 1
+                    print(f"[DB ERROR] {e} ({sql.__name__ if callable(sql) else sql.split(None, 3)[:3]})")
+                    if waiter:
+                        waiter[2] = e
+            conn.execute("COMMIT")
+            self.commits += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"[DB ERROR] Commit of {len(batch)} statements failed: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            for _, _, _, waiter in batch:
+                if waiter and not waiter[2]:
+                    waiter[2] = e
+        finally:
+            self.commit_seconds.observe(time.perf_counter() - started)
+            for _, _, _, waiter in batch:
+                if waiter:
+                    waiter[0].set()
+
+    @staticmethod
+    def coalesce(batch):
+        """Merges consecutive fire-and-forget copies of the same statement (mostly the round and
+        match counter bumps) into one executemany, so SQLite prepares and steps them in one call.
+        Ledger rows are not among them: each is written by its duel's rate_duel job."""
+        merged = []
+        run = None # params list of the run merged[-1] is collecting, if any
+        for item in batch:
+            sql, params, many, waiter = item
+            if isinstance(sql, str) and not many and waiter is None:
+                if run is not None and merged[-1][0] == sql:
+                    run.append(params)
+                    continue
+                run = [params]
+                merged.append((sql, run, True, None))
+            else:
+                run = None
+                merged.append(item)
+        # A run of one goes back to a plain execute
+        return [(sql, params[0], False, None) if many and waiter is None and len(params) == 1 else (sql, params, many, waiter)
+                for sql, params, many, waiter in merged]
+
+class ReadPool:
+    """Runs read-only chat command queries on a few worker threads. Each worker keeps its own
+    read-only WAL connection, so readers never wait on (or hold up) the writer."""
+    def __init__(self, db_filename, workers=2, writer=None):
+        self.uri = "file:" + pathname2url(os.path.abspath(db_filename)) + "?mode=ro"
+        # Waiting on the writer here (not on the dispatcher) lets replies include writes that
+        # were still inside their group-commit window when the command came in
+        self.writer = writer
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="db-read")
+        self.jobs = 0
+        self.errors = 0
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.uri, uri=True, timeout=5)
+            self.local.conn = conn
+        return conn
+
+    def submit(self, job, *args):
+        """Runs job(conn, *args) on a pool thread. Failures are logged, never raised to the caller."""
+        def task():
+            try:
+                if self.writer:
+                    self.writer.flush()
+                return job(self.connection(), *args)
+            except Exception as e:
+                self.errors += 1
+                print(f"[DB ERROR] {job.__name__} failed: {e}")
+        self.jobs += 1
+        return self.executor.submit(task)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class Leaderboard:
+    """The top rows of one players column, kept sorted in memory and updated as values change.
+    Every row not in the list is known to be <= ceiling, so the list is always the true top
+    len(entries) and only has to be reloaded if it shrinks below the lines a reply shows."""
+    def __init__(self, column, size=50, show=5):
+        self.column = column
+        self.size = size
+        self.show = show
+        self.entries = [] # (-value, guid), best first
+        self.rows = {}    # guid -> (value, name)
+        self.ceiling = float('-inf')
+        self.lock = threading.Lock()
+        self.updates = 0 # bumped by update(), so a reload read elsewhere can tell it went stale
+
+    def load(self, rows, since=None):
+        """rows: (guid, name, value), best first, at most size of them. With `since` (an earlier
+        value of self.updates) the rows are only taken if nothing was updated in between, since
+        they would undo that update. Returns True if they were taken."""
+        with self.lock:
+            if since is not None and since != self.updates:
+                return False
+            self.rows = {guid: (value, name) for guid, name, value in rows}
+            self.entries = sorted((-value, guid) for guid, name, value in rows)
+            self.ceiling = rows[-1][2] if len(rows) >= self.size else float('-inf')
+            return True
+
+    def update(self, guid, name, value):
+        if not name or name == 'Unknown':
+            return # never shown, same as the old query's filter
+        with self.lock:
+            self.updates += 1
+            old = self.rows.pop(guid, None)
+            if old is not None:
+                del self.entries[bisect.bisect_left(self.entries, (-old[0], guid))]
+            # Below the ceiling it could be outranked by rows we don't hold, so let it go
+            if value >= self.ceiling:
+                bisect.insort(self.entries, (-value, guid))
+                self.rows[guid] = (value, name)
+                if len(self.entries) > self.size:
+                    value, guid = self.entries.pop()
+                    del self.rows[guid]
+                    self.ceiling = max(self.ceiling, -value)
+
+    @property
+    def stale(self):
+        return len(self.entries) < self.show and self.ceiling != float('-inf')
+
+    def top(self):
+        """(name, value) for the best rows with a value above 0."""
+        with self.lock:
+            found = []
+            for neg_value, guid in self.entries[:self.show]:
+                if neg_value >= 0:
+                    break
+                found.append((self.rows[guid][1], -neg_value))
+            return found
+
+# --- CLAN AGGREGATES ---
+# Columns whose change moves a player between clans/groups or changes what they add to them
+CLAN_UPDATE_EVENT = "UPDATE OF clan_tag, clan_role, clan_group, duel_rating, name"
+
+def clan_delta_sql(row, sign):
+    """Trigger body that adds (sign '+') or removes ('-') one players row from its clan's totals.
+    Like the old GROUP BY, players named 'Unknown' count as members but not towards the average."""
+    group = f"IFNULL({row}.clan_group, 'DEFAULT')"
+    return f"""
+        INSERT OR IGNORE INTO clans (clan_tag) VALUES ({row}.clan_tag);
+        UPDATE clans SET
+            member_count = member_count {sign} 1,
+            rated_members = rated_members {sign} (CASE WHEN {row}.name != 'Unknown' AND {row}.duel_rating IS NOT NULL THEN 1 ELSE 0 END),
+            rating_sum = rating_sum {sign} (CASE WHEN {row}.name != 'Unknown' THEN IFNULL({row}.duel_rating, 0) ELSE 0 END),
+            owners = owners {sign} (CASE WHEN {row}.clan_role = 'OWNER' THEN 1 ELSE 0 END)
+        WHERE clan_tag = {row}.clan_tag;
+        INSERT OR IGNORE INTO clan_groups (clan_tag, group_name) VALUES ({row}.clan_tag, {group});
+        UPDATE clan_groups SET member_count = member_count {sign} 1 WHERE clan_tag = {row}.clan_tag AND group_name = {group};
+        DELETE FROM clans WHERE clan_tag = {row}.clan_tag AND member_count <= 0;
+        DELETE FROM clan_groups WHERE clan_tag = {row}.clan_tag AND group_name = {group} AND member_count <= 0;"""
+
+# --- RATINGS ---
+def glicko2_duel(w_rating, w_rd, l_rating, l_rd):
+    """One duel's Glicko-2 update, winner first. Returns (w_rating, w_rd, l_rating, l_rd)."""
+    def g(rd): return 1 / math.sqrt(1 + 3 * (rd**2) / (math.pi**2))
+    def E(r1, r2, rd2): return 1 / (1 + math.exp(-g(rd2) * (r1 - r2) / 173.7178))
+
+    r1, rd1 = (w_rating - 1500) / 173.7178, w_rd / 173.7178
+    r2, rd2 = (l_rating - 1500) / 173.7178, l_rd / 173.7178
+
+    v1 = 1 / (g(rd2)**2 * E(r1, r2, rd2) * (1 - E(r1, r2, rd2)))
+    new_rd1 = 1 / math.sqrt(1 / rd1**2 + 1 / v1)
+    new_r1 = r1 + new_rd1**2 * (g(rd2) * (1 - E(r1, r2, rd2)))
+
+    v2 = 1 / (g(rd1)**2 * E(r2, r1, rd1) * (1 - E(r2, r1, rd1)))
+    new_rd2 = 1 / math.sqrt(1 / rd2**2 + 1 / v2)
+    new_r2 = r2 + new_rd2**2 * (g(rd1) * (0 - E(r2, r1, rd1)))
+
+    return (1500 + 173.7178 * new_r1, max(30, 173.7178 * new_rd1),
+            1500 + 173.7178 * new_r2, max(30, 173.7178 * new_rd2))
+
+LEDGER_SQL = """INSERT INTO duel_results (ts, winner_guid, loser_guid, formal, tournament,
+                    winner_rating_before, winner_rating_after, winner_rd_before, winner_rd_after,
+                    loser_rating_before, loser_rating_after, loser_rd_before, loser_rd_after)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+def rate_duel(conn, winner_key, loser_key, memory, ledger):
+    """DBWriter.transact job for one finished duel. Reads both ratings as they are in the database
+    right now, rates the duel from those, saves them and appends the ledger row, all in the one
+    transaction. Keys are (column, value) for the players row; `memory` is the plugin's copy of
+    (w_rating, w_rd, l_rating, l_rd), used for players without a row. Returns (before, after)."""
+    now = time.time()
+    before = []
+    for (column, value), rating, rd in ((winner_key, memory[0], memory[1]), (loser_key, memory[2], memory[3])):
+        row = conn.execute(f"SELECT duel_rating, rating_deviation FROM players WHERE {column}=?", (value,)).fetchone()
+        if row:
+            rating = rating if row[0] is None else row[0]
+            rd = rd if row[1] is None else row[1]
+        before += [rating, rd]
+    before = tuple(before)
+    after = glicko2_duel(*before)
+    for (column, value), rating, rd in ((winner_key, after[0], after[1]), (loser_key, after[2], after[3])):
+        conn.execute(f"UPDATE players SET duel_rating=?, rating_deviation=?, last_active=? WHERE {column}=?",
+                     (rating, rd, now, value))
+    winner_guid, loser_guid, formal, tournament = ledger
+    conn.execute(LEDGER_SQL, (now, winner_guid, loser_guid, formal, tournament,
+                              before[0], after[0], before[1], after[1], before[2], after[2], before[3], after[3]))
+    return before, after
+
+# --- RD INFLATION ---
+# Glicko-2 between rating periods: a player who did not duel gains uncertainty,
+# RD' = sqrt(RD^2 + idle * (173.7178 * volatility)^2), capped at the starting 350. A run can
+# cover several periods (:until is the end of the last one); each player only gets the ones
+# they sat out, idle = (until - last_active) // period, at most :periods.
+# One statement for the whole table. Most players are inactive, so it scans the table once;
+# an index on last_active would be slower here and cost every rated duel an index update.
+RD_INFLATION_SQL = """UPDATE players SET rating_deviation = MIN(350, sqrt(rating_deviation * rating_deviation
+                          + MIN(:periods, CAST((:until - IFNULL(last_active, 0)) / :period AS INTEGER))
+                            * (173.7178 * IFNULL(volatility, 0.06)) * (173.7178 * IFNULL(volatility, 0.06))))
+                      WHERE IFNULL(last_active, 0) <= :until - :period AND rating_deviation < 350"""
+
+def ensure_sqrt(conn):
+    """Registers sqrt() on builds of SQLite compiled without the math functions."""
+    try:
+        conn.execute("SELECT sqrt(4)")
+    except sqlite3.OperationalError:
+        conn.create_function("sqrt", 1, math.sqrt)
+
+# Longest roster line sent before wrapping onto the next one
+ROSTER_LINE_CHARS = 200
+
+# Outbound RCON priorities (lower goes first)
+PRIORITY_MATCH = 0  # results, forfeits, round and champion announcements
+PRIORITY_NORMAL = 1
+PRIORITY_INFO = 2   # help text, leaderboards, rank and roster lookups
+
+class RconClient(threading.Thread):
+    """Sends RCON commands over one reused UDP socket. Commands wait in a priority queue and are
+    released through a token bucket so a burst of replies can't trip the server's flood protection.
+    Consecutive say/svtell messages for the same recipient share one packet, joined by the
+    engine's command separator."""
+    def __init__(self, host, port, password, rate=10.0, burst=10, max_queue=500, timeout=2.0, quiet=0.15,
+                 max_packet=1000, separator=";"):
+        super().__init__(name="rcon", daemon=True)
+        self.address = (host, int(port))
+        try:
+            # Replies are matched on the server's numeric address
+            self.server_ip = socket.gethostbyname(host)
+        except OSError:
+            self.server_ip = host
+        self.prefix = b'\xff\xff\xff\xff' + f'rcon "{password}" '.encode()
+        self.rate = max(float(rate), 0.1)
+        self.burst = max(int(burst), 1)
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.bucket_lock = threading.Lock()
+        self.max_queue = max(int(max_queue), 1)
+        self.timeout = timeout
+        self.quiet = quiet
+        self.max_packet = max(int(max_packet), 1)
+        self.separator = separator
+        self.heap = [] # (priority, seq, command)
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        # Every query in flight gets its own socket from this pool. The socket's local port is the
+        # request tag: the server answers to the port a command came from, so replies can't cross.
+        self.query_socks = []
+        self.pool_lock = threading.Lock()
+        self.sent = 0
+        self.packets = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return len(self.heap)
+
+    def send(self, command, priority=PRIORITY_NORMAL):
+        """Queues a command. When the queue is full the least important, newest message is dropped."""
+        return self.send_many([command], priority)
+
+    def send_many(self, commands, priority=PRIORITY_NORMAL):
+        """Queues several commands in one go, so the sender sees them together and can pack them."""
+        queued = 0
+        with self.cond:
+            if self.closed:
+                return 0
+            for command in commands:
+                if len(self.heap) >= self.max_queue:
+                    worst = max(self.heap)
+                    self.dropped += 1
+                    if self.dropped == 1 or self.dropped % 100 == 0:
+                        print(f"[SYSTEM] RCON queue full ({self.max_queue}). Dropped {self.dropped} messages so far.")
+                    if (priority, self.seq) > worst[:2]:
+                        continue
+                    self.heap.remove(worst)
+                    heapq.heapify(self.heap)
+                heapq.heappush(self.heap, (priority, self.seq, command))
+                self.seq += 1
+                queued += 1
+            self.max_depth = max(self.max_depth, len(self.heap))
+            self.cond.notify()
+        return queued
+
+    @staticmethod
+    def recipient(command):
+        """Who a message goes to ('say' or 'svtell <slot>'), or None if it shouldn't be packed."""
+        verb, _, rest = command.partition(' ')
+        # An unbalanced quote would swallow the separator and everything after it
+        if command.count('"') % 2:
+            return None
+        if verb == "say":
+            return verb
+        if verb == "svtell":
+            return "svtell " + rest.split(' ', 1)[0]
+        return None
+
+    @staticmethod
+    def payload(data):
+        """A reply datagram without its out-of-band header. Kept as bytes until the whole reply is
+        in, so a character split across two datagrams still decodes."""
+        if data.startswith(b'\xff\xff\xff\xffprint'):
+            return data[10:]
+        return data
+
+    def query(self, command):
+        """Sends a command and returns its printed reply, or None if the server didn't answer."""
+        return self.query_many([command])[0]
+
+    def query_many(self, commands):
+        """Sends several commands at once and returns their replies in the same order.
+        A reply is every datagram that arrives until the server has been quiet for a moment,
+        so long outputs like a full status table come back whole."""
+        socks = [self.acquire_socket() for _ in commands]
+        chunks = {sock: [] for sock in socks}
+        last_seen = {}
+        pending = set()
+        try:
+            for sock, command in zip(socks, commands):
+                # Anything already waiting here answers an older, abandoned request
+                self.drain(sock)
+                self.take_token()
+                try:
+                    sock.sendto(self.prefix + command.encode(), self.address)
+                    self.sent += 1
+                    pending.add(sock)
+                except OSError as e:
+                    self.failed += 1
+                    print(f"RCON Error: {e}")
+
+            hard_deadline = time.monotonic() + self.timeout
+            while pending:
+                now = time.monotonic()
+                for sock in [s for s in pending if s in last_seen and now - last_seen[s] >= self.quiet]:
+                    pending.discard(sock)
+                if not pending or now >= hard_deadline:
+                    break
+                wake = min(last_seen[s] + self.quiet if s in last_seen else hard_deadline for s in pending)
+                ready, _, _ = select.select(list(pending), [], [], max(0, wake - now))
+                for sock in ready:
+                    try:
+                        data, addr = sock.recvfrom(65535)
+                    except OSError:
+                        # e.g. Windows reporting the server port as unreachable
+                        pending.discard(sock)
+                        continue
+                    if addr[0] != self.server_ip:
+                        continue
+                    chunks[sock].append(self.payload(data))
+                    last_seen[sock] = time.monotonic()
+        finally:
+            with self.pool_lock:
+                self.query_socks.extend(socks)
+
+        replies = []
+        for sock, command in zip(socks, commands):
+            if chunks[sock]:
+                replies.append(decode_text(b"".join(chunks[sock])))
+            else:
+                self.failed += 1
+                print(f"RCON Error: no reply to '{command.split(' ', 1)[0]}'")
+                replies.append(None)
+        return replies
+
+    def acquire_socket(self):
+        with self.pool_lock:
+            if self.query_socks:
+                return self.query_socks.pop()
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def token_delay(self):
+        """Takes a token and returns 0, or returns how long to wait before one is available."""
+        with self.bucket_lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def take_token(self):
+        while True:
+            wait = self.token_delay()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def drain(self, sock):
+        """Discards replies nobody is waiting for so they don't pile up in the socket buffer."""
+        sock.setblocking(False)
+        try:
+            while True:
+                sock.recv(8192)
+        except OSError:
+            pass
+
+    def close(self, timeout=5):
+        """Stops taking new commands and gives the sender a moment to empty the queue."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.join(timeout)
+        with self.pool_lock:
+            for sock in self.query_socks:
+                sock.close()
+            self.query_socks = []
+
+    def next_batch(self):
+        """Pops the next command plus any queued after it for the same recipient that fit in one
+        packet. Call with self.cond held and the queue non-empty."""
+        _, _, command = heapq.heappop(self.heap)
+        batch = [command]
+        size = len(command.encode())
+        target = self.recipient(command)
+        while target and self.heap and self.recipient(self.heap[0][2]) == target:
+            extra = len(self.heap[0][2].encode()) + len(self.separator)
+            if size + extra > self.max_packet:
+                break
+            batch.append(heapq.heappop(self.heap)[2])
+            size += extra
+        return batch
+
+    def send_packet(self, batch):
+        self.drain(self.sock)
+        try:
+            self.sock.sendto(self.prefix + self.separator.join(batch).encode(), self.address)
+            self.sent += len(batch)
+            self.packets += 1
+        except OSError as e:
+            self.failed += len(batch)
+            print(f"RCON Error: {e}")
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.heap and not self.closed:
+                    self.cond.wait()
+                if not self.heap:
+                    break
+                batch = self.next_batch()
+            self.take_token()
+            self.send_packet(batch)
+        self.sock.close()
+
+class RconReply(asyncio.DatagramProtocol):
+    """Collects the datagrams answering one awaited RCON query."""
     def __init__(self):
-        self.config_file = sys.argv[1] if len(sys.argv) > 1 else 'duel.cfg'
+        self.chunks = []
+        self.last_seen = None
+        self.arrived = asyncio.Event()
+        self.error = None
+
+    def datagram_received(self, data, addr):
+        self.chunks.append(RconClient.payload(data))
+        self.last_seen = time.monotonic()
+        self.arrived.set()
+
+    def error_received(self, exc):
+        # e.g. the server port reported as unreachable
+        self.error = exc
+        self.arrived.set()
+
+class AsyncRconClient(RconClient):
+    """RconClient for the asyncio core loop. The sender is a task on the loop instead of a thread
+    and queries are awaited, so a slow status reply never holds up parsing. Queueing, packing and
+    the token bucket are the same as in the threaded client."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.loop_thread = None
+        self.ready = None
+        self.task = None
+
+    def attach(self, loop):
+        """Starts the sender task. Call from a coroutine running on `loop`."""
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.ready = asyncio.Event()
+        self.task = loop.create_task(self.sender())
+
+    def send_many(self, commands, priority=PRIORITY_NORMAL):
+        queued = super().send_many(commands, priority)
+        if queued and self.loop is not None:
+            # Read-pool callbacks queue messages from their own threads
+            if threading.get_ident() == self.loop_thread:
+                self.ready.set()
+            else:
+                try:
+                    self.loop.call_soon_threadsafe(self.ready.set)
+                except RuntimeError:
+                    pass # loop already closed; close() sends what is left
+        return queued
+
+    async def sender(self):
+        while True:
+            with self.cond:
+                batch = self.next_batch() if self.heap else None
+            if batch is None:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            wait = self.token_delay()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.token_delay()
+            self.send_packet(batch)
+
+    async def query_async(self, command):
+        """query() without blocking the loop. A connected socket only hears from the server."""
+        loop = asyncio.get_running_loop()
+        wait = self.token_delay()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.token_delay()
+        try:
+            transport, reply = await loop.create_datagram_endpoint(RconReply, remote_addr=self.address)
+        except OSError as e:
+            self.failed += 1
+            print(f"RCON Error: {e}")
+            return None
+        try:
+            transport.sendto(self.prefix + command.encode())
+            self.sent += 1
+            hard_deadline = time.monotonic() + self.timeout
+            while reply.error is None:
+                now = time.monotonic()
+                if reply.last_seen is not None and now - reply.last_seen >= self.quiet:
+                    break
+                wake = reply.last_seen + self.quiet if reply.last_seen is not None else hard_deadline
+                if now >= hard_deadline:
+                    break
+                reply.arrived.clear()
+                try:
+                    await asyncio.wait_for(reply.arrived.wait(), min(wake, hard_deadline) - now)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            transport.close()
+        if reply.chunks:
+            return decode_text(b"".join(reply.chunks))
+        self.failed += 1
+        print(f"RCON Error: no reply to '{command.split(' ', 1)[0]}'")
+        return None
+
+    def close(self, timeout=5):
+        # The loop has stopped by now, so whatever is still queued goes out through the
+        # threaded sender, with the same time limit
+        if self.ident is None:
+            self.start()
+        super().close(timeout)
+
+# --- TIMERS ---
+
+class TimerHandle:
+    __slots__ = ("wheel", "due", "func", "args")
+
+    def __init__(self, wheel, due, func, args):
+        self.wheel = wheel
+        self.due = due
+        self.func = func
+        self.args = args
+
+    def cancel(self):
+        """Returns True if the timer was still pending."""
+        return self.wheel.cancel(self)
+
+class TimerWheel(threading.Thread):
+    """Every delayed action in the plugin is timed by this one thread. Timers hash into a ring of
+    slots by the tick they are due on, so scheduling and cancelling are a dict insert and delete,
+    and each tick only looks at one slot. Timers longer than a full turn of the ring wait in
+    their slot until the right lap comes round. Callbacks run on this thread and must be quick;
+    the plugin's callbacks only hand the real work to the server's dispatcher (see call_later)."""
+    def __init__(self, tick=0.1, slots=512):
+        super().__init__(name="timers", daemon=True)
+        self.tick = max(float(tick), 0.001)
+        self.slots = [{} for _ in range(max(int(slots), 1))]
+        self.origin = time.monotonic()
+        self.current = 0 # last tick processed
+        self.cond = threading.Condition()
+        self.closed = False
+        self.live = 0
+        self.fired = 0
+        self.start()
+
+    def __len__(self):
+        return self.live
+
+    def now(self):
+        return int((time.monotonic() - self.origin) / self.tick)
+
+    def schedule(self, delay, func, *args):
+        """Runs func(*args) on the timer thread after `delay` seconds (rounded up to a tick)."""
+        with self.cond:
+            now = self.now()
+            if not self.live:
+                # Nothing pending: skip the idle ticks instead of walking through them
+                self.current = max(self.current, now)
+            handle = TimerHandle(self, now + max(1, math.ceil(delay / self.tick)), func, args)
+            self.slots[handle.due % len(self.slots)][handle] = None
+            self.live += 1
+            if self.live == 1:
+                self.cond.notify()
+        return handle
+
+    def cancel(self, handle):
+        with self.cond:
+            slot = self.slots[handle.due % len(self.slots)]
+            if handle not in slot:
+                return False
+            del slot[handle]
+            self.live -= 1
+            return True
+
+    def close(self):
+        """Stops the thread. Timers that haven't fired yet are dropped."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.live and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    break
+                now = self.now()
+                if now <= self.current:
+                    self.cond.wait(self.origin + (self.current + 1) * self.tick - time.monotonic())
+                    continue
+                due = []
+                # Catch up tick by tick if we fell behind, but never walk the ring more than once
+                for tick in range(max(self.current + 1, now - len(self.slots) + 1), now + 1):
+                    slot = self.slots[tick % len(self.slots)]
+                    ready = [h for h in slot if h.due <= now]
+                    for h in ready:
+                        del slot[h]
+                    due.extend(ready)
+                self.current = now
+                self.live -= len(due)
+            for h in due:
+                self.fired += 1
+                try:
+                    h.func(*h.args)
+                except Exception as e:
+                    print(f"[SYSTEM] Timer {getattr(h.func, '__name__', h.func)} failed: {e}")
+
+# --- METRICS ---
+class Histogram:
+    """Latency histogram with fixed buckets (seconds), cumulative on output like Prometheus.
+    Some are observed from several threads (DBWriter.query_seconds from every caller of query()),
+    so updates and reads go through a lock; uncontended it costs well under a microsecond."""
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels=""):
+        """Prometheus text lines for this histogram; labels like 'event="chat"'."""
+        sep = "," if labels else ""
+        # One consistent snapshot, so the +Inf bucket always equals _count
+        with self.lock:
+            counts, hist_sum, hist_count = list(self.counts), self.sum, self.count
+        total = 0
+        lines = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {total}')
+        tail = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{tail} {hist_sum}")
+        lines.append(f"{name}_count{tail} {hist_count}")
+        return lines
+
+class Metrics:
+    """Hot-path counters for one plugin, rendered in Prometheus text format on demand.
+    Event counts and parse latency are recorded here; everything else (DB, RCON, log lag,
+    players) is read from the component that already counts it when the page is rendered."""
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.lines = {}         # event -> lines handled
+        self.parse_seconds = {} # event -> Histogram
+        self.ignored = 0
+        self.server = None
+        self.stopped = threading.Event()
+
+    def observe(self, event, seconds):
+        hist = self.parse_seconds.get(event)
+        if hist is None:
+            hist = self.parse_seconds[event] = Histogram()
+            self.lines[event] = 0
+        self.lines[event] += 1
+        hist.observe(seconds)
+
+    def render(self):
+        plugin = self.plugin
+        # With several servers in one process the first one renders for all of them,
+        # labelling what each server counts on its own with server="<name>"
+        servers = plugin.servers
+        out = []
+        def family(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(samples)
+        def labels(server, extra=""):
+            return ",".join(l for l in (f'server="{server.name}"' if server.name else "", extra) if l)
+        def sample(name, server, value, extra=""):
+            l = labels(server, extra)
+            return f"{name}{{{l}}} {value}" if l else f"{name} {value}"
+        def each(name, value, among=servers):
+            return [sample(name, s, value(s)) for s in among]
+
+        family("duel_lines_total", "counter", "Log lines handled, by event type.",
+               [sample("duel_lines_total", s, n, f'event="{e}"') for s in servers for e, n in sorted(s.metrics.lines.items())]
+               + [sample("duel_lines_total", s, s.metrics.ignored, 'event="ignored"') for s in servers])
+        family("duel_parse_seconds", "histogram", "Time spent handling one log line, by event type.",
+               [line for s in servers for e, h in sorted(s.metrics.parse_seconds.items())
+                for line in h.samples("duel_parse_seconds", labels(s, f'event="{e}"'))])
+
+        tailing = [s for s in servers if getattr(s, 'tailer', None)]
+        if tailing:
+            family("duel_log_lag_bytes", "gauge", "Bytes written to the log but not read yet.", each("duel_log_lag_bytes", lambda s: s.tailer.lag_bytes, tailing))
+            family("duel_log_lag_bytes_max", "gauge", "Largest log lag seen.", each("duel_log_lag_bytes_max", lambda s: s.tailer.max_lag_bytes, tailing))
+        reading = [s for s in servers if getattr(s, 'reader', None)]
+        if reading:
+            family("duel_line_queue_depth", "gauge", "Lines read but not dispatched yet.", each("duel_line_queue_depth", lambda s: s.reader.queue.qsize(), reading))
+        family("duel_lines_dropped_total", "counter", "Queued lines skipped after a map change.", each("duel_lines_dropped_total", lambda s: s.lines_dropped))
+        family("duel_timers", "gauge", "Delayed actions waiting on the timer wheel.", [f"duel_timers {len(plugin.timers)}"])
+        family("duel_timers_fired_total", "counter", "Delayed actions run.", [f"duel_timers_fired_total {plugin.timers.fired}"])
+
+        db = plugin.db
+        family("duel_db_statements_total", "counter", "SQLite statements run by the writer, including those inside transact jobs.", [f"duel_db_statements_total {db.statements}"])
+        family("duel_db_jobs_total", "counter", "Transact jobs (read-modify-write transactions) run by the writer.", [f"duel_db_jobs_total {db.jobs}"])
+        family("duel_db_commits_total", "counter", "Group commits.", [f"duel_db_commits_total {db.commits}"])
+        family("duel_db_errors_total", "counter", "Failed statements and commits.", [f"duel_db_errors_total {db.errors}"])
+        family("duel_db_busy_total", "counter", "Write transactions retried because another process held the database.", [f"duel_db_busy_total {db.busy}"])
+        family("duel_db_queue_depth", "gauge", "Statements waiting for the writer.", [f"duel_db_queue_depth {db.queue.qsize()}"])
+        family("duel_db_commit_seconds", "histogram", "Time to run and commit one batch.", db.commit_seconds.samples("duel_db_commit_seconds"))
+        family("duel_db_query_seconds", "histogram", "Time a writer query waited for its rows.", db.query_seconds.samples("duel_db_query_seconds"))
+
+        family("duel_rcon_packets_total", "counter", "RCON packets sent.", each("duel_rcon_packets_total", lambda s: s.rcon.packets))
+        family("duel_rcon_commands_total", "counter", "RCON commands sent (several may share a packet).", each("duel_rcon_commands_total", lambda s: s.rcon.sent))
+        family("duel_rcon_failed_total", "counter", "RCON commands that failed to send.", each("duel_rcon_failed_total", lambda s: s.rcon.failed))
+        family("duel_rcon_dropped_total", "counter", "RCON messages dropped because the queue was full.", each("duel_rcon_dropped_total", lambda s: s.rcon.dropped))
+        family("duel_rcon_queue_depth", "gauge", "RCON messages waiting for the rate limit.", each("duel_rcon_queue_depth", lambda s: s.rcon.depth))
+
+        family("duel_players_online", "gauge", "Players in memory.", each("duel_players_online", lambda s: len(s.players)))
+        family("duel_active_duels", "gauge", "Private duels in progress.", each("duel_active_duels", lambda s: len(s.active_duels)))
+        family("duel_rating_conflicts_total", "counter", "Duels rated from database values another process had changed.",
+               each("duel_rating_conflicts_total", lambda s: s.rating_conflicts))
+        return "\n".join(out) + "\n"
+
+    def write(self, path):
+        # Write then rename, so a reader never sees half a file
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serves the metrics on http://host:port/metrics from a daemon thread."""
+        metrics = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass # scrapes would flood the console
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def dump_loop(self, path, interval):
+        def loop():
+            while not self.stopped.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    print(f"[SYSTEM] Could not write metrics to {path}: {e}")
+        threading.Thread(target=loop, name="metrics-dump", daemon=True).start()
+
+    def close(self):
+        self.stopped.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+# --- PROFILING ---
+class SamplingProfiler(threading.Thread):
+    """Samples the stack of every thread for a while and writes where the time went. Unlike
+    cProfile it can be started and stopped from any thread, covers the reader, writer and
+    RCON threads too, and costs a few percent at most, so it is safe to run during a peak."""
+    def __init__(self, duration, interval=0.005, out_dir=".", on_done=None):
+        super().__init__(name="profiler", daemon=True)
+        self.duration = duration
+        self.interval = interval
+        self.out_dir = out_dir
+        self.on_done = on_done
+        self.stopped = threading.Event()
+        self.samples = 0
+        self.idle = {}   # thread -> samples parked in a wait
+        self.busy = {}   # thread -> samples doing something
+        self.own = {}    # function -> samples where it was on top of the stack
+        self.total = {}  # function -> samples where it was anywhere on the stack
+        self.stacks = {} # "thread;outer;...;inner" -> samples (flame graph input)
+
+    # A thread is parked waiting for work when the innermost plugin frame on its stack is one
+    # of its main loops and that loop is blocked in a wait, a queue get or a sleep. The same
+    # wait deeper down (the dispatcher waiting on a DB query) counts as busy: it is latency.
+    IDLE_LOOPS = frozenset(["run", "dispatch", "loop", "wait"])
+    # Loops that do their work in their own frame, unlike wait() which only ever blocks
+    WORK_LOOPS = frozenset(["run", "dispatch"])
+    SOURCE = os.path.basename(__file__)
+
+    @classmethod
+    def is_idle(cls, leaf):
+        frame = leaf
+        while frame is not None and os.path.basename(frame.f_code.co_filename) != cls.SOURCE:
+            frame = frame.f_back
+        if frame is None:
+            return True # library threads (read pool workers, the metrics server) between jobs
+        if frame.f_code.co_name not in cls.IDLE_LOOPS:
+            return False
+        # run() executing its own code is work; run() inside queue.get() is not
+        return frame is not leaf or frame.f_code.co_name not in cls.WORK_LOOPS
+
+    @staticmethod
+    def label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        started = time.time()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            if time.time() - started >= self.duration:
+                break
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                thread = names.get(ident, str(ident))
+                # Threads waiting for work would drown out the ones doing it
+                if self.is_idle(frame):
+                    self.idle[thread] = self.idle.get(thread, 0) + 1
+                    continue
+                self.busy[thread] = self.busy.get(thread, 0) + 1
+                stack = []
+                while frame is not None:
+                    stack.append(self.label(frame.f_code))
+                    frame = frame.f_back
+                self.own[stack[0]] = self.own.get(stack[0], 0) + 1
+                for func in set(stack):
+                    self.total[func] = self.total.get(func, 0) + 1
+                key = ";".join([thread] + stack[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+        self.elapsed = time.time() - started
+        try:
+            path = self.write()
+            summary = self.summary()
+        except OSError as e:
+            path, summary = None, [f"[SYSTEM] Could not write profile: {e}"]
+        if self.on_done:
+            self.on_done(self, path, summary)
+
+    def top(self, counts, limit):
+        return sorted(counts.items(), key=lambda kv: -kv[1])[:limit]
+
+    def summary(self, limit=10):
+        """Console lines: busy share per thread, then the functions most often on top of a stack."""
+        lines = [f"[PROFILE] {self.samples} samples over {self.elapsed:.1f}s"]
+        for thread, count in self.top(self.busy, len(self.busy)):
+            lines.append(f"[PROFILE]   {thread:<16} busy {100.0 * count / max(self.samples, 1):5.1f}%")
+        busy = max(sum(self.own.values()), 1)
+        for func, count in self.top(self.own, limit):
+            lines.append(f"[PROFILE] {100.0 * count / busy:5.1f}% self {100.0 * self.total[func] / busy:5.1f}% total  {func}")
+        return lines
+
+    def write(self):
+        """Writes the full tables to profile-<time>.txt and the stacks to profile-<time>.folded
+        (the input format of flamegraph.pl and speedscope). Returns the .txt path."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+        busy = max(sum(self.own.values()), 1)
+        with open(base + ".txt", "w") as f:
+            f.write(f"{self.samples} samples every {self.interval * 1000:.0f}ms over {self.elapsed:.1f}s\n\n")
+            f.write(f"{'thread':<20} {'busy':>8} {'idle':>8}\n")
+            for thread in sorted(set(self.busy) | set(self.idle)):
+                f.write(f"{thread:<20} {self.busy.get(thread, 0):>8} {self.idle.get(thread, 0):>8}\n")
+            for title, counts in (("self", self.own), ("total", self.total)):
+                f.write(f"\nBy {title} samples (% of busy samples):\n")
+                for func, count in self.top(counts, 50):
+                    f.write(f"{100.0 * count / busy:6.1f}% {count:>8}  {func}\n")
+        with open(base + ".folded", "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return base + ".txt"
+
+class MBIIDuelPlugin:
+    def __init__(self, config_file=None, settings=None, shared=None, name=None):
+        self.config_file = config_file or (sys.argv[1] if len(sys.argv) > 1 else 'duel.cfg')
         self.settings = {}
-        self.players = []
-        self.load_config()
-        self.db_filename = self.settings.get('db_file', 'duel.db')
-        self.init_sqlite()
+        self.players = PlayerRegistry()
+        if settings is not None:
+            # Tools and benchmarks hand their [SETTINGS] in directly instead of writing a duel.cfg
+            self.settings = dict(settings)
+        else:
+            self.load_config()
+        # Name of the [SERVER:name] section when one process runs several servers
+        self.name = name
+        self.shared = shared
+        self.servers = [self]
+
+        if shared is not None:
+            # Another server in the same process: it owns the database side and the timer
+            # wheel, so every server reads and writes through the same connections and caches
+            self.db_filename = shared.db_filename
+            self.db = shared.db
+            self.read_pool = shared.read_pool
+            self.leaderboards = shared.leaderboards
+            self.timers = shared.timers
+            self.async_mode = shared.async_mode
+        else:
+            self.db_filename = self.settings.get('db_file', 'duel.db')
+            self.init_sqlite()
+
+            # Every write goes through one connection and is group-committed every db_commit_ms
+            synchronous = self.settings.get('db_synchronous', 'NORMAL').upper()
+            if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+                synchronous = "NORMAL"
+            self.db = DBWriter(self.db_filename,
+                               commit_interval=float(self.settings.get('db_commit_ms', 5)) / 1000,
+                               synchronous=synchronous,
+                               wait_for_commit=self.settings.get('db_durability', 'batched').lower() == 'commit',
+                               busy_timeout=float(self.settings.get('db_busy_timeout_ms', 20000)) / 1000,
+                               busy_retries=int(self.settings.get('db_busy_retries', 3)))
+            # Make sure queued writes reach the disk on a normal interpreter exit too
+            atexit.register(self.db.close)
+            self.read_pool = ReadPool(self.db_filename, int(self.settings.get('db_read_workers', 2)), writer=self.db)
+            self.leaderboards = {column: Leaderboard(column, size=int(self.settings.get('leaderboard_size', 50)))
+                                 for column in ("duel_rating", "matches_won", "tournament_wins")}
+            # Other processes sharing duel.db change the players table behind the in-memory
+            # leaderboards; PRAGMA data_version on the writer connection moves when they commit
+            self.leaderboard_check = float(self.settings.get('leaderboard_check_seconds', 10))
+            self.leaderboard_checked = time.monotonic()
+            self.data_version = self.db.query_one("PRAGMA data_version")[0]
+            for board in self.leaderboards.values():
+                self.load_leaderboard(board)
+            self.timers = TimerWheel(tick=float(self.settings.get('timer_tick_ms', 100)) / 1000)
+            # core_loop = asyncio runs tailing, RCON and timers as tasks on one event loop
+            self.async_mode = self.settings.get('core_loop', 'threads').lower() == 'asyncio'
+        self.loop = None
+        self.status_sync = None # asyncio mode: the status sync task in flight
+        self.tailer = None
+        self.reader = None
+        self.line_queue = None
+        # Set by shutdown(); background loops of this instance exit on it
+        self.stopping = threading.Event()
+        self.deferred = [] # timers that fired before the loop or dispatcher was up
+        self.deferred_lock = threading.Lock()
+        rcon_class = AsyncRconClient if self.async_mode else RconClient
+        self.rcon = rcon_class(self.settings["ip"], self.settings["port"], self.settings["rcon"],
+                               rate=float(self.settings.get('rcon_rate', 10)),
+                               burst=int(self.settings.get('rcon_burst', 10)),
+                               max_queue=int(self.settings.get('rcon_queue_size', 500)),
+                               quiet=float(self.settings.get('rcon_quiet_ms', 150)) / 1000,
+                               max_packet=int(self.settings.get('rcon_max_packet', 1000)),
+                               separator=self.settings.get('rcon_separator', ';'))
+        self.page_lines = max(1, int(self.settings.get('page_lines', 8)))
+        self.rd_inflation_period = float(self.settings.get('rd_inflation_hours', 24)) * 3600
+        if not self.async_mode:
+            self.rcon.start()
 
         self.lobby_open = False
         self.lobby_players = []
@@ -62,23 +1778,81 @@ class MBIIDuelPlugin:
         self.locked_groups = {}
         self.active_duels = set()
         self.start_time = time.time()
-        self.slot_map = {}
         self.active_matches = {}
         self.last_announcement_time = {}
         self.last_info_sig = ""
         self.last_kill_sig = ""
         self.last_duel_start_sig = ""
         self.last_duel_end_sig = ""
-        self.pending_disbands = {}
-
-        threading.Timer(2.0, self.force_sync_players).start()
+        self.pending_disbands = {} # guid -> expiry timer
+        self.lobby_timer = None
+        self.resync_timer = None
+        self.lines_dispatched = 0
+        self.lines_dropped = 0
+        self.max_dispatch_delay = 0.0
+        # Duels whose ratings another process had changed since we loaded the players
+        self.rating_conflicts = 0
+        self.metrics = Metrics(self)
+        self.profiler = None
+        self.event_handlers = {
+            "init": self.handle_init_game,
+            "userinfo": self.handle_userinfo,
+            "guid": self.handle_guid,
+            "duel_start": self.handle_duel_start,
+            "duel_end": self.handle_duel_end,
+            "disconnect": self.handle_disconnect,
+            "smod": self.handle_smod_line,
+            "chat": self.handle_chat_line,
+        }
+
+        self.call_later(2.0, self.force_sync_players)
 
         
         # Load any existing progress from previous map/round
         self.restore_match_progress()
 
+    def call_later(self, delay, func, *args):
+        """Runs func(*args) after `delay` seconds and returns a handle with cancel(). Timers wait on
+        the timer wheel, which only passes them on: the call itself runs where this server's log
+        lines are handled, so it never races a handler over self.players."""
+        return self.timers.schedule(delay, self.call_soon, func, *args)
+
+    def call_soon(self, func, *args):
+        """Hands work from another thread to the event loop (asyncio mode) or the dispatcher."""
+        with self.deferred_lock:
+            if self.loop is None and self.line_queue is None:
+                self.deferred.append((func, args))
+                return
+        if self.loop is None:
+            # Queued between log lines; waits if the dispatcher is a full queue behind
+            self.line_queue.put((None, time.time(), (func, args)))
+            return
+        try:
+            self.loop.call_soon_threadsafe(func, *args)
+        except RuntimeError:
+            pass # loop closed, shutting down
+
     def force_sync_players(self):
-        status_data = self.send_rcon("status") 
+        if self.loop is not None:
+            # The status reply is awaited in its own task while parsing carries on
+            self.pending_sync()
+            return
+        self.apply_status(self.query_rcon("status"))
+
+    def pending_sync(self):
+        """The status sync in flight, or a new one if there is none. A burst of chat from unknown
+        players shares one status query instead of starting a task each."""
+        if self.status_sync is None or self.status_sync.done():
+            self.status_sync = self.loop.create_task(self.sync_players_async())
+        return self.status_sync
+
+    async def sync_players_async(self):
+        try:
+            self.apply_status(await self.rcon.query_async("status"))
+        except Exception as e:
+            print(f"[SYSTEM] Status sync failed: {e}")
+
+    def apply_status(self, status_data):
         if not status_data:
             return
 
@@ -98,12 +1872,9 @@ class MBIIDuelPlugin:
                 
                 p = self.sync_player(slot_id, raw_name, "0")
                 if p:
-                    self.slot_map[slot_id] = p
-                    if p not in self.players:
-                        self.players.append(p)
                     found_count += 1
         
-        print(f"[SYSTEM] Sync complete. Memory: {len(self.players)} (Found {found_count} in status)")
+        print(f"[SYSTEM] {self.label}Sync complete. Memory: {len(self.players)} (Found {found_count} in status)")
 
     def start_status_loop(self):
         def loop():
@@ -114,6 +1885,117 @@ class MBIIDuelPlugin:
                 
         threading.Thread(target=loop, daemon=True).start()    
 
+    def start_profiler(self, seconds=None, notify=None):
+        """Starts the sampling profiler for `seconds` (profile_seconds by default). Returns the
+        duration, or None if a profile is already running."""
+        if self.profiler and self.profiler.is_alive():
+            return None
+        seconds = min(seconds or float(self.settings.get('profile_seconds', 30)), 3600)
+        def done(profiler, path, summary):
+            for line in summary:
+                print(line)
+            if path:
+                print(f"[SYSTEM] Profile written to {path}")
+            if notify:
+                notify(path)
+        self.profiler = SamplingProfiler(seconds,
+                                         interval=float(self.settings.get('profile_interval_ms', 5)) / 1000,
+                                         out_dir=self.settings.get('profile_dir', '.'),
+                                         on_done=done)
+        self.profiler.start()
+        print(f"[SYSTEM] Profiling all threads for {seconds:.0f}s...")
+        return seconds
+
+    def stop_profiler(self):
+        if self.profiler and self.profiler.is_alive():
+            self.profiler.stop()
+            return True
+        return False
+
+    def install_profile_signal(self):
+        # kill -USR1 <pid> starts a profile, a second one stops it early (no SIGUSR1 on Windows)
+        if not hasattr(signal, "SIGUSR1"):
+            return
+        def toggle():
+            if not self.stop_profiler():
+                self.start_profiler()
+        # Hand off to a thread: the handler interrupts the dispatcher wherever it happens to be
+        handler = lambda signum, frame: threading.Thread(target=toggle, daemon=True).start()
+        try:
+            signal.signal(signal.SIGUSR1, handler)
+        except ValueError:
+            pass # not the main thread
+
+    def start_metrics(self):
+        port = int(self.settings.get('metrics_port', 0))
+        if port:
+            host = self.settings.get('metrics_host', '127.0.0.1')
+            try:
+                self.metrics.serve(port, host)
+                print(f"[SYSTEM] Metrics on http://{host}:{port}/metrics")
+            except OSError as e:
+                print(f"[SYSTEM] Metrics endpoint disabled, could not listen on {host}:{port}: {e}")
+        path = self.settings.get('metrics_file')
+        if path:
+            self.metrics.dump_loop(path, max(1.0, float(self.settings.get('metrics_interval', 60))))
+
+    def start_rd_inflation_loop(self):
+        period = self.rd_inflation_period
+        if period <= 0:
+            return
+        def loop():
+            while not self.stopping.is_set():
+                try:
+                    self.inflate_rd()
+                except Exception as e:
+                    print(f"[DB ERROR] RD inflation failed: {e}")
+                self.stopping.wait(min(period, 600))
+
+        threading.Thread(target=loop, name="rd-inflation", daemon=True).start()
+
+    def inflate_rd(self, now=None):
+        """Grows the RD of everyone who has not dueled for a whole rating period, once for each
+        period since the last run that they sat out. Returns the number of periods covered."""
+        period = self.rd_inflation_period
+        now = time.time() if now is None else now
+
+        # Bookmark read and moved in one transaction, so two processes sharing duel.db can't
+        # both apply the same periods
+        def inflate(conn):
+            row = conn.execute("SELECT value FROM meta WHERE key='rd_inflated_at'").fetchone()
+            if not row:
+                # First run: start counting from now rather than inflating for all of history
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rd_inflated_at', ?)", (now,))
+                return 0
+            periods = int((now - row[0]) // period)
+            if periods < 1:
+                return 0
+
+            # Carry the part of a period that has not passed yet over to the next run
+            until = row[0] + periods * period
+            conn.execute(RD_INFLATION_SQL, {"periods": periods, "period": period, "until": until})
+            conn.execute("UPDATE meta SET value=? WHERE key='rd_inflated_at'", (until,))
+            return periods
+
+        periods = self.db.transact(inflate)
+        if not periods:
+            return 0
+
+        # Online players keep their RD in memory and would write the old value back on their next duel
+        online = {}
+        for server in self.servers:
+            for p in server.players:
+                if p.db_guid:
+                    online.setdefault(p.db_guid, []).append(p)
+        if online:
+            marks = ",".join("?" * len(online))
+            for guid, rd in self.db.query(f"SELECT guid, rating_deviation FROM players WHERE guid IN ({marks})", list(online)):
+                if rd is not None:
+                    for p in online[guid]:
+                        p.rd = rd
+        print(f"[SYSTEM] Inflated RD of inactive players by {periods} rating period(s).")
+        return periods
+
     def parse_status_line(self, line):
         # Example line: "0 12345 Valzhar 0 139.216.5.109:29070"
         # Logic depends on your specific game engine (e.g., Quake 3 / IW / Source)
@@ -130,7 +2012,7 @@ class MBIIDuelPlugin:
             pass 
 
     def update_player_slot(self, slot_id, name):
-        clean_name = normalize(name).lower().replace('[', '').replace(']', '').strip()
+        clean_name = name_key(name)
         
         # Calculate the actual ID (0-31)
         try:
@@ -140,11 +2022,10 @@ class MBIIDuelPlugin:
             return -1
 
         # Find the player in your list
-        player_obj = next((p for p in self.players if p.clean_name == clean_name), None)
+        player_obj = self.players.by_name(clean_name)
         
         if player_obj:
-            player_obj.id = actual_id
-            self.slot_map[actual_id] = player_obj # SAVE TO SWITCHBOARD
+            self.players.set_slot(player_obj, actual_id) # SAVE TO SWITCHBOARD
             return actual_id
             
         return actual_id
@@ -187,6 +2068,32 @@ class MBIIDuelPlugin:
             
             # 4. Index clean_name for instant lookups
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_clean_name ON players(clean_name)')
+
+            # Trigrams of every clean_name, for partial-name search of offline players
+            cursor.execute('''CREATE TABLE IF NOT EXISTS name_trigrams (
+                    gram TEXT,
+                    guid TEXT,
+                    PRIMARY KEY (gram, guid)) WITHOUT ROWID''')
+
+            # Append-only ledger of every rated duel, so ratings can be audited or recomputed later
+            cursor.execute('''CREATE TABLE IF NOT EXISTS duel_results (
+                    id INTEGER PRIMARY KEY,
+                    ts REAL,
+                    winner_guid TEXT,
+                    loser_guid TEXT,
+                    formal INTEGER DEFAULT 0,
+                    tournament INTEGER DEFAULT 0,
+                    winner_rating_before REAL,
+                    winner_rating_after REAL,
+                    winner_rd_before REAL,
+                    winner_rd_after REAL,
+                    loser_rating_before REAL,
+                    loser_rating_after REAL,
+                    loser_rd_before REAL,
+                    loser_rd_after REAL)''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_winner ON duel_results(winner_guid, ts)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_loser ON duel_results(loser_guid, ts)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_ts ON duel_results(ts)')
             conn.commit()
 
         # 5. MIGRATION BLOCK: Ensure all specific columns exist in old databases
@@ -196,6 +2103,8 @@ class MBIIDuelPlugin:
                 ("total_rounds_lost", "INTEGER DEFAULT 0"),
                 ("tournament_wins", "INTEGER DEFAULT 0"),
                 ("matches_won", "INTEGER DEFAULT 0"),
+                ("volatility", "REAL DEFAULT 0.06"),
+                ("last_active", "REAL"),
                 ("clan_tag", "TEXT DEFAULT 'NONE'"),
                 ("clan_role", "TEXT DEFAULT 'MEMBER'"),
                 ("clan_group", "TEXT DEFAULT 'DEFAULT'")
@@ -206,8 +2115,53 @@ class MBIIDuelPlugin:
                     conn.commit()
                 except sqlite3.OperationalError:
                     pass # Column already exists
+            # Nothing reads it (RD inflation scans the table) and every rated duel paid to update it
+            conn.execute('DROP INDEX IF EXISTS idx_players_last_active')
+            # Small key/value store for plugin bookkeeping (last RD inflation run)
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+            conn.commit()
                     
-        # 6. DATA CLEANUP: Remove duplicate 1500 entries
+        # 6. CLANS: per-clan and per-group aggregates, kept current by triggers on players
+        with sqlite3.connect(self.db_filename) as conn:
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_players_clan ON players(clan_tag, clan_group)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS clans (
+                    clan_tag TEXT PRIMARY KEY,
+                    member_count INTEGER DEFAULT 0,
+                    rated_members INTEGER DEFAULT 0,
+                    rating_sum REAL DEFAULT 0,
+                    owners INTEGER DEFAULT 0)''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS clan_groups (
+                    clan_tag TEXT,
+                    group_name TEXT,
+                    member_count INTEGER DEFAULT 0,
+                    PRIMARY KEY (clan_tag, group_name)) WITHOUT ROWID''')
+            for name, event, row, sign in (("clans_insert", "INSERT", "NEW", "+"),
+                                           ("clans_delete", "DELETE", "OLD", "-"),
+                                           ("clans_update_old", CLAN_UPDATE_EVENT, "OLD", "-"),
+                                           ("clans_update_new", CLAN_UPDATE_EVENT, "NEW", "+")):
+                conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON players
+                                 WHEN {row}.clan_tag IS NOT NULL AND {row}.clan_tag NOT IN ('NONE', '')
+                                 BEGIN {clan_delta_sql(row, sign)} END""")
+
+            # Fill the aggregates once for databases from before these tables existed
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                conn.execute("DELETE FROM clans")
+                conn.execute("DELETE FROM clan_groups")
+                conn.execute("""INSERT INTO clans (clan_tag, member_count, rated_members, rating_sum, owners)
+                                SELECT clan_tag, COUNT(*),
+                                       SUM(CASE WHEN name != 'Unknown' AND duel_rating IS NOT NULL THEN 1 ELSE 0 END),
+                                       SUM(CASE WHEN name != 'Unknown' THEN IFNULL(duel_rating, 0) ELSE 0 END),
+                                       SUM(CASE WHEN clan_role = 'OWNER' THEN 1 ELSE 0 END)
+                                FROM players WHERE clan_tag IS NOT NULL AND clan_tag NOT IN ('NONE', '')
+                                GROUP BY clan_tag""")
+                conn.execute("""INSERT INTO clan_groups (clan_tag, group_name, member_count)
+                                SELECT clan_tag, IFNULL(clan_group, 'DEFAULT'), COUNT(*)
+                                FROM players WHERE clan_tag IS NOT NULL AND clan_tag NOT IN ('NONE', '')
+                                GROUP BY 1, 2""")
+                conn.execute("PRAGMA user_version = 1")
+            conn.commit()
+
+        # 7. DATA CLEANUP: Remove duplicate 1500 entries
         with sqlite3.connect(self.db_filename) as conn:
             conn.execute("""
                 DELETE FROM players 
@@ -217,9 +2171,31 @@ class MBIIDuelPlugin:
                 )
             """)
             conn.commit()
+
+        # 8. NAME KEYS: re-key rows stored by an older version of name_key, once per database
+        # (raise the version here whenever name_key changes)
+        with sqlite3.connect(self.db_filename) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 2:
+                rows = conn.execute("SELECT guid, name, clean_name FROM players WHERE name IS NOT NULL").fetchall()
+                changed = [(name_key(name), guid) for guid, name, clean in rows if name_key(name) != clean]
+                if changed:
+                    conn.executemany("UPDATE players SET clean_name=? WHERE guid=?", changed)
+                    # Their trigrams are rebuilt below
+                    conn.executemany("DELETE FROM name_trigrams WHERE guid=?", [(guid,) for _, guid in changed])
+                    print(f"[SYSTEM] Updated name keys for {len(changed)} players.")
+                conn.execute("PRAGMA user_version = 2")
+                conn.commit()
+
+        # 9. SEARCH INDEX: backfill trigrams for players added before the index existed
+        with sqlite3.connect(self.db_filename) as conn:
+            conn.execute("DELETE FROM name_trigrams WHERE guid NOT IN (SELECT guid FROM players)")
+            missing = conn.execute("SELECT guid, clean_name FROM players WHERE guid NOT IN (SELECT guid FROM name_trigrams)").fetchall()
+            conn.executemany("INSERT OR IGNORE INTO name_trigrams (gram, guid) VALUES (?, ?)",
+                             [(g, guid) for guid, clean in missing for g in trigrams(clean or "")])
+            conn.commit()
             print("[SYSTEM] Database initialized and optimized.")
 
-        # 7. LOAD CLAN LOCKS INTO MEMORY
+        # 10. LOAD CLAN LOCKS INTO MEMORY
         # This populates your self.locked_groups dict so the join logic works immediately
         self.locked_groups = {}
         with sqlite3.connect(self.db_filename) as conn:
@@ -230,6 +2206,29 @@ class MBIIDuelPlugin:
                     self.locked_groups[tag] = []
                 self.locked_groups[tag].append(grp)            
 
+    def shutdown(self):
+        """Sends queued RCON messages and flushes queued database writes. Called on manual shutdown and before a crash restart,
+        so it also stops every thread and descriptor this instance started."""
+        self.stopping.set()
+        self.close_log()
+        if self.shared is not None:
+            # The server that owns the database side closes it
+            self.rcon.close()
+            return
+        self.timers.close()
+        self.read_pool.close()
+        self.rcon.close()
+        self.db.close()
+        # Closed already; a crash restart would otherwise pile up one exit handler per instance
+        atexit.unregister(self.db.close)
+        # Frees the metrics port for the instance a crash restart brings up
+        self.metrics.close()
+        if self.settings.get('metrics_file'):
+            try:
+                self.metrics.write(self.settings['metrics_file'])
+            except OSError:
+                pass
+
     def load_config(self):
         config = configparser.ConfigParser()
         config.read(self.config_file)
@@ -237,11 +2236,10 @@ class MBIIDuelPlugin:
 
     def save_match_progress(self, p1, p2):
         """Saves current scores to DB to survive MB2's 15-minute round limit."""
-        with sqlite3.connect(self.db_filename) as conn:
-            conn.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
-                         (p1.guid, p2.guid, p2.guid, p1.guid))
-            conn.execute("INSERT INTO active_matches (p1_guid, p2_guid, p1_score, p2_score, win_limit, is_cvc) VALUES (?, ?, ?, ?, ?, ?)",
-                         (p1.guid, p2.guid, p1.match_score, p2.match_score, self.win_limit, int(self.is_cvc)))
+        self.db.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
+                        (p1.guid, p2.guid, p2.guid, p1.guid))
+        self.db.execute("INSERT INTO active_matches (p1_guid, p2_guid, p1_score, p2_score, win_limit, is_cvc) VALUES (?, ?, ?, ?, ?, ?)",
+                        (p1.guid, p2.guid, p1.match_score, p2.match_score, self.win_limit, int(self.is_cvc)))
 
     def restore_match_progress(self):
         """Called at startup to see if we were in the middle of a match."""
@@ -259,11 +2257,11 @@ class MBIIDuelPlugin:
                 
                 # Clean up player objects
                 player.opponent = None
-                opp_player = next((x for x in self.players if x.clean_name == opp_name), None)
+                opp_player = self.players.by_name(opp_name)
                 if opp_player:
                     opp_player.opponent = None
                 
-                self.send_rcon(f"say ^7[DUEL] ^1Duel Cancelled: ^7{player.name} went to Spectator.")
+                self.send_rcon(f"say ^7[DUEL] ^1Duel Cancelled: ^7{player.name} went to Spectator.", PRIORITY_MATCH)
                 print(f"[SYSTEM] Duel reset: {player.clean_name} went to spec.")
                 
     def handle_player_exit(self, p, reason="left"):
@@ -272,7 +2270,7 @@ class MBIIDuelPlugin:
 
         if p.opponent:
             opp = p.opponent
-            self.send_rcon(f'say "^5[DUEL] ^2{opp.name} ^7wins! ^2{p.name} ^7{reason}."')
+            self.send_rcon(f'say "^5[DUEL] ^2{opp.name} ^7wins! ^2{p.name} ^7{reason}."', PRIORITY_MATCH)
             
             # Full state reset for both players
             opp.opponent = None
@@ -283,40 +2281,35 @@ class MBIIDuelPlugin:
         print(f"[SYSTEM] Cleaned up duel state for {p.clean_name} ({reason})")                
 
     def calculate_glicko2(self, winner, loser):
+        """Rates a finished duel and appends it to the duel_results ledger in one transaction.
+        The update starts from the ratings in the database rather than our copies, so a duel
+        another process sharing duel.db rated in the meantime is built on, not overwritten."""
         try:
-            # Glicko-2 Constants
-            def g(rd): return 1 / math.sqrt(1 + 3 * (rd**2) / (math.pi**2))
-            def E(r1, r2, rd2): return 1 / (1 + math.exp(-g(rd2) * (r1 - r2) / 173.7178))
-            
-            r1, rd1 = (winner.rating - 1500) / 173.7178, winner.rd / 173.7178
-            r2, rd2 = (loser.rating - 1500) / 173.7178, loser.rd / 173.7178
-            
-            v1 = 1 / (g(rd2)**2 * E(r1, r2, rd2) * (1 - E(r1, r2, rd2)))
-            new_rd1 = 1 / math.sqrt(1 / rd1**2 + 1 / v1)
-            new_r1 = r1 + new_rd1**2 * (g(rd2) * (1 - E(r1, r2, rd2)))
-            
-            v2 = 1 / (g(rd1)**2 * E(r2, r1, rd1) * (1 - E(r2, r1, rd1)))
-            new_rd2 = 1 / math.sqrt(1 / rd2**2 + 1 / v2)
-            new_r2 = r2 + new_rd2**2 * (g(rd1) * (0 - E(r2, r1, rd1)))
-
-            winner.rating, winner.rd = 1500 + 173.7178 * new_r1, max(30, 173.7178 * new_rd1)
-            loser.rating, loser.rd = 1500 + 173.7178 * new_r2, max(30, 173.7178 * new_rd2)
-
-            with sqlite3.connect(self.db_filename) as conn:
-                # Winner Save
-                w_valid = winner.guid and winner.guid != "0" and len(winner.guid) > 10
-                conn.execute(f"UPDATE players SET duel_rating=?, rating_deviation=? WHERE {'guid' if w_valid else 'clean_name'}=?", 
-                             (winner.rating, winner.rd, winner.guid if w_valid else winner.clean_name))
-                
-                # Loser Save
-                l_valid = loser.guid and loser.guid != "0" and len(loser.guid) > 10
-                conn.execute(f"UPDATE players SET duel_rating=?, rating_deviation=? WHERE {'guid' if l_valid else 'clean_name'}=?", 
-                             (loser.rating, loser.rd, loser.guid if l_valid else loser.clean_name))
-                conn.commit()
+            def key(p):
+                valid = p.guid and p.guid != "0" and len(p.guid) > 10
+                return ('guid', p.guid) if valid else ('clean_name', p.clean_name)
+
+            memory = (winner.rating, winner.rd, loser.rating, loser.rd)
+            before, after = self.db.transact(rate_duel, key(winner), key(loser), memory, self.ledger_row(winner, loser))
+            if before != memory:
+                self.rating_conflicts += 1
+            winner.rating, winner.rd, loser.rating, loser.rd = after
+
+            self.update_leaderboard(winner, "duel_rating", winner.rating)
+            self.update_leaderboard(loser, "duel_rating", loser.rating)
 
         except Exception as e:
             print(f"[DB ERROR] Glicko Update Failed: {e}")
 
+    def ledger_row(self, winner, loser):
+        """(winner_guid, loser_guid, formal, tournament) for the duel's duel_results row."""
+        def ledger_guid(p):
+            # The players row the rating update writes to
+            return p.guid if PlayerRegistry.valid_guid(p.guid) else (p.db_guid or f"TEMP_{p.clean_name}")
+        formal = getattr(winner, 'is_formal_match', False) or getattr(loser, 'is_formal_match', False)
+        tournament = self.active_tournament and winner.opponent is loser
+        return ledger_guid(winner), ledger_guid(loser), int(formal), int(tournament)
+
     def handle_smod_command(self, raw_admin_name, admin_id, full_message):
         """Processes SMOD commands and translates SMOD ID 1-32 to Game Slot 0-31."""
         try:
@@ -331,14 +2324,13 @@ class MBIIDuelPlugin:
             command = msg_parts[0].lower().lstrip("!")
             
             # Clean name for matching and display
-            admin_display = normalize(raw_admin_name)
-            admin_pure = admin_display.lower().replace('[', '').replace(']', '').strip()
+            admin_display = name_key(raw_admin_name)
 
             # 2. HELP / FEEDBACK COMMANDS
             if command in ["dhelp", "help"]:
                 # This will now send 'svtell 0' if SMOD reported ID 1
-                self.send_rcon(f'svtell {active_slot} "^5[ADMIN] ^7Commands: !clan, !group, !promote, !resetplayer, !cstart, !tstart, !tpause, !tresume"')
-                # print(f"[DEBUG] Admin: {admin_pure} | SMOD ID: {admin_id} -> Mapped to Game Slot: {active_slot}")
+                self.send_rcon(f'svtell {active_slot} "^5[ADMIN] ^7Commands: !clan, !group, !promote, !resetplayer, !cstart, !tstart, !tpause, !tresume, !profile [seconds|stop]"', PRIORITY_INFO)
+                # print(f"[DEBUG] Admin: {admin_display} | SMOD ID: {admin_id} -> Mapped to Game Slot: {active_slot}")
                 return
 
             # 3. LOBBY CONTROLS
@@ -362,38 +2354,46 @@ class MBIIDuelPlugin:
 
                         # --- ADMIN CLAN LOOKUP ---
             if command == "clanlist":
-                with sqlite3.connect(self.db_filename) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT DISTINCT clan_tag FROM players WHERE clan_tag != 'NONE'")
-                    clans = cursor.fetchall()
-                    
+                clans = self.db.query("SELECT clan_tag FROM clans ORDER BY clan_tag")
+
                 if not clans:
-                    self.send_rcon(f'svtell {active_slot} "^1No clans found in database."')
+                    self.send_rcon(f'svtell {active_slot} "^1No clans found in database."', PRIORITY_INFO)
                 else:
-                    self.send_rcon(f'svtell {active_slot} "^5--- ALL REGISTERED CLANS ---"')
-                    for i, (tag,) in enumerate(clans, 1):
-                        self.send_rcon(f'svtell {active_slot} "^7{i}. ^3{tag}"')
+                    page = int(msg_parts[1]) if len(msg_parts) > 1 and msg_parts[1].isdigit() else 1
+                    lines = [f"^7{i}. ^3{tag}" for i, (tag,) in enumerate(clans, 1)]
+                    self.send_paged(active_slot, "ALL REGISTERED CLANS", lines, page, "!clanlist")
                 return  
 
+            # --- PROFILER ---
+            if command == "profile":
+                arg = msg_parts[1].lower() if len(msg_parts) > 1 else ""
+                if arg == "stop":
+                    if not self.stop_profiler():
+                        self.send_rcon(f'svtell {active_slot} "^5[ADMIN] ^7The profiler is not running."', PRIORITY_INFO)
+                    return
+                seconds = float(arg) if arg.replace('.', '', 1).isdigit() else None
+                started = self.start_profiler(seconds, lambda path: self.send_rcon(
+                    f'svtell {active_slot} "^5[ADMIN] ^7Profile written to ^3{os.path.basename(path) if path else "nothing (see console)"}"', PRIORITY_INFO))
+                if started:
+                    self.send_rcon(f'svtell {active_slot} "^5[ADMIN] ^7Profiling for ^3{started:.0f}s^7. ^2!profile stop ^7ends it early."', PRIORITY_INFO)
+                else:
+                    self.send_rcon(f'svtell {active_slot} "^5[ADMIN] ^7The profiler is already running."', PRIORITY_INFO)
+                return
+
             # --- ADMIN CLAN DELETE ---
             elif command == "clandelete" and len(msg_parts) >= 2:
                 target_tag = msg_parts[1].upper()
                 
-                with sqlite3.connect(self.db_filename) as conn:
-                    cursor = conn.cursor()
-                    
-                    # 1. Check if the clan actually exists in the database
-                    cursor.execute("SELECT COUNT(*) FROM players WHERE clan_tag = ? AND clan_tag != 'NONE'", (target_tag,))
-                    exists = cursor.fetchone()[0]
-                    
-                    if exists == 0:
-                        # Clan does not exist
-                        self.send_rcon(f'svtell {active_slot} "^1Error: ^7Clan ^3{target_tag} ^7does not exist in the database."')
-                        return # Exit early
+                # 1. Check if the clan actually exists in the database
+                exists = self.db.query_one("SELECT member_count FROM clans WHERE clan_tag = ?", (target_tag,))
 
-                    # 2. If it exists, proceed with the deletion
-                    conn.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE clan_tag=?", (target_tag,))
-                    conn.commit()
+                if not exists:
+                    # Clan does not exist
+                    self.send_rcon(f'svtell {active_slot} "^1Error: ^7Clan ^3{target_tag} ^7does not exist in the database."')
+                    return # Exit early
+
+                # 2. If it exists, proceed with the deletion
+                self.db.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE clan_tag=?", (target_tag,))
                 
                 # 3. Update live memory for any players currently online
                 for p_obj in self.players:
@@ -410,15 +2410,8 @@ class MBIIDuelPlugin:
             target_search = msg_parts[1].lower()
             target_p = None
             
-            # Search the known players list for the target
-            for x in self.players:
-                try:
-                    p_name_clean = normalize(x.name).lower().replace('[', '').replace(']', '').strip()
-                    if target_search in p_name_clean:
-                        target_p = x
-                        break
-                except:
-                    continue
+            # Search the known players list for the target (best match, not just the first)
+            target_p = self.players.find(name_key(target_search))
             
             if not target_p:
                 self.send_rcon(f'svtell {active_slot} "^1Error: ^7Player \'{target_search}\' not found."')
@@ -430,25 +2423,22 @@ class MBIIDuelPlugin:
             if command == "clan" and len(msg_parts) >= 3:
                 new_tag = msg_parts[2].upper()
                 target_p.clan_tag = new_tag
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_tag=? WHERE guid=?", (new_tag, target_p.guid))
+                self.db.execute("UPDATE players SET clan_tag=? WHERE guid=?", (new_tag, target_p.guid))
                 action_text = f"^7set ^5{target_p.name}^7 clan to: ^5{new_tag}"
 
             elif command == "group" and len(msg_parts) >= 3:
                 new_group = msg_parts[2].upper()
                 target_p.clan_group = new_group
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_group=? WHERE guid=?", (new_group, target_p.guid))
+                self.db.execute("UPDATE players SET clan_group=? WHERE guid=?", (new_group, target_p.guid))
                 action_text = f"^7assigned ^5{target_p.name} ^7to group: ^5{new_group}"
 
             elif command == "promote":
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_role='OWNER' WHERE guid=?", (target_p.guid,))
+                self.db.execute("UPDATE players SET clan_role='OWNER' WHERE guid=?", (target_p.guid,))
                 action_text = f"^7promoted ^5{target_p.name} ^7to ^5OWNER"
 
             elif command == "resetplayer":
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET duel_rating=1500, rating_deviation=350 WHERE guid=?", (target_p.guid,))
+                self.db.execute("UPDATE players SET duel_rating=1500, rating_deviation=350 WHERE guid=?", (target_p.guid,))
+                self.update_leaderboard(target_p, "duel_rating", 1500)
                 action_text = f"^7reset stats for ^5{target_p.name}"  
 
             # 6. BROADCAST SUCCESS
@@ -473,13 +2463,14 @@ class MBIIDuelPlugin:
             self.send_rcon(f'say "^5[DUEL] ^2{p.name} ^7is ready to resume!"')
         
         if cmd[0] == "!dhelp":
-            self.send_rcon(f'svtell {p.id} "^5Stats: ^7!rank [name], !dtop, !fttop, !ttop, !dclantop"')
-            self.send_rcon(f'svtell {p.id} "^5Duel: ^7!dduel <name> <rounds>, !dyes, !dno, !dforfeit, !dpause, !dresume"')
-            # Added "ownership" to the Clan line
-            self.send_rcon(f'svtell {p.id} "^5Clan: ^7!dclantag register <tag>, !dclan show, !dclan ownership, !dclan quit"')
+            help_lines = [f'svtell {p.id} "^5Stats: ^7!rank [name], !dtop, !fttop, !ttop, !dclantop"',
+                          f'svtell {p.id} "^5Duel: ^7!dduel <name> <rounds>, !dyes, !dno, !dforfeit, !dpause, !dresume"',
+                          # Added "ownership" to the Clan line
+                          f'svtell {p.id} "^5Clan: ^7!dclantag register <tag>, !dclan show [page], !dclan ownership, !dclan quit"']
             
             if p.role != "MEMBER":
-                self.send_rcon(f'svtell {p.id} "^3Staff: ^7!tstart, !dclan promote/kick/rename/lock, !dclandisband"')
+                help_lines.append(f'svtell {p.id} "^3Staff: ^7!tstart, !dclan promote/kick/rename/lock, !dclandisband"')
+            self.send_rcon_many(help_lines, PRIORITY_INFO)
 
         if cmd[0] == "!dclantag":
             if len(cmd) < 3:
@@ -496,30 +2487,26 @@ class MBIIDuelPlugin:
                     return
 
                 # 2. Check if the clan tag they want to join already exists
-                with sqlite3.connect(self.db_filename) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT name FROM players WHERE clan_tag=? AND clan_role='OWNER' LIMIT 1", (new_tag,))
-                    owner_data = cursor.fetchone()
-
-                    if owner_data:
-                        # Clan exists - Join as a MEMBER
-                        role = "MEMBER"
-                        msg = f"^5[CLAN] ^7Joined existing clan ^3{new_tag} ^7as ^5MEMBER."
-                    else:
-                        # Clan is brand new - Join as OWNER
-                        role = "OWNER"
-                        msg = f"^5[CLAN] ^7Clan ^3{new_tag} ^7created. You are the ^5OWNER."
+                owner_data = self.db.query_one("SELECT owners FROM clans WHERE clan_tag=?", (new_tag,))
 
-                    # 3. Save to Database and update live Player object
-                    conn.execute("UPDATE players SET clan_tag=?, clan_role=?, clan_group='DEFAULT' WHERE guid=?", 
-                                 (new_tag, role, p.guid))
-                    conn.commit()
-                    
-                    p.clan_tag = new_tag
-                    p.role = role
-                    p.clan_group = "DEFAULT"
-                    
-                    self.send_rcon(f'svtell {p.id} "{msg}"')
+                if owner_data and owner_data[0] > 0:
+                    # Clan exists - Join as a MEMBER
+                    role = "MEMBER"
+                    msg = f"^5[CLAN] ^7Joined existing clan ^3{new_tag} ^7as ^5MEMBER."
+                else:
+                    # Clan is brand new - Join as OWNER
+                    role = "OWNER"
+                    msg = f"^5[CLAN] ^7Clan ^3{new_tag} ^7created. You are the ^5OWNER."
+
+                # 3. Save to Database and update live Player object
+                self.db.execute("UPDATE players SET clan_tag=?, clan_role=?, clan_group='DEFAULT' WHERE guid=?", 
+                                (new_tag, role, p.guid))
+
+                p.clan_tag = new_tag
+                p.role = role
+                p.clan_group = "DEFAULT"
+
+                self.send_rcon(f'svtell {p.id} "{msg}"')
 
         if cmd[0] == "!dclandisband":
             if p.clan_tag == "NONE" or p.role != "OWNER":
@@ -530,26 +2517,25 @@ class MBIIDuelPlugin:
             if p.guid in self.pending_disbands:
                 # 2nd Time: Execute the disband
                 target_tag = p.clan_tag
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE clan_tag=?", (target_tag,))
-                    conn.commit()
+                self.db.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE clan_tag=?", (target_tag,))
 
                 # Update memory for everyone in the clan
                 for member in self.players:
                     if member.clan_tag == target_tag:
                         member.clan_tag, member.role, member.clan_group = "NONE", "MEMBER", "DEFAULT"
 
-                del self.pending_disbands[p.guid]
+                timer = self.pending_disbands.pop(p.guid, None)
+                if timer:
+                    timer.cancel()
                 self.send_rcon(f'say "^5[CLAN] ^3{target_tag} ^7has been officially disbanded by ^5{p.name}^7."')
             
             else:
                 # 1st Time: Ask for confirmation
-                self.pending_disbands[p.guid] = time.time()
                 self.send_rcon(f'svtell {p.id} "^1WARNING: ^7This will remove ALL members from ^3{p.clan_tag}^7."')
                 self.send_rcon(f'svtell {p.id} "^7Type ^2!dclandisband ^7again within 10 seconds to confirm."')
                 
-                # Optional: Simple timer to clear the pending status
-                threading.Timer(10, lambda: self.pending_disbands.pop(p.guid, None)).start()            
+                # Simple timer to clear the pending status
+                self.pending_disbands[p.guid] = self.call_later(10, self.pending_disbands.pop, p.guid, None)            
 
         if cmd[0] == "!dclan" and len(cmd) >= 2:
             sub = cmd[1]
@@ -557,17 +2543,13 @@ class MBIIDuelPlugin:
                 if p.clan_tag == "NONE":
                     self.send_rcon(f'svtell {p.id} "^1Error: ^7You are not in a clan."')
                     return
-                with sqlite3.connect(self.db_filename) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT name, clan_role, clan_group FROM players WHERE clan_tag=?", (p.clan_tag,))
-                    results = cursor.fetchall()
-                    members = [f"{r[0]} ({r[1]}-{r[2]})" for r in results]
-                    self.send_rcon(f'svtell {p.id} "^5[{p.clan_tag} ROSTER]: ^7{", ".join(members)}"')
+                page = int(cmd[2]) if len(cmd) > 2 and cmd[2].isdigit() else 1
+                self.read_pool.submit(self.send_clan_roster, p.id, p.clan_tag, page)
             
             elif sub == "promote" and p.role in ["LEADER", "OWNER"]:
                 if len(cmd) < 3: return
-                target_search = cmd[2].lower()
-                target_p = next((x for x in self.players if target_search in x.clean_name and x.clan_tag == p.clan_tag), None)
+                target_search = name_key(cmd[2])
+                target_p = self.players.find(target_search, lambda x: x.clan_tag == p.clan_tag)
                 
                 if target_p:
                     # Determine new role
@@ -576,15 +2558,13 @@ class MBIIDuelPlugin:
                     else: return # Cannot promote further
                     
                     target_p.role = new_role
-                    with sqlite3.connect(self.db_filename) as conn:
-                        conn.execute("UPDATE players SET clan_role=? WHERE guid=?", (new_role, target_p.guid))
-                        conn.commit()
+                    self.db.execute("UPDATE players SET clan_role=? WHERE guid=?", (new_role, target_p.guid))
                     self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7promoted ^2{target_p.name} ^7to ^5{new_role}^7!"')
 
             elif sub == "demote" and p.role in ["LEADER", "OWNER"]:
                 if len(cmd) < 3: return
-                target_search = cmd[2].lower()
-                target_p = next((x for x in self.players if target_search in x.clean_name and x.clan_tag == p.clan_tag), None)
+                target_search = name_key(cmd[2])
+                target_p = self.players.find(target_search, lambda x: x.clan_tag == p.clan_tag)
                 
                 if target_p:
                     # 1. Permission Check: Cannot demote the Owner or yourself
@@ -606,18 +2586,17 @@ class MBIIDuelPlugin:
                     
                     # 4. Apply Changes
                     target_p.role = new_role
-                    with sqlite3.connect(self.db_filename) as conn:
-                        conn.execute("UPDATE players SET clan_role=? WHERE guid=?", (new_role, target_p.guid))
-                        conn.commit()
+                    self.db.execute("UPDATE players SET clan_role=? WHERE guid=?", (new_role, target_p.guid))
                         
                     self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7demoted ^2{target_p.name} ^7to ^5{new_role}^7."')        
 
             elif sub == "rename" and p.role in ["LEADER", "OWNER"]:
                 if len(cmd) < 4: return
                 old_name, new_name = cmd[2].upper(), cmd[3].upper()
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_group=? WHERE clan_tag=? AND clan_group=?", (new_name, p.clan_tag, old_name))
-                    conn.commit()
+                if not self.db.query_one("SELECT 1 FROM clan_groups WHERE clan_tag=? AND group_name=?", (p.clan_tag, old_name)):
+                    self.send_rcon(f'svtell {p.id} "^1Error: ^7Your clan has no division ^3{old_name}^7."')
+                    return
+                self.db.execute("UPDATE players SET clan_group=? WHERE clan_tag=? AND clan_group=?", (new_name, p.clan_tag, old_name))
                 for member in self.players:
                     if member.clan_tag == p.clan_tag and member.clan_group == old_name:
                         member.clan_group = new_name
@@ -625,8 +2604,8 @@ class MBIIDuelPlugin:
 
             elif sub == "group" and p.role in ["LEADER", "OWNER"]:
                 if len(cmd) < 4: return
-                target_search, group_name = cmd[2].lower(), cmd[3].upper()
-                target_p = next((x for x in self.players if target_search in x.clean_name and x.clan_tag == p.clan_tag), None)
+                target_search, group_name = name_key(cmd[2]), cmd[3].upper()
+                target_p = self.players.find(target_search, lambda x: x.clan_tag == p.clan_tag)
 
                 if p.clan_group == group_name:
                     self.send_rcon(f'svtell {p.id} "^1Error: ^7You are already in ^3{group_name}^7."')
@@ -634,31 +2613,27 @@ class MBIIDuelPlugin:
                 
                 if target_p:
                     target_p.clan_group = group_name
-                    with sqlite3.connect(self.db_filename) as conn:
-                        conn.execute("UPDATE players SET clan_group=? WHERE guid=?", (group_name, target_p.guid))
-                        conn.commit()
+                    self.db.execute("UPDATE players SET clan_group=? WHERE guid=?", (group_name, target_p.guid))
                     self.send_rcon(f'say "^5[CLAN] ^2{target_p.name} ^7moved to subdivision: ^3{group_name}"')
 
             elif sub == "kick" and p.role in ["LEADER", "OWNER"]:
                 if len(cmd) < 3: return
-                target_search = cmd[2].lower()
+                target_search = name_key(cmd[2])
                 
                 # Check online players first to wipe their active session
-                target_p = next((x for x in self.players if target_search in x.clean_name and x.clan_tag == p.clan_tag), None)
+                target_p = self.players.find(target_search, lambda x: x.clan_tag == p.clan_tag)
                 
-                with sqlite3.connect(self.db_filename) as conn:
-                    if target_p:
-                        # Clear live session
-                        target_p.clan_tag = "NONE"
-                        target_p.role = "MEMBER"
-                        target_p.clan_group = "DEFAULT"
-                        conn.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE guid=?", (target_p.guid,))
-                        self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7kicked ^1{target_p.name} ^7from clan."')
-                    else:
-                        # Fallback: Try to kick from DB by clean_name if they are offline
-                        conn.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE clean_name=? AND clan_tag=?", (target_search, p.clan_tag))
-                        self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7kicked ^1{target_search} ^7from clan (Offline)."')
-                    conn.commit()
+                if target_p:
+                    # Clear live session
+                    target_p.clan_tag = "NONE"
+                    target_p.role = "MEMBER"
+                    target_p.clan_group = "DEFAULT"
+                    self.db.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE guid=?", (target_p.guid,))
+                    self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7kicked ^1{target_p.name} ^7from clan."')
+                else:
+                    # Fallback: Try to kick from DB by clean_name if they are offline
+                    self.db.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE clean_name=? AND clan_tag=?", (target_search, p.clan_tag))
+                    self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7kicked ^1{target_search} ^7from clan (Offline)."')
 
             elif sub == "quit":
                 if p.clan_tag == "NONE":
@@ -673,9 +2648,7 @@ class MBIIDuelPlugin:
                 p.clan_group = "DEFAULT"
 
                 # 2. Wipe from Database
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE guid=?", (p.guid,))
-                    conn.commit()
+                self.db.execute("UPDATE players SET clan_tag='NONE', clan_role='MEMBER', clan_group='DEFAULT' WHERE guid=?", (p.guid,))
 
                 self.send_rcon(f'say "^5[CLAN] ^2{p.clean_name} ^7has left the clan ^5{old_tag}^7."')
                 return
@@ -685,15 +2658,14 @@ class MBIIDuelPlugin:
                 group_name = cmd[2].upper()
                 clan_locks = self.locked_groups.get(p.clan_tag, [])
                 
-                with sqlite3.connect(self.db_filename) as conn:
-                    if group_name in clan_locks:
-                        clan_locks.remove(group_name)
-                        conn.execute("DELETE FROM clan_locks WHERE clan_tag=? AND group_name=?", (p.clan_tag, group_name))
-                        self.send_rcon(f'say "^5[CLAN] ^3{group_name} ^7is now ^2OPEN^7."')
-                    else:
-                        clan_locks.append(group_name)
-                        conn.execute("INSERT INTO clan_locks (clan_tag, group_name) VALUES (?, ?)", (p.clan_tag, group_name))
-                        self.send_rcon(f'say "^5[CLAN] ^3{group_name} ^7is now ^1LOCKED ^7(Invite Only)."')
+                if group_name in clan_locks:
+                    clan_locks.remove(group_name)
+                    self.db.execute("DELETE FROM clan_locks WHERE clan_tag=? AND group_name=?", (p.clan_tag, group_name))
+                    self.send_rcon(f'say "^5[CLAN] ^3{group_name} ^7is now ^2OPEN^7."')
+                else:
+                    clan_locks.append(group_name)
+                    self.db.execute("INSERT INTO clan_locks (clan_tag, group_name) VALUES (?, ?)", (p.clan_tag, group_name))
+                    self.send_rcon(f'say "^5[CLAN] ^3{group_name} ^7is now ^1LOCKED ^7(Invite Only)."')
                 
                 self.locked_groups[p.clan_tag] = clan_locks
 
@@ -708,21 +2680,18 @@ class MBIIDuelPlugin:
                         self.send_rcon(f'svtell {ldr.id} "^5[REQ] ^2{p.name} ^7wants to join ^3{group_name}^7. Type: ^2!daccept {p.id}"')
                 else:
                     p.clan_group = group_name
-                    with sqlite3.connect(self.db_filename) as conn:
-                        conn.execute("UPDATE players SET clan_group=? WHERE guid=?", (group_name, p.guid))
+                    self.db.execute("UPDATE players SET clan_group=? WHERE guid=?", (group_name, p.guid))
                     self.send_rcon(f'svtell {p.id} "^5[CLAN] ^7Joined group ^3{group_name}"')
 
             elif sub == "ownership" and p.role == "OWNER":
                 if len(cmd) < 3: return
-                target_search = cmd[2].lower()
-                target_p = next((x for x in self.players if target_search in x.clean_name and x.clan_tag == p.clan_tag), None)
+                target_search = name_key(cmd[2])
+                target_p = self.players.find(target_search, lambda x: x.clan_tag == p.clan_tag)
                 
                 if target_p:
                     # Transfer ownership
-                    with sqlite3.connect(self.db_filename) as conn:
-                        conn.execute("UPDATE players SET clan_role='LEADER' WHERE guid=?", (p.guid,))
-                        conn.execute("UPDATE players SET clan_role='OWNER' WHERE guid=?", (target_p.guid,))
-                        conn.commit()
+                    self.db.execute("UPDATE players SET clan_role='LEADER' WHERE guid=?", (p.guid,))
+                    self.db.execute("UPDATE players SET clan_role='OWNER' WHERE guid=?", (target_p.guid,))
                     
                     p.role = "LEADER"
                     target_p.role = "OWNER"
@@ -731,20 +2700,19 @@ class MBIIDuelPlugin:
         elif cmd[0] == "!daccept" and p.role in ["LEADER", "OWNER"]:
             if len(cmd) < 2 or not cmd[1].isdigit(): return
             target_id = int(cmd[1])
-            target_p = next((x for x in self.players if x.id == target_id), None)
+            target_p = self.players.by_slot(target_id)
             
             # Ensure target is actually requesting to join THIS clan's group
             if target_p and getattr(target_p, 'pending_group_request', None) and target_p.clan_tag == p.clan_tag:
                 group = target_p.pending_group_request
                 target_p.clan_group = group
                 target_p.pending_group_request = None
-                with sqlite3.connect(self.db_filename) as conn:
-                    conn.execute("UPDATE players SET clan_group=? WHERE guid=?", (group, target_p.guid))
+                self.db.execute("UPDATE players SET clan_group=? WHERE guid=?", (group, target_p.guid))
                 self.send_rcon(f'say "^5[CLAN] ^2{p.name} ^7approved ^2{target_p.name} ^7for ^3{group}^7!"')
 
         elif cmd[0] == "!ddecline" and p.role in ["LEADER", "OWNER"]:
             if len(cmd) < 2: return
-            target_p = next((x for x in self.players if x.id == int(cmd[1])), None)
+            target_p = self.players.by_slot(int(cmd[1]))
             if target_p:
                 target_p.pending_group_request = None
                 self.send_rcon(f'svtell {target_p.id} "^1[CLAN] ^7Your group request was declined."')
@@ -753,34 +2721,19 @@ class MBIIDuelPlugin:
             t_msg = "^5Tournament: ^7!tyes (Join Lobby), !tforfeit (Surrender), !thelp"
             if p.role != "MEMBER":
                 t_msg += " ^3Staff: ^7!tstart <score>, !tpause, !tresume"
-            self.send_rcon(f'svtell {p.id} "{t_msg}"')
+            self.send_rcon(f'svtell {p.id} "{t_msg}"', PRIORITY_INFO)
 
         elif cmd[0] == "!rank":
             target = p
             if len(cmd) > 1:
-                target_search = " ".join(cmd[1:]).lower()
-                target = next((x for x in self.players if target_search in x.clean_name), p)
-
-            with sqlite3.connect(self.db_filename) as conn:
-                cursor = conn.cursor()
-                # Search by GUID first, or by clean_name if GUID is "0"
-                if target.guid == "0" or not target.guid:
-                    cursor.execute("""SELECT duel_rating, total_rounds_won, tournament_wins, name 
-                                   FROM players WHERE clean_name = ? ORDER BY rowid DESC""", (target.clean_name,))
-                else:
-                    cursor.execute("""SELECT duel_rating, total_rounds_won, tournament_wins, name 
-                                   FROM players WHERE guid = ?""", (target.guid,))
-                
-                data = cursor.fetchone()
-                if data:
-                    rating, rounds, t_wins, db_name = data
-                    # Use db_name instead of target.name to avoid "Unknown"
-                    rank_msg = (f"^5Rank for ^2{db_name}: ^7Rating: ^3{int(rating)} ^7| "
-                                f"Rounds: ^3{rounds} ^7| Tourney Wins: ^3{t_wins}")
-                    self.send_rcon(f'svtell {p.id} "{rank_msg}"')
-                else:
-                    # If truly not in DB, show session stats
-                    self.send_rcon(f'svtell {p.id} "^5Rank for ^2{target.name}: ^7Rating: ^3{int(target.rating)} ^7| New Player"')
+                target_search = name_key(" ".join(cmd[1:]))
+                target = self.players.find(target_search)
+
+            if target:
+                self.read_pool.submit(self.send_rank, p.id, target.guid, target.clean_name, target.name, target.rating)
+            else:
+                # Not online: search everyone who has played here
+                self.read_pool.submit(self.send_rank_search, p.id, target_search)
 
         elif cmd[0] == "!tstart":
             # Hierarchy Check: MEMBER is index 0. We only want index 1 and above.
@@ -791,7 +2744,10 @@ class MBIIDuelPlugin:
             self.lobby_open, self.lobby_players, self.is_cvc = True, [], False
             self.win_limit = int(cmd[1]) if len(cmd) > 1 and cmd[1].isdigit() else 5
             self.send_rcon(f'say "^5[TOURNAMENT] ^7Lobby OPEN! Type ^2!tyes ^7to join."')
-            threading.Timer(60.0, self.start_tournament).start()
+            # A second !tstart restarts the countdown instead of starting the tournament twice
+            if self.lobby_timer:
+                self.lobby_timer.cancel()
+            self.lobby_timer = self.call_later(60.0, self.start_tournament)
 
         elif cmd[0] == "!tyes" and self.lobby_open:
             if p not in self.lobby_players: self.lobby_players.append(p)
@@ -800,12 +2756,10 @@ class MBIIDuelPlugin:
             winner = p.opponent
             
             # NEW: Clear persistent data so the tournament forfeit doesn't restore later
-            with sqlite3.connect(self.db_filename) as conn:
-                conn.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
-                             (p.guid, winner.guid, winner.guid, p.guid))
-                conn.commit()
+            self.db.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
+                            (p.guid, winner.guid, winner.guid, p.guid))
 
-            self.send_rcon(f'say "^5[FORFEIT] ^2{p.name} ^7surrendered to ^2{winner.name}^7."')
+            self.send_rcon(f'say "^5[FORFEIT] ^2{p.name} ^7surrendered to ^2{winner.name}^7."', PRIORITY_MATCH)
             self.finalize_match(winner, p)
 
         elif cmd[0] == "!dduel":
@@ -815,7 +2769,7 @@ class MBIIDuelPlugin:
             try:
                 rounds = int(cmd[-1])
                 target_input = " ".join(cmd[1:-1])
-                target_search = normalize(target_input) 
+                target_search = name_key(target_input) 
             except:
                 return self.send_rcon(f'svtell {p.id} "^1Error: ^7Rounds must be a number."')
 
@@ -823,11 +2777,11 @@ class MBIIDuelPlugin:
             
             # Search memory by Slot ID first
             if target_input.isdigit():
-                target = self.slot_map.get(int(target_input))
+                target = self.players.by_slot(int(target_input))
             
             # Search memory by Name (Partial Match)
             if not target:
-                target = next((x for x in self.players if target_search in x.clean_name), None)
+                target = self.players.find(target_search)
 
             if not target:
                 return self.send_rcon(f'svtell {p.id} "^1Error: ^7Player \'{target_input}\' not in memory."')
@@ -871,17 +2825,15 @@ class MBIIDuelPlugin:
             winner = p.opponent
             
             # 1. Clear persistent DB data (Your existing logic)
-            with sqlite3.connect(self.db_filename) as conn:
-                conn.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
-                             (p.guid, winner.guid, winner.guid, p.guid))
-                conn.commit()
+            self.db.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
+                            (p.guid, winner.guid, winner.guid, p.guid))
 
             # 2. Reset Match State (Crucial for your new system)
             p.match_score = winner.match_score = 0
             p.is_formal_match = winner.is_formal_match = False
             
             # 3. Announce and break the link
-            self.send_rcon(f'say "^5[MATCH] ^2{p.clean_name} ^7forfeited. ^2{winner.clean_name} ^7wins the set!"')
+            self.send_rcon(f'say "^5[MATCH] ^2{p.clean_name} ^7forfeited. ^2{winner.clean_name} ^7wins the set!"', PRIORITY_MATCH)
             
             p.opponent = winner.opponent = None
 
@@ -895,48 +2847,147 @@ class MBIIDuelPlugin:
             self.show_clan_leaderboard(p.id)  
 
     def show_leaderboard(self, column, label, sid):
-        with sqlite3.connect(self.db_filename) as conn:
-            cursor = conn.cursor()
-            # Added "AND {column} > 0" so unranked/0-win players don't clutter the top list
-            cursor.execute(f"""
-                SELECT name, {column} 
-                FROM players 
-                WHERE name != 'Unknown' AND name != '' AND {column} > 0
-                ORDER BY {column} DESC LIMIT 5
-            """)
-            rows = cursor.fetchall()
-            
-            self.send_rcon(f'svtell {sid} "^5--- TOP 5 {label} ---"')
-            if not rows:
-                self.send_rcon(f'svtell {sid} "^7No data available yet."')
-                return
-
-            for i, (name, val) in enumerate(rows, 1):
-                # Using int(val) is safe for ratings, wins, and match counts
-                self.send_rcon(f'svtell {sid} "^7{i}. ^2{name} ^7- ^3{int(val)}"')
+        # Answered from memory: no database round trip however big the players table gets
+        board = self.leaderboards[column]
+        self.refresh_leaderboards()
+        if board.stale:
+            self.load_leaderboard(board)
+
+        lines = [f'svtell {sid} "^5--- TOP 5 {label} ---"']
+        rows = board.top()
+        if not rows:
+            lines.append(f'svtell {sid} "^7No data available yet."')
+
+        for i, (name, val) in enumerate(rows, 1):
+            # Using int(val) is safe for ratings, wins, and match counts
+            lines.append(f'svtell {sid} "^7{i}. ^2{name} ^7- ^3{int(val)}"')
+        self.send_rcon_many(lines, PRIORITY_INFO)
+
+    @staticmethod
+    def leaderboard_sql(board):
+        return f"""
+            SELECT guid, name, {board.column}
+            FROM players
+            WHERE name != 'Unknown' AND name != ''
+            ORDER BY {board.column} DESC LIMIT ?
+        """
+
+    def load_leaderboard(self, board):
+        # Through the writer, so it sees every update queued before it
+        board.load(self.db.query(self.leaderboard_sql(board), (board.size,)))
+
+    def refresh_leaderboards(self):
+        """Reloads every leaderboard if another process committed to duel.db since the last check.
+        Checked at most once per leaderboard_check_seconds, when a leaderboard is asked for; the
+        check and the reload run on the read pool, so the reply in hand still uses the old rows."""
+        owner = self.shared or self
+        now = time.monotonic()
+        if owner.leaderboard_check <= 0 or now - owner.leaderboard_checked < owner.leaderboard_check:
+            return
+        owner.leaderboard_checked = now
+        # Taken here, between handlers: every update counted so far has its write queued
+        # before the pool's flush, so the rows read there already include it
+        seen = {column: board.updates for column, board in self.leaderboards.items()}
+        self.read_pool.submit(self.reload_leaderboards, seen)
+
+    def reload_leaderboards(self, conn, seen):
+        # Read pool job. data_version is read on the writer connection, the only one whose
+        # value ignores our own commits; the sorts run here, off the dispatcher and the writer
+        owner = self.shared or self
+        version = self.db.query_one("PRAGMA data_version")[0]
+        if version == owner.data_version:
+            return
+        owner.data_version = version
+        for column, board in self.leaderboards.items():
+            rows = conn.execute(self.leaderboard_sql(board), (board.size,)).fetchall()
+            if not board.load(rows, seen[column]):
+                # A handler updated the board while we read; try again at the next check
+                owner.data_version = None
+
+    def update_leaderboard(self, p, column, value):
+        """Mirrors an UPDATE of p's players row into the in-memory leaderboard."""
+        # UPDATEs keyed on a real GUID only land if sync_player found the row by that GUID
+        if not p.db_guid or (PlayerRegistry.valid_guid(p.guid) and p.db_guid != p.guid):
+            return
+        self.leaderboards[column].update(p.db_guid, p.db_name, value)
 
     def show_clan_leaderboard(self, sid):
-        with sqlite3.connect(self.db_filename) as conn:
-            cursor = conn.cursor()
-            # Removed guid != '0' to ensure Slot 0 and new players are counted
-            cursor.execute("""
-                SELECT clan_tag, AVG(duel_rating) as avg_r 
-                FROM players 
-                WHERE clan_tag != 'NONE' 
-                AND clan_tag != ''
-                AND name != 'Unknown'
-                GROUP BY clan_tag 
-                ORDER BY avg_r DESC LIMIT 5
-            """)
-            rows = cursor.fetchall()
-            
-            self.send_rcon(f'svtell {sid} "^5--- TOP 5 CLANS (Avg Rating) ---"')
-            if not rows:
-                self.send_rcon(f'svtell {sid} "^7No clans found."')
-                return
+        self.read_pool.submit(self.send_clan_leaderboard, sid)
+
+    # --- READ POOL JOBS ---
+    # These run on a read-pool thread with their own read-only connection. They only get
+    # plain values from the dispatcher, never live Player objects.
+
+    def send_clan_leaderboard(self, conn, sid):
+        # The clans table keeps each clan's rating total, so this no longer touches players
+        rows = conn.execute("""
+            SELECT clan_tag, rating_sum / rated_members as avg_r 
+            FROM clans 
+            WHERE rated_members > 0
+            ORDER BY avg_r DESC LIMIT 5
+        """).fetchall()
+
+        lines = [f'svtell {sid} "^5--- TOP 5 CLANS (Avg Rating) ---"']
+        if not rows:
+            lines.append(f'svtell {sid} "^7No clans found."')
+
+        for i, (clan, avg) in enumerate(rows, 1):
+            lines.append(f'svtell {sid} "^7{i}. ^2{clan} ^7- ^3{int(avg)}"')
+        self.send_rcon_many(lines, PRIORITY_INFO)
+
+    def send_rank(self, conn, sid, guid, clean_name, name, session_rating):
+        # Search by GUID first, or by clean_name if GUID is "0"
+        if guid == "0" or not guid:
+            data = conn.execute("""SELECT duel_rating, total_rounds_won, tournament_wins, name 
+                                FROM players WHERE clean_name = ? ORDER BY rowid DESC""", (clean_name,)).fetchone()
+        else:
+            data = conn.execute("""SELECT duel_rating, total_rounds_won, tournament_wins, name 
+                                FROM players WHERE guid = ?""", (guid,)).fetchone()
+
+        if data:
+            rating, rounds, t_wins, db_name = data
+            # Use db_name instead of target.name to avoid "Unknown"
+            rank_msg = (f"^5Rank for ^2{db_name}: ^7Rating: ^3{int(rating)} ^7| "
+                        f"Rounds: ^3{rounds} ^7| Tourney Wins: ^3{t_wins}")
+            self.send_rcon(f'svtell {sid} "{rank_msg}"', PRIORITY_INFO)
+        else:
+            # If truly not in DB, show session stats
+            self.send_rcon(f'svtell {sid} "^5Rank for ^2{name}: ^7Rating: ^3{int(session_rating)} ^7| New Player"', PRIORITY_INFO)
 
-            for i, (clan, avg) in enumerate(rows, 1):
-                self.send_rcon(f'svtell {sid} "^7{i}. ^2{clan} ^7- ^3{int(avg)}"')
+    def send_rank_search(self, conn, sid, query):
+        rows = search_player_names(conn, query, limit=1)
+        if not rows:
+            self.send_rcon(f'svtell {sid} "^1Error: ^7No player matching \'{query}\' found."', PRIORITY_INFO)
+            return
+        guid, name, clean_name = rows[0]
+        self.send_rank(conn, sid, guid, clean_name, name, 1500)
+
+    def send_clan_roster(self, conn, sid, clan_tag, page=1):
+        results = conn.execute("SELECT name, clan_role, clan_group FROM players WHERE clan_tag=?", (clan_tag,)).fetchall()
+        members = [f"{r[0]} ({r[1]}-{r[2]})" for r in results]
+        # Big clans don't fit one chat line, so wrap the list and page through it
+        lines, line = [], ""
+        for member in members:
+            if line and len(line) + len(member) + 2 > ROSTER_LINE_CHARS:
+                lines.append(line)
+                line = ""
+            line = f"{line}, {member}" if line else member
+        lines.append(line)
+        if len(lines) == 1:
+            self.send_rcon(f'svtell {sid} "^5[{clan_tag} ROSTER]: ^7{lines[0]}"', PRIORITY_INFO)
+        else:
+            self.send_paged(sid, f"{clan_tag} ROSTER", [f"^7{l}" for l in lines], page, "!dclan show")
+
+    def send_paged(self, sid, title, lines, page, more_command, priority=PRIORITY_INFO):
+        """Sends one page of lines to a player as a single block, with a pointer to the next page."""
+        pages = (len(lines) + self.page_lines - 1) // self.page_lines
+        page = min(max(page, 1), max(pages, 1))
+        header = f"^5--- {title} ---" if pages <= 1 else f"^5--- {title} ({page}/{pages}) ---"
+        block = [f'svtell {sid} "{header}"']
+        block += [f'svtell {sid} "{l}"' for l in lines[(page - 1) * self.page_lines:page * self.page_lines]]
+        if page < pages:
+            block.append(f'svtell {sid} "^7Type ^2{more_command} {page + 1} ^7for the next page."')
+        self.send_rcon_many(block, priority)
 
     def start_tournament(self):
         self.lobby_open = False
@@ -971,14 +3022,12 @@ class MBIIDuelPlugin:
         
         if len(participants) % 2 != 0:
             self.round_winners.append(participants[-1])
-        self.send_rcon(f'say "^5[ROUND {self.tournament_round_num}] ^7Matches STARTING."')
+        self.send_rcon(f'say "^5[ROUND {self.tournament_round_num}] ^7Matches STARTING."', PRIORITY_MATCH)
 
     def finalize_match(self, winner, loser):
         # NEW: Clear persistent data so it doesn't restore next map
-        with sqlite3.connect(self.db_filename) as conn:
-            conn.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
-                         (winner.guid, loser.guid, loser.guid, winner.guid))
-            conn.commit()
+        self.db.execute("DELETE FROM active_matches WHERE (p1_guid=? AND p2_guid=?) OR (p1_guid=? AND p2_guid=?)",
+                        (winner.guid, loser.guid, loser.guid, winner.guid))
 
         if self.active_tournament:
             self.round_winners.append(winner)
@@ -989,422 +3038,559 @@ class MBIIDuelPlugin:
                     self.tournament_round_num += 1
                     self.setup_round(self.round_winners)
                 else:
-                    self.send_rcon(f'say "^5[CHAMPION] ^2{self.round_winners[0].name} ^7WON!"')
+                    self.send_rcon(f'say "^5[CHAMPION] ^2{self.round_winners[0].name} ^7WON!"', PRIORITY_MATCH)
                     if self.round_winners[0].guid != "0":
-                        with sqlite3.connect(self.db_filename) as conn:
-                            conn.execute("UPDATE players SET tournament_wins = tournament_wins + 1 WHERE guid=?", (self.round_winners[0].guid,))
-                            conn.commit()
+                        champion = self.round_winners[0]
+                        self.db.execute("UPDATE players SET tournament_wins = tournament_wins + 1 WHERE guid=?", (champion.guid,))
+                        champion.tournament_wins += 1
+                        self.update_leaderboard(champion, "tournament_wins", champion.tournament_wins)
                     self.active_tournament = False
 
+    @property
+    def label(self):
+        return f"[{self.name}] " if self.name else ""
+
     def run(self):
+        self.open_log()
+        self.start_background()
+        if self.async_mode:
+            asyncio.run(self.run_async())
+        else:
+            self.dispatch()
+
+    def open_log(self):
         log = self.settings['logname']
-        
+        self.tailer = LogTailer(log,
+                                poll_interval=float(self.settings.get('poll_interval', 0.1)),
+                                use_inotify=self.settings.get('inotify', 'true').lower() != 'false',
+                                block_size=int(self.settings.get('read_block_size', 65536)))
+
         # Initialize bookmark at the current end to skip old data on startup
-        if os.path.exists(log):
-            last_sz = os.path.getsize(log)
-        else:
-            last_sz = 0
-            
-        print(f"[SYSTEM] Plugin active. Monitoring {log} (High-Speed Mode)")
+        self.tailer.seek_end()
+
+        if self.async_mode:
+            print(f"[SYSTEM] {self.label}Plugin active. Monitoring {log} ({self.tailer.mode} mode, asyncio core loop)")
+            return
 
+        line_queue = queue.Queue(maxsize=int(self.settings.get('line_queue_size', 10000)))
+        with self.deferred_lock:
+            self.line_queue = line_queue
+            for func, args in self.deferred:
+                line_queue.put((None, time.time(), (func, args)))
+            self.deferred = []
+        self.reader = LogReader(self.tailer, self.line_queue, int(self.settings.get('lag_warn_bytes', 65536)))
+        self.reader.start()
+
+        print(f"[SYSTEM] {self.label}Plugin active. Monitoring {log} ({self.tailer.mode} mode)")
+
+    def start_background(self):
+        """Process-wide jobs; with several servers only the first one runs them."""
+        self.start_rd_inflation_loop()
+        self.start_metrics()
+        self.install_profile_signal()
+
+    def close_log(self):
+        """Stops the reader and the dispatcher and closes the log (and its inotify descriptors)."""
+        if self.reader:
+            self.reader.stop()
+            try:
+                self.line_queue.put(None, timeout=1)
+            except queue.Full:
+                pass # nobody is draining it
+        if self.tailer:
+            self.tailer.close()
+
+    def dispatch(self):
+        # Dispatcher stage: everything below may block (SQLite, RCON) without stalling the reader
+        skip_before = 0
         while True:
             try:
-                if not os.path.exists(log):
-                    time.sleep(1)
+                item = self.line_queue.get()
+                if item is None:
+                    return # shutdown()
+                generation, stamp, line = item
+
+                # A timer passed on by the wheel (call_soon)
+                if generation is None:
+                    func, args = line
+                    try:
+                        func(*args)
+                    except Exception as e:
+                        print(f"[SYSTEM] Timer {getattr(func, '__name__', func)} failed: {e}")
                     continue
 
-                curr_sz = os.path.getsize(log)
-                
-                if curr_sz < last_sz:
-                    last_sz = 0 
+                # Queued before an InitGame we already handled: the old loop never read these
+                if generation < skip_before:
+                    self.lines_dropped += 1
+                    continue
 
-                if curr_sz > last_sz:
-                    with open(log, 'r', encoding='utf-8', errors='ignore', newline=None) as f:
-                        f.seek(last_sz)
-                        
-                        # SPEED TWEAK: Line-by-line iterator is much faster than f.readlines()
-                        while True:
-                            line = f.readline()
-                            if not line:
-                                break
-                            
-                            line = line.strip()
-                            if not line: continue
-                            
-                            # Execute parse_line. If it returns True (InitGame), 
-                            # we jump the pointer to the very end of the file.
-                            if self.parse_line(line) is True:
-                                f.seek(0, 2)
-                                last_sz = f.tell()
-                                break
-                        
-                        last_sz = f.tell()
+                self.lines_dispatched += 1
+                self.max_dispatch_delay = max(self.max_dispatch_delay, time.time() - stamp)
 
-                time.sleep(0.1)
+                # Execute parse_line. If it returns True (InitGame),
+                # we jump the pointer to the very end of the file.
+                if self.parse_line(line) is True:
+                    skip_before = generation + 1
+                    self.reader.request_skip()
             except Exception as e:
                 print(f"[CRITICAL ERROR] Loop failure: {e}")
-                time.sleep(2)                    
 
-    def parse_line(self, line):    
+    async def run_async(self):
+        """The asyncio core loop: tailing, parsing, RCON and every delayed action share this
+        thread, so handlers never race each other over self.players."""
+        self.rcon.attach(asyncio.get_running_loop())
+        with self.deferred_lock:
+            self.loop = asyncio.get_running_loop()
+            for func, args in self.deferred:
+                self.loop.call_soon(func, *args)
+            self.deferred = []
+
+        tasks = [self.tail_async()]
+        interval = float(self.settings.get('status_interval', 60))
+        if interval > 0:
+            tasks.append(self.status_loop_async(interval))
+        await asyncio.gather(*tasks)
+
+    async def tail_async(self):
+        lag_warn = int(self.settings.get('lag_warn_bytes', 65536))
+        while True:
+            try:
+                lines = self.tailer.read_lines()
+                stamp = time.time()
+                for i, line in enumerate(lines):
+                    self.lines_dispatched += 1
+                    try:
+                        # InitGame: jump to the end of the file, like the threaded dispatcher
+                        if self.parse_line(line) is True:
+                            self.lines_dropped += len(lines) - i - 1
+                            self.tailer.seek_end()
+                            break
+                    except Exception as e:
+                        print(f"[CRITICAL ERROR] Loop failure: {e}")
+                    # Let queued RCON traffic and status replies through during a long burst
+                    if i % 200 == 199:
+                        await asyncio.sleep(0)
+                if lines:
+                    self.max_dispatch_delay = max(self.max_dispatch_delay, time.time() - stamp)
+
+                if self.tailer.lag_bytes > lag_warn:
+                    print(f"[SYSTEM] Log tailer was {self.tailer.lag_bytes} bytes behind (max {self.tailer.max_lag_bytes}).")
+
+                await self.tailer.wait_async()
+            except Exception as e:
+                print(f"[CRITICAL ERROR] Reader failure: {e}")
+                await asyncio.sleep(2)
 
-        if "InitGame:" in line:
-            # 1. Reset tournament and session flags
-            self.lobby_players = []
-            self.active_tournament = False
-            self.match_in_progress = False
-            
-            self.players = [] 
-            self.slot_map = {} 
+    async def status_loop_async(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            # This ensures the script periodically "sees" everyone online
+            await self.pending_sync()
+
+    def parse_line(self, line):
+        # One search tells us which event this line carries. Kills, item pickups and
+        # everything else we don't handle are rejected here without trying each pattern.
+        event = classify_line(line)
+        if event is None:
+            self.metrics.ignored += 1
+            return
+        started = time.perf_counter()
+        try:
+            return self.event_handlers[event](line)
+        finally:
+            self.metrics.observe(event, time.perf_counter() - started)
 
-            self.force_sync_players()
+    def handle_init_game(self, line):
+        # 1. Reset tournament and session flags
+        self.lobby_players = []
+        self.active_tournament = False
+        self.match_in_progress = False
 
-            threading.Timer(2.0, self.force_sync_players).start()
-            
-            return True
+        self.players.clear()
 
-        m_info = re.search(r'ClientUserinfoChanged: (\d+) n\\(.*?)\\t\\(\d+)', line)
-        if m_info:
-            slot_id = int(m_info.group(1))
-            full_name = m_info.group(2).strip()
-            team_id = m_info.group(3)
-            clean_n = normalize(full_name)
+        self.force_sync_players()
 
-            # 1. Force find or create
-            p = next((x for x in self.players if x.clean_name == clean_n), None)
-            
-            if not p:
-                # If not in memory, sync from DB and add to list immediately
-                p = self.sync_player(slot_id, full_name, "0")
-                if p not in self.players:
-                    self.players.append(p)
-            
-            # 2. Update the critical mapping
-            p.id = slot_id
-            p.team = team_id
-            self.slot_map[slot_id] = p
-            
-            # Debug log to console so you can see it working
-            print(f"[DEBUG] Synced: {p.clean_name} to Slot {slot_id}")
+        if self.resync_timer:
+            self.resync_timer.cancel()
+        self.resync_timer = self.call_later(2.0, self.force_sync_players)
+
+        return True
+
+    def handle_userinfo(self, line):
+        m_info = USERINFO_PATTERN.search(line)
+        if not m_info:
             return
-            
+        slot_id = int(m_info.group(1))
+        full_name = m_info.group(2).strip()
+        team_id = m_info.group(3)
+        clean_n = name_key(full_name)
+
+        # 1. Force find or create
+        p = self.players.by_name(clean_n)
+
+        if not p:
+            # If not in memory, sync from DB (this also registers them)
+            p = self.sync_player(slot_id, full_name, "0")
+
+        # 2. Update the critical mapping
+        self.players.set_slot(p, slot_id)
+        p.team = team_id
+
+        # Debug log to console so you can see it working
+        print(f"[DEBUG] Synced: {p.clean_name} to Slot {slot_id}")
+
+    def handle_guid(self, line):
         # Capture GUIDs (Player 0: zaanne ja_guid\ABC...)
-        m_spawn = re.search(r'(?:Player|ClientInfo)\s+(\d+).*?ja_guid\\([A-Z0-9]{32})', line)
-        if m_spawn:
-            sid = int(m_spawn.group(1))
-            guid = m_spawn.group(2)
-            for p in self.players:
-                if p.guid == guid:
-                    p.id = sid  
-                    self.slot_map[sid] = p # PLUG INTO SWITCHBOARD
-                    break
+        m_spawn = GUID_PATTERN.search(line)
+        if not m_spawn:
+            return
+        sid = int(m_spawn.group(1))
+        guid = m_spawn.group(2)
+        p = self.players.by_guid(guid)
+        if p:
+            self.players.set_slot(p, sid) # PLUG INTO SWITCHBOARD
+
+    def handle_duel_start(self, line):
+        m_start = DUEL_START_PATTERN.search(line)
+        if not m_start:
+            return
+        raw_p1, raw_p2 = m_start.group(1).strip(), m_start.group(2).strip()
 
-        # 3. DUEL LOGIC (Start)
-        m_start = re.search(r'DuelStart: (.*?) challenged (.*?) to a private duel', line)
-        if m_start:
-            raw_p1, raw_p2 = m_start.group(1).strip(), m_start.group(2).strip()
-            
-            # SIGNATURE GATE
-            sig = f"start-{raw_p1}-{raw_p2}-{line.strip()}"
-            if sig == getattr(self, 'last_duel_start_sig', None):
-                return
-            self.last_duel_start_sig = sig
+        # SIGNATURE GATE
+        sig = f"start-{raw_p1}-{raw_p2}-{line}"
+        if sig == getattr(self, 'last_duel_start_sig', None):
+            return
+        self.last_duel_start_sig = sig
 
-            p1 = next((x for x in self.players if x.clean_name == normalize(raw_p1)), None)
-            p2 = next((x for x in self.players if x.clean_name == normalize(raw_p2)), None)
+        p1 = self.players.by_name(name_key(raw_p1))
+        p2 = self.players.by_name(name_key(raw_p2))
 
-            if not p1: p1 = self.sync_player(-1, raw_p1, "0")
-            if not p2: p2 = self.sync_player(-1, raw_p2, "0")
+        if not p1: p1 = self.sync_player(-1, raw_p1, "0")
+        if not p2: p2 = self.sync_player(-1, raw_p2, "0")
 
-            if p1 and p2:
-                if getattr(p1, 'team', '0') == '3' or getattr(p2, 'team', '0') == '3':
-                    return 
+        if p1 and p2:
+            if getattr(p1, 'team', '0') == '3' or getattr(p2, 'team', '0') == '3':
+                return
 
-                duel_key = tuple(sorted([p1.clean_name, p2.clean_name]))
-                if duel_key in self.active_duels:
-                    return
-                
-                self.active_duels.add(duel_key)
+            duel_key = tuple(sorted([p1.clean_name, p2.clean_name]))
+            if duel_key in self.active_duels:
+                return
 
-                # Link opponents for the scoring block
-                p1.opponent, p2.opponent = p2, p1
+            self.active_duels.add(duel_key)
 
-                # --- DYNAMIC MATCH DETECTION ---
-                if getattr(p1, 'is_formal_match', False) or getattr(p2, 'is_formal_match', False):
-                    # Pull the dynamic limit (e.g., 2)
-                    limit = getattr(p1, 'match_limit', getattr(p2, 'match_limit', 5))
-                    # Show the current score (0/2 vs 0/2 on round 1, etc)
-                    self.send_rcon(f'say "^5[MATCH] ^7Round Start: ^2{p1.clean_name} ^7(^2{p1.match_score}^7/^3{limit}^7) vs ^2{p2.clean_name} ^7(^2{p2.match_score}^7/^3{limit}^7)"')
-                else:
-                    # Standard Private Duel
-                    self.send_rcon(f'say "^5[DUEL] ^7Challenge: ^7{p1.clean_name} ^7(^5{int(p1.rating)}^7) vs ^7{p2.clean_name} ^7(^5{int(p2.rating)}^7)"')
+            # Link opponents for the scoring block
+            p1.opponent, p2.opponent = p2, p1
+
+            # --- DYNAMIC MATCH DETECTION ---
+            if getattr(p1, 'is_formal_match', False) or getattr(p2, 'is_formal_match', False):
+                # Pull the dynamic limit (e.g., 2)
+                limit = getattr(p1, 'match_limit', getattr(p2, 'match_limit', 5))
+                # Show the current score (0/2 vs 0/2 on round 1, etc)
+                self.send_rcon(f'say "^5[MATCH] ^7Round Start: ^2{p1.clean_name} ^7(^2{p1.match_score}^7/^3{limit}^7) vs ^2{p2.clean_name} ^7(^2{p2.match_score}^7/^3{limit}^7)"', PRIORITY_MATCH)
+            else:
+                # Standard Private Duel
+                self.send_rcon(f'say "^5[DUEL] ^7Challenge: ^7{p1.clean_name} ^7(^5{int(p1.rating)}^7) vs ^7{p2.clean_name} ^7(^5{int(p2.rating)}^7)"', PRIORITY_MATCH)
+
+    def handle_duel_end(self, line):
+        m_end = DUEL_END_PATTERN.search(line)
+        if not m_end:
             return
+        try:
+            raw_w, raw_l = m_end.group(1).strip(), m_end.group(2).strip()
 
-        # 4. DUEL LOGIC (End)
-        m_end = re.search(r'DuelEnd:\s+(.*?)\s+has defeated\s+(.*?)\s+in a private duel', line, re.IGNORECASE)
-        if m_end:
-            try:
-                raw_w, raw_l = m_end.group(1).strip(), m_end.group(2).strip()
-                
-                # Signature check to prevent double-processing
-                sig = f"end-{raw_w}-{raw_l}-{line.strip()}"
-                if sig == getattr(self, 'last_duel_end_sig', None):
+            # Signature check to prevent double-processing
+            sig = f"end-{raw_w}-{raw_l}-{line}"
+            if sig == getattr(self, 'last_duel_end_sig', None):
+                return
+            self.last_duel_end_sig = sig
+
+            winner = self.players.by_name(name_key(raw_w))
+            loser = self.players.by_name(name_key(raw_l))
+
+            if winner and loser:
+                duel_key = tuple(sorted([winner.clean_name, loser.clean_name]))
+                if duel_key not in self.active_duels:
                     return
-                self.last_duel_end_sig = sig
 
-                winner = next((x for x in self.players if x.clean_name == normalize(raw_w)), None)
-                loser = next((x for x in self.players if x.clean_name == normalize(raw_l)), None)
+                # Unlock the duel gate
+                self.active_duels.discard(duel_key)
 
-                if winner and loser:
-                    duel_key = tuple(sorted([winner.clean_name, loser.clean_name]))
-                    if duel_key not in self.active_duels:
-                        return
+                # Calculate Rating Change (Glicko/Elo), saved together with the ledger row
+                self.calculate_glicko2(winner, loser)
 
-                    # Unlock the duel gate
-                    self.active_duels.discard(duel_key)
-                    
-                    # Calculate Rating Change (Glicko/Elo)
-                    self.calculate_glicko2(winner, loser)
-
-                    # --- DYNAMIC MATCH SCORING ---
-                    if getattr(winner, 'is_formal_match', False) or getattr(loser, 'is_formal_match', False):
-                        winner.match_score += 1
-                        limit = getattr(winner, 'match_limit', 5)
-
-                        # Single DB connection for efficiency
-                        with sqlite3.connect(self.db_filename) as conn:
-                            w_f = 'guid' if (winner.guid and len(winner.guid) > 10) else 'clean_name'
-                            l_f = 'guid' if (loser.guid and len(loser.guid) > 10) else 'clean_name'
-                            
-                            # 1. Update individual round stats
-                            conn.execute(f"UPDATE players SET total_rounds_won = total_rounds_won + 1 WHERE {w_f}=?", (winner.guid if 'guid' in w_f else winner.clean_name,))
-                            conn.execute(f"UPDATE players SET total_rounds_lost = total_rounds_lost + 1 WHERE {l_f}=?", (loser.guid if 'guid' in l_f else loser.clean_name,))
-
-                            # 2. Announce round results
-                            self.send_rcon(f'say "^5[MATCH] ^2{winner.clean_name} ^7(^2{winner.match_score}^7/^3{limit}^7) vs ^2{loser.clean_name} ^7(^1{loser.match_score}^7/^3{limit}^7)"')
-                            
-                            # 3. Check for Match Finalization (The Series Win)
-                            if winner.match_score >= limit:
-                                self.send_rcon(f'say "^5[MATCH] ^2{winner.clean_name} ^7wins the Match ^2{winner.match_score} ^7- ^1{loser.match_score}!"')
-                                
-                                # Increment the !fttop counter
-                                conn.execute(f"UPDATE players SET matches_won = matches_won + 1 WHERE {w_f}=?", (winner.guid if 'guid' in w_f else winner.clean_name,))
-                                
-                                # Reset match state
-                                winner.match_score = 0
-                                loser.match_score = 0
-                                winner.is_formal_match = False
-                                loser.is_formal_match = False
-                                winner.opponent = None
-                                loser.opponent = None
-                            
-                            conn.commit()
-                    else:
-                        # Standard Private Duel logic (Non-formal)
+                # --- DYNAMIC MATCH SCORING ---
+                if getattr(winner, 'is_formal_match', False) or getattr(loser, 'is_formal_match', False):
+                    winner.match_score += 1
+                    limit = getattr(winner, 'match_limit', 5)
+
+                    # Queued on the writer; these land in the same group commit as the rating update
+                    w_f = 'guid' if (winner.guid and len(winner.guid) > 10) else 'clean_name'
+                    l_f = 'guid' if (loser.guid and len(loser.guid) > 10) else 'clean_name'
+
+                    # 1. Update individual round stats
+                    self.db.execute(f"UPDATE players SET total_rounds_won = total_rounds_won + 1 WHERE {w_f}=?", (winner.guid if 'guid' in w_f else winner.clean_name,))
+                    self.db.execute(f"UPDATE players SET total_rounds_lost = total_rounds_lost + 1 WHERE {l_f}=?", (loser.guid if 'guid' in l_f else loser.clean_name,))
+
+                    # 2. Announce round results
+                    self.send_rcon(f'say "^5[MATCH] ^2{winner.clean_name} ^7(^2{winner.match_score}^7/^3{limit}^7) vs ^2{loser.clean_name} ^7(^1{loser.match_score}^7/^3{limit}^7)"', PRIORITY_MATCH)
+
+                    # 3. Check for Match Finalization (The Series Win)
+                    if winner.match_score >= limit:
+                        self.send_rcon(f'say "^5[MATCH] ^2{winner.clean_name} ^7wins the Match ^2{winner.match_score} ^7- ^1{loser.match_score}!"', PRIORITY_MATCH)
+
+                        # Increment the !fttop counter
+                        self.db.execute(f"UPDATE players SET matches_won = matches_won + 1 WHERE {w_f}=?", (winner.guid if 'guid' in w_f else winner.clean_name,))
+                        winner.matches_won += 1
+                        self.update_leaderboard(winner, "matches_won", winner.matches_won)
+
+                        # Reset match state
+                        winner.match_score = 0
+                        loser.match_score = 0
+                        winner.is_formal_match = False
+                        loser.is_formal_match = False
                         winner.opponent = None
                         loser.opponent = None
-                        self.send_rcon(f'say "^5[DUEL] ^7{winner.clean_name} ^7wins! ^2{int(winner.rating)} ^7| ^7{loser.clean_name} ^7dropped to ^1{int(loser.rating)}"')
-                        
-            except Exception as e:
-                print(f"[PARSER ERROR] m_end failed: {e}")
-            return
+                else:
+                    # Standard Private Duel logic (Non-formal)
+                    winner.opponent = None
+                    loser.opponent = None
+                    self.send_rcon(f'say "^5[DUEL] ^7{winner.clean_name} ^7wins! ^2{int(winner.rating)} ^7| ^7{loser.clean_name} ^7dropped to ^1{int(loser.rating)}"', PRIORITY_MATCH)
 
+        except Exception as e:
+            print(f"[PARSER ERROR] m_end failed: {e}")
+
+    def handle_disconnect(self, line):
         # 5. DISCONNECT CLEANUP
-        elif "ClientDisconnect:" in line:
-            m = re.search(r'ClientDisconnect:\s*(\d+)', line)
-            if m:
-                t_sid = int(m.group(1))
-                t_p = next((x for x in self.players if x.id == t_sid), None)
-                
-                if t_p:
-                    # --- THE FORFEIT LOGIC ---
-                    if t_p.opponent:
-                        opp = t_p.opponent
-                        self.send_rcon(f'say "^5[MATCH] ^2{opp.name} ^7wins! ^2{t_p.name} ^7left the server."')
-                        
-                        # Full Reset for the opponent who stayed
-                        opp.opponent = None
-                        opp.match_score = 0
-                        opp.is_formal_match = False # Reset the match flag
-                        opp.match_limit = 5         # Reset limit to default
-
-                    # --- CLEAR ACTIVE DUEL GATE ---
-                    # Ensures the duel key is removed so the opponent can duel again immediately
-                    self.active_duels = {key for key in self.active_duels if t_p.clean_name not in key}
-                    
-                    # --- SESSION REMOVAL ---
-                    self.players = [p for p in self.players if p.id != t_sid]
+        m = DISCONNECT_PATTERN.search(line)
+        if not m:
+            return
+        t_sid = int(m.group(1))
+        t_p = self.players.by_slot(t_sid)
+
+        if t_p:
+            # --- THE FORFEIT LOGIC ---
+            if t_p.opponent:
+                opp = t_p.opponent
+                self.send_rcon(f'say "^5[MATCH] ^2{opp.name} ^7wins! ^2{t_p.name} ^7left the server."', PRIORITY_MATCH)
+
+                # Full Reset for the opponent who stayed
+                opp.opponent = None
+                opp.match_score = 0
+                opp.is_formal_match = False # Reset the match flag
+                opp.match_limit = 5         # Reset limit to default
+
+            # --- CLEAR ACTIVE DUEL GATE ---
+            # Ensures the duel key is removed so the opponent can duel again immediately
+            self.active_duels = {key for key in self.active_duels if t_p.clean_name not in key}
+
+            # --- SESSION REMOVAL ---
+            self.players.remove(t_p)
 
+    def handle_smod_line(self, line):
         # --- SMOD ADMIN PARSER ---
-        if "SMOD smsay:" in line:
-            # DEBUG 1: Verify the script picked up the SMOD trigger
-            # print(f"[DEBUG] SMOD line detected: {line.strip()}") 
+        # Regex tailored to your debug log: handles the "):" without a space
+        smod_match = SMOD_PATTERN.search(line)
 
-            # Regex tailored to your debug log: handles the "):" without a space
-            smod_match = re.search(r'SMOD smsay:\s+(.*?)\s+\(adminID:\s+(\d+)\).*?\):\s*(.*)$', line)
-            
-            if smod_match:
-                admin_raw_name = smod_match.group(1).strip()
-                admin_id = smod_match.group(2)
-                full_message = smod_match.group(3).strip()
-                
-                # DEBUG 2: Verify the regex captured the correct groups
-                # print(f"[DEBUG] Regex Match Success! Admin: {admin_raw_name}, ID: {admin_id}, Msg: {full_message}")
-                
-                self.handle_smod_command(admin_raw_name, admin_id, full_message)
-            else:
-                # DEBUG 3: If the line was seen but regex failed
-                # print(f"[DEBUG] Regex FAILED to match SMOD line format.")
-                pass
+        if smod_match:
+            admin_raw_name = smod_match.group(1).strip()
+            admin_id = smod_match.group(2)
+            full_message = smod_match.group(3).strip()
+
+            self.handle_smod_command(admin_raw_name, admin_id, full_message)
 
+    def handle_chat_line(self, line):
         # --- UNIFIED CHAT BLOCK (SAY & TELL) ---
-        elif "say:" in line.lower() or "tell:" in line.lower():
-            if "say: server:" in line.lower() or "say: console:" in line.lower():
-                return
+        lower = line.lower()
+        if "say: server:" in lower or "say: console:" in lower:
+            return
 
-            p = None 
-            log_sid = -1
-            message = ""
+        p = None
+        log_sid = -1
+        message = ""
 
-            try:
-                # 1. Capture SID accurately (the digits right before : say:)
-                sid_match = re.search(r'(\d+):\s*(?:say|tell):', line, re.IGNORECASE)
-                if sid_match:
-                    log_sid = int(sid_match.group(1))
-                    p = self.slot_map.get(log_sid)
-
-                # 2. Extract Message
-                msg_match = re.search(r':\s*"(.*)"\s*$', line)
-                if msg_match:
-                    message = msg_match.group(1).strip()
-
-                # 3. RECOVERY (The logic that must work)
-                if not p:
-                    # Capture name between 'say:' and the next ':'
-                    name_recovery = re.search(r'(?:say|tell):\s*(.*?)\s*:', line, re.IGNORECASE)
-                    if name_recovery:
-                        raw_name = name_recovery.group(1).strip()
-                        clean_log_name = normalize(raw_name)
-                        
-                        # Loop through your 18 players
+        try:
+            # 1. Capture SID accurately (the digits right before : say:)
+            sid_match = CHAT_SID_PATTERN.search(line)
+            if sid_match:
+                log_sid = int(sid_match.group(1))
+                p = self.players.by_slot(log_sid)
+
+            # 2. Extract Message
+            msg_match = CHAT_MESSAGE_PATTERN.search(line)
+            if msg_match:
+                message = msg_match.group(1).strip()
+
+            # 3. RECOVERY (The logic that must work)
+            if not p:
+                # Capture name between 'say:' and the next ':'
+                name_recovery = CHAT_NAME_PATTERN.search(line)
+                if name_recovery:
+                    raw_name = name_recovery.group(1).strip()
+                    clean_log_name = name_key(raw_name)
+
+                    # Try Exact Match first
+                    p = self.players.by_name(clean_log_name)
+                    if not p and len(clean_log_name) > 3: # Safety to prevent matching 'a' to 'admin'
+                        # Try Fuzzy Match (if one is inside the other)
+                        # This fixes cases where a stray symbol survived normalization
                         for player_obj in self.players:
-                            # Try Exact Match first
-                            if player_obj.clean_name == clean_log_name:
+                            if clean_log_name in player_obj.clean_name or player_obj.clean_name in clean_log_name:
                                 p = player_obj
                                 break
-                            # Try Fuzzy Match (if one is inside the other)
-                            # This fixes cases where a stray symbol survived normalization
-                            elif clean_log_name in player_obj.clean_name or player_obj.clean_name in clean_log_name:
-                                if len(clean_log_name) > 3: # Safety to prevent matching 'a' to 'admin'
-                                    p = player_obj
-                                    break
-                        
-                        if p and log_sid != -1:
-                            print(f"[RECOVERY] Success! {p.clean_name} mapped to Slot {log_sid}")
-                            p.id = log_sid
-                            self.slot_map[log_sid] = p
-
-                # 4. EXECUTION
-                if p and message:
-                    self.handle_chat(p, message)
-                elif "console" not in line.lower() and "server:" not in line.lower():
-                    # This print will now show you the 'Normalized' attempt
-                    failed_raw = line.split('say: ')[-1].split(':')[0] if "say:" in line else "Unknown"
-                    print(f"[PARSER] No match for '{failed_raw}' (Normalized: '{normalize(failed_raw)}'). Count: {len(self.players)}")
-                    self.force_sync_players()
 
-            except Exception as e:
-                print(f"[PARSER ERROR] Chat failed: {e}")
-            return
+                    if p and log_sid != -1:
+                        print(f"[RECOVERY] Success! {p.clean_name} mapped to Slot {log_sid}")
+                        self.players.set_slot(p, log_sid)
+
+            # 4. EXECUTION
+            if p and message:
+                self.handle_chat(p, message)
+            elif "console" not in lower and "server:" not in lower:
+                # This print will now show you the 'Normalized' attempt
+                failed_raw = line.split('say: ')[-1].split(':')[0] if "say:" in line else "Unknown"
+                print(f"[PARSER] No match for '{failed_raw}' (Normalized: '{name_key(failed_raw)}'). Count: {len(self.players)}")
+                self.force_sync_players()
+
+        except Exception as e:
+            print(f"[PARSER ERROR] Chat failed: {e}")
 
     def sync_player(self, sid, name, guid):
         valid_guid = guid and guid != "0" and len(guid) > 10
         current_name = name
-        current_clean = normalize(name)
+        current_clean = name_key(name)
         
         rating, rd, role, group = 1500, 350, "MEMBER", "DEFAULT"
         clan = "NONE"
         
         # 1. Database Lookup (Same as yours)
-        with sqlite3.connect(self.db_filename) as conn:
-            cursor = conn.cursor()
-            data = None
-            if valid_guid:
-                cursor.execute("SELECT duel_rating, rating_deviation, clan_tag, clan_role, clan_group FROM players WHERE guid = ?", (guid,))
-                data = cursor.fetchone()
-
-            if not data:
-                cursor.execute("SELECT duel_rating, rating_deviation, clan_tag, clan_role, clan_group FROM players WHERE clean_name = ?", (current_clean,))
-                data = cursor.fetchone()
-            
-            if data:
-                rating, rd, db_clan, role, group = data
-            else:
-                conn.execute("""INSERT OR IGNORE INTO players (guid, name, clean_name, clan_tag, duel_rating, rating_deviation) 
-                             VALUES (?, ?, ?, ?, ?, ?)""", 
-                             (guid if valid_guid else f"TEMP_{current_clean}", current_name, current_clean, clan, rating, rd))
-            conn.commit()
+        data = None
+        columns = "duel_rating, rating_deviation, clan_tag, clan_role, clan_group, guid, name, matches_won, tournament_wins"
+        if valid_guid:
+            data = self.db.query_one(f"SELECT {columns} FROM players WHERE guid = ?", (guid,))
+
+        if not data:
+            data = self.db.query_one(f"SELECT {columns} FROM players WHERE clean_name = ?", (current_clean,))
+
+        if data:
+            rating, rd, db_clan, role, group, row_guid, row_name, matches_won, tournament_wins = data
+        else:
+            row_guid, row_name, matches_won, tournament_wins = guid if valid_guid else f"TEMP_{current_clean}", current_name, 0, 0
+            self.db.execute("""INSERT OR IGNORE INTO players (guid, name, clean_name, clan_tag, duel_rating, rating_deviation) 
+                            VALUES (?, ?, ?, ?, ?, ?)""", 
+                            (row_guid, current_name, current_clean, clan, rating, rd))
+            self.db.executemany("INSERT OR IGNORE INTO name_trigrams (gram, guid) VALUES (?, ?)",
+                                [(g, row_guid) for g in trigrams(current_clean)])
+            self.leaderboards["duel_rating"].update(row_guid, row_name, rating)
 
         # 2. Memory Management - Find by Name
-        existing_p = next((p for p in self.players if p.clean_name == current_clean), None)
+        existing_p = self.players.by_name(current_clean)
 
         if existing_p:
             # IMPORTANT: Update ID and stats but DON'T touch Match Flags
-            existing_p.id = sid
+            self.players.set_slot(existing_p, sid)
             existing_p.rating = rating
             existing_p.rd = rd
-            if sid != -1:
-                self.slot_map[sid] = existing_p
+            existing_p.db_guid, existing_p.db_name = row_guid, row_name
+            existing_p.matches_won, existing_p.tournament_wins = matches_won or 0, tournament_wins or 0
             return existing_p
 
         # 3. New Player logic - Only clear the slot if the NAMES don't match
         if sid != -1:
             # If someone else is in this slot, remove ONLY them
-            self.players = [p for p in self.players if p.id != sid or p.clean_name == current_clean]
+            previous = self.players.by_slot(sid)
+            if previous:
+                self.players.remove(previous)
         
         new_player = Player(sid, name, guid, rating, rd, clan=clan, role=role, group=group)
         # Initialize flags on new player just in case
         new_player.is_formal_pending = False 
+        new_player.db_guid, new_player.db_name = row_guid, row_name
+        new_player.matches_won, new_player.tournament_wins = matches_won or 0, tournament_wins or 0
         
-        self.players.append(new_player)
-        if sid != -1:
-            self.slot_map[sid] = new_player
+        self.players.add(new_player)
             
         return new_player
 
-    def send_rcon(self, command):
-        try:
-            client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            client.settimeout(2.0) # Increased timeout slightly
-            packet = b'\xff\xff\xff\xff' + f'rcon "{self.settings["rcon"]}" {command}'.encode()
-            client.sendto(packet, (self.settings["ip"], int(self.settings["port"])))
-            
-            if command == "status":
-                data, addr = client.recvfrom(8192)
-                # Try latin-1 if utf-8 feels 'off' - it's more permissive with symbols
-                response = data.decode('latin-1', errors='ignore')
-                
-                if response.startswith('\xff\xff\xff\xffprint'):
-                    response = response[10:]
-                return response
-            
-            client.close()
-            return ""
-        except Exception as e:
-            print(f"RCON Error: {e}")
-            return None
+    def send_rcon(self, command, priority=PRIORITY_NORMAL):
+        """Queues a command for the RCON sender. Fire-and-forget; see query_rcon for replies."""
+        self.rcon.send(command, priority)
+        return ""
+
+    def send_rcon_many(self, commands, priority=PRIORITY_NORMAL):
+        """Queues a block of commands together so the sender can pack them into as few packets as fit."""
+        self.rcon.send_many(commands, priority)
+        return ""
+
+    def query_rcon(self, command):
+        return self.rcon.query(command)
+
+class ServerCluster:
+    """Several game servers in one process, one [SERVER:name] section each. Every server gets its
+    own MBIIDuelPlugin (log tailer, RCON client, players, lobby and tournament state); the first
+    one owns the database writer, read pool, leaderboards, timer wheel and metrics and the rest
+    share them. Looks like a plugin to the restart loop below."""
+    def __init__(self, sections):
+        self.servers = []
+        for name, settings in sections:
+            shared = self.servers[0] if self.servers else None
+            self.servers.append(MBIIDuelPlugin(settings=settings, shared=shared, name=name))
+        self.servers[0].servers = self.servers
+
+    @classmethod
+    def from_config(cls, config_file=None):
+        """A cluster if the config has [SERVER:name] sections, else None. Each section is laid over
+        [SETTINGS], so shared options (db_*, metrics_*, core_loop, ...) are set there once."""
+        config_file = config_file or (sys.argv[1] if len(sys.argv) > 1 else 'duel.cfg')
+        config = configparser.ConfigParser()
+        config.read(config_file)
+        base = dict(config['SETTINGS']) if config.has_section('SETTINGS') else {}
+        sections = [(section.split(':', 1)[1].strip(), dict(base, **dict(config[section])))
+                    for section in config.sections() if section.upper().startswith('SERVER:')]
+        return cls(sections) if sections else None
+
+    @property
+    def db(self):
+        return self.servers[0].db
+
+    @property
+    def players(self):
+        return [p for server in self.servers for p in server.players]
+
+    def run(self):
+        for server in self.servers:
+            server.open_log()
+        self.servers[0].start_background()
+        if self.servers[0].async_mode:
+            asyncio.run(self.run_async())
+            return
+        for server in self.servers[1:]:
+            threading.Thread(target=server.dispatch, name=f"dispatch-{server.name}", daemon=True).start()
+        # The first dispatcher stays on the main thread, where Ctrl+C lands
+        self.servers[0].dispatch()
+
+    async def run_async(self):
+        await asyncio.gather(*(server.run_async() for server in self.servers))
+
+    def shutdown(self):
+        # The owner goes last, so its writer flushes whatever the other servers queued
+        for server in reversed(self.servers):
+            server.shutdown()
 
 if __name__ == "__main__":
 
     while True:
+        plugin = None
         try:
-            # Initialize and run the plugin
-            plugin = MBIIDuelPlugin()
+            # Initialize and run the plugin ([SERVER:name] sections run several servers at once)
+            plugin = ServerCluster.from_config() or MBIIDuelPlugin()
             plugin.run()
             
         except KeyboardInterrupt:
             print("\n[SYSTEM] Manual shutdown. Performing final save...")
             # We don't need a massive loop here because ratings are saved 
-            # mid-match, but we ensure the DB connection is closed.
+            # mid-match, but we commit whatever is still queued on the writer.
+            if plugin:
+                plugin.shutdown()
             sys.exit(0)
             
         except Exception as e:
@@ -1413,16 +3599,11 @@ if __name__ == "__main__":
             print("Attempting emergency safety save...")
             
             try:
-                # In your duel script, we want to make sure current ratings 
-                # for all active players are flushed to the DB.
-                with sqlite3.connect(plugin.db_filename) as conn:
-                    for p in plugin.players:
-                        if p.guid != "0":
-                            conn.execute("""UPDATE players SET duel_rating=?, 
-                                         rating_deviation=? WHERE guid=?""", 
-                                         (p.rating, p.rd, p.guid))
-                    conn.commit()
-                print("Emergency rating save successful.")
+                # Ratings are committed as each duel ends. Writing our copies back here could undo
+                # an update another process sharing duel.db made since, so only flush the queue
+                # and stop this instance's writer before the next one opens its own.
+                plugin.shutdown()
+                print("Emergency save successful.")
             except Exception as save_error:
                 print(f"Emergency save failed: {save_error}")
             
@@ -0,0 +1,420 @@
+"""Microbenchmarks for the duel plugin's hot paths.
+
+Usage: python duel_bench.py <benchmark> [options]
+Run with -h to list the benchmarks.
+"""
+import argparse
+import contextlib
+import os
+import math
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+
+import duel
+import duel_rate
+
+# Names as they show up in MBII logs: color codes, clan brackets, spaces and the odd accent
+SAMPLE_NAMES = [
+    "^1Dark^7Lord", "Cheems^3une Miku", "{JEDI}Valzhar", "Obi^4Wan", "^5[501st]^7Rex", "^0Darth ^1Maul",
+    "Padawan", "^2=SiTH=^7Kylo", "Ahsoka^6<3", "^3Qui-Gon^7 Jinn", "[TCW]Cody", "^7x^1X^7x_Revan_x^1X^7x",
+    "Z^2o\u00eb", "Ren\u00e9^7", "^4Mace ^5Windu", "Grievous", "^1[SITH]^7 Vader", "Padm\u00e9",
+    "^6Bo-Katan", "Boba^3Fett", "Echo", "^2Yoda^7", "^1R^22^3D^42", "Anakin  Skywalker",
+]
+
+def legacy_normalize(name):
+    # normalize() as it was before name_key: two uncompiled regex passes per call
+    if not name: return ""
+    name = re.sub(r'\^.', '', name)
+    name = name.lower().strip()
+    name = re.sub(r'[^a-z0-9]', '', name)
+    return name
+
+def names_from_log(path):
+    """Every raw player name in a server log, in the order (and as often as) the plugin sees them."""
+    patterns = [duel.USERINFO_PATTERN, duel.DUEL_START_PATTERN, duel.DUEL_END_PATTERN, duel.CHAT_NAME_PATTERN]
+    names = []
+    # Decoded line by line like the plugin's tailer does, so accented names match what it sees
+    with open(path, "rb") as f:
+        for line in map(duel.decode_line, f):
+            for pattern in patterns:
+                m = pattern.search(line)
+                if m:
+                    names.extend(g.strip() for g in (m.groups()[1:2] if pattern is duel.USERINFO_PATTERN else m.groups()))
+                    break
+    return names
+
+def make_players(count):
+    players = []
+    for sid in range(count):
+        name = f"^{sid % 10}Player^7Number{sid:02d}"
+        guid = f"{sid:032X}"
+        players.append(duel.Player(sid, name, guid))
+    return players
+
+def per_op(stmt, number):
+    # Best of 5 runs, in nanoseconds per call
+    best = min(timeit.repeat(stmt, number=number, repeat=5))
+    return best / number * 1e9
+
+def bench_registry(args):
+    """Per-event player lookup cost: linear scans of a list vs PlayerRegistry indexes."""
+    print(f"{'players':>8} {'lookup':<22} {'list scan':>12} {'registry':>12} {'speedup':>8}")
+    for count in args.players:
+        players = make_players(count)
+        registry = duel.PlayerRegistry()
+        for p in players:
+            registry.add(p)
+
+        names = [p.clean_name for p in players]
+        slots = [p.id for p in players]
+        guids = [p.guid for p in players]
+        rounds = max(1, args.number // count)
+
+        def list_name():
+            for n in names:
+                next((x for x in players if x.clean_name == n), None)
+        def reg_name():
+            for n in names:
+                registry.by_name(n)
+
+        def list_slot():
+            for s in slots:
+                next((x for x in players if x.id == s), None)
+        def reg_slot():
+            for s in slots:
+                registry.by_slot(s)
+
+        def list_guid():
+            for g in guids:
+                for x in players:
+                    if x.guid == g:
+                        break
+        def reg_guid():
+            for g in guids:
+                registry.by_guid(g)
+
+        # ClientDisconnect followed by the same player coming back (what a map change does per slot)
+        def list_reconnect():
+            current = list(players)
+            for p in players:
+                current = [x for x in current if x.id != p.id]
+                current.append(p)
+        def reg_reconnect():
+            for p in players:
+                registry.remove(p)
+                registry.add(p)
+
+        # ClientUserinfoChanged moving a player between slots
+        def list_move():
+            slot_map = {}
+            for p in players:
+                x = next((x for x in players if x.clean_name == p.clean_name), None)
+                x.id = p.id
+                slot_map[p.id] = x
+        def reg_move():
+            for p in players:
+                registry.set_slot(registry.by_name(p.clean_name), p.id)
+
+        cases = [("DuelStart/End by name", list_name, reg_name),
+                 ("chat by slot", list_slot, reg_slot),
+                 ("GUID capture", list_guid, reg_guid),
+                 ("disconnect+rejoin", list_reconnect, reg_reconnect),
+                 ("userinfo slot update", list_move, reg_move)]
+        for label, old, new in cases:
+            old_ns = per_op(old, rounds) / count
+            new_ns = per_op(new, rounds) / count
+            print(f"{count:>8} {label:<22} {old_ns:>10.0f}ns {new_ns:>10.0f}ns {old_ns / new_ns:>7.1f}x")
+
+def bench_search(args):
+    """Partial-name search: online registry and offline database, against the old linear scans."""
+    rng = random.Random(1)
+    def random_name():
+        letters = "".join(rng.choice("bcdfghjklmnprstvwz") + rng.choice("aeiouy") for _ in range(rng.randint(2, 5)))
+        return letters + (str(rng.randint(0, 999)) if rng.random() < 0.3 else "")
+
+    names = [random_name() for _ in range(max(args.players))]
+    # Whole names, prefixes, middles and a miss, like people type after !rank or !dduel
+    queries = [names[0], names[1][:2], names[2][:4], names[3][1:5], names[4][2:], "qqq"]
+    print(f"{'players':>8} {'search':<10} {'first hit':>12} {'ranked scan':>12} {'plugin':>12}")
+    for count in args.players:
+        players = [duel.Player(sid, name, "0") for sid, name in enumerate(names[:count])]
+        registry = duel.PlayerRegistry()
+        for p in players:
+            registry.add(p)
+        # The old lookup returned the first substring hit, not the best one
+        def first_hit():
+            for q in queries:
+                next((x for x in players if q in x.clean_name), None)
+        def ranked_scan():
+            for q in queries:
+                found = [x for x in players if q in x.clean_name]
+                found.sort(key=lambda x: duel.match_rank(q, x.clean_name))
+        def plugin():
+            for q in queries:
+                registry.find(q)
+        timings = [per_op(f, 2000) / len(queries) for f in (first_hit, ranked_scan, plugin)]
+        print(f"{count:>8} {'online':<10} " + " ".join(f"{t:>10.0f}ns" for t in timings))
+
+    # Offline: a throwaway database built with the plugin's own schema
+    folder = tempfile.mkdtemp()
+    db_file = os.path.join(folder, "bench.db")
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE players (guid TEXT PRIMARY KEY, name TEXT, clean_name TEXT)")
+    conn.execute("CREATE INDEX idx_clean_name ON players(clean_name)")
+    conn.execute("CREATE TABLE name_trigrams (gram TEXT, guid TEXT, PRIMARY KEY (gram, guid)) WITHOUT ROWID")
+    rows = {f"TEMP_{n}": n for n in names}
+    while len(rows) < args.offline:
+        name = random_name()
+        rows[f"TEMP_{name}"] = name
+    conn.executemany("INSERT INTO players VALUES (?, ?, ?)", [(g, n, n) for g, n in rows.items()])
+    conn.executemany("INSERT INTO name_trigrams VALUES (?, ?)", [(t, g) for g, n in rows.items() for t in duel.trigrams(n)])
+    conn.commit()
+
+    def like():
+        for q in queries:
+            found = conn.execute("SELECT guid, name, clean_name FROM players WHERE clean_name LIKE ?", (f"%{q}%",)).fetchall()
+            found.sort(key=lambda r: duel.match_rank(q, r[2]))
+    def trigram():
+        for q in queries:
+            duel.search_player_names(conn, q, limit=1)
+    print(f"{args.offline:>8} {'offline':<10} {'':>12} {per_op(like, 5) / len(queries) / 1000:>10.0f}us "
+          f"{per_op(trigram, 5) / len(queries) / 1000:>10.0f}us")
+    conn.close()
+    shutil.rmtree(folder)
+
+def bench_names(args):
+    """name_key against the old normalize(), on names from a server log or a built-in sample."""
+    if args.log:
+        stream = names_from_log(args.log)
+        print(f"{len(stream)} names ({len(set(stream))} distinct) from {args.log}")
+    else:
+        rng = random.Random(1)
+        # Repeats like a real log: the same few players chat, duel and respawn over and over
+        stream = [rng.choice(SAMPLE_NAMES) for _ in range(2000)]
+        print(f"{len(stream)} names from the built-in sample of {len(SAMPLE_NAMES)}")
+    if not stream:
+        print("No names found.")
+        return
+
+    def legacy():
+        for n in stream:
+            legacy_normalize(n)
+    uncached = duel.name_key.__wrapped__
+    def cold():
+        for n in stream:
+            uncached(n)
+    def cached():
+        for n in stream:
+            duel.name_key(n)
+
+    print(f"{'function':<24} {'per name':>10}")
+    rows = [(label, per_op(func, 5) / len(stream))
+            for label, func in (("normalize (old)", legacy), ("name_key, no cache", cold), ("name_key", cached))]
+    for label, ns in rows:
+        print(f"{label:<24} {ns:>8.0f}ns {rows[0][1] / ns:>6.1f}x")
+
+    differ = sorted({n for n in stream if legacy_normalize(n) != duel.name_key(n)})
+    print(f"{len(differ)} distinct names get a different key (accent/width folding):")
+    for n in differ[:10]:
+        print(f"  {n!r}: {legacy_normalize(n)!r} -> {duel.name_key(n)!r}")
+
+def bench_rate(args):
+    """Batch Glicko-2 recomputation (duel_rate.py) over a synthetic duel_results ledger."""
+    if duel_rate.np is None:
+        print("duel_rate.py needs NumPy: pip install numpy")
+        return
+    folder = tempfile.mkdtemp()
+    db_file = os.path.join(folder, "bench.db")
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE players (guid TEXT PRIMARY KEY, duel_rating REAL, rating_deviation REAL, volatility REAL)")
+    conn.execute("""CREATE TABLE duel_results (id INTEGER PRIMARY KEY, ts REAL, winner_guid TEXT, loser_guid TEXT,
+                    winner_rating_before REAL, winner_rd_before REAL, loser_rating_before REAL, loser_rd_before REAL)""")
+    conn.execute("CREATE INDEX idx_results_ts ON duel_results(ts)")
+    guids = [f"{i:032X}" for i in range(args.players)]
+    conn.executemany("INSERT INTO players VALUES (?, 1500, 350, 0.06)", [(g,) for g in guids])
+
+    # Hidden skill decides who wins, so the ratings have something to converge to
+    rng = random.Random(1)
+    skill = [rng.gauss(0, 1) for _ in guids]
+    span = args.days * 86400
+    def duels():
+        for i in range(args.duels):
+            a, b = rng.randrange(args.players), rng.randrange(args.players - 1)
+            b += b >= a
+            if rng.random() > 1 / (1 + 10 ** (skill[b] - skill[a])):
+                a, b = b, a
+            yield (i * span / args.duels, guids[a], guids[b], 1500, 350, 1500, 350)
+    started = time.perf_counter()
+    conn.executemany("INSERT INTO duel_results (ts, winner_guid, loser_guid, winner_rating_before, winner_rd_before, "
+                     "loser_rating_before, loser_rd_before) VALUES (?, ?, ?, ?, ?, ?, ?)", duels())
+    conn.commit()
+    conn.close()
+    print(f"{args.duels} duels between {args.players} players over {args.days} days "
+          f"(built in {time.perf_counter() - started:.1f}s)")
+
+    duel_rate.main([db_file, "--workers", str(args.workers)])
+    shutil.rmtree(folder)
+
+def bench_inflate(args):
+    """Periodic RD inflation: the plugin's single UPDATE against a row-by-row Python pass."""
+    folder = tempfile.mkdtemp()
+    db_file = os.path.join(folder, "bench.db")
+    conn = sqlite3.connect(db_file)
+    conn.execute("""CREATE TABLE players (guid TEXT PRIMARY KEY, duel_rating REAL DEFAULT 1500, rating_deviation REAL DEFAULT 350,
+                    volatility REAL DEFAULT 0.06, last_active REAL)""")
+    rng = random.Random(1)
+    now = time.time()
+    # Most players drift away: a third were seen this week, the rest any time in the last two years
+    def players():
+        for i in range(args.players):
+            seen = now - rng.uniform(0, 7 if rng.random() < 0.33 else 730) * 86400
+            yield (f"{i:032X}", rng.uniform(30, 350), rng.uniform(0.04, 0.08), seen)
+    conn.executemany("INSERT INTO players (guid, rating_deviation, volatility, last_active) VALUES (?, ?, ?, ?)", players())
+    conn.commit()
+    conn.close()
+    copy = os.path.join(folder, "copy.db")
+    shutil.copy(db_file, copy)
+    params = {"periods": 1, "period": 86400, "until": now}
+
+    def set_based():
+        conn = sqlite3.connect(db_file)
+        duel.ensure_sqrt(conn)
+        with conn:
+            changed = conn.execute(duel.RD_INFLATION_SQL, params).rowcount
+        conn.close()
+        return changed
+    def row_by_row():
+        conn = sqlite3.connect(copy)
+        rows = conn.execute("SELECT guid, rating_deviation, volatility, last_active FROM players").fetchall()
+        updates = []
+        for guid, rd, vol, seen in rows:
+            idle = min(params["periods"], int((params["until"] - (seen or 0)) // params["period"]))
+            if idle >= 1 and rd < 350:
+                updates.append((min(350, math.sqrt(rd * rd + idle * (173.7178 * vol) ** 2)), guid))
+        with conn:
+            conn.executemany("UPDATE players SET rating_deviation=? WHERE guid=?", updates)
+        conn.close()
+        return len(updates)
+
+    print(f"{args.players} players, one rating period of inflation")
+    for label, func in (("row by row", row_by_row), ("set-based UPDATE", set_based)):
+        started = time.perf_counter()
+        changed = func()
+        print(f"{label:<18} {changed:>9} rows {time.perf_counter() - started:>8.2f}s")
+    shutil.rmtree(folder)
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+def bench_replay(args):
+    """Replays a server log through parse_line: lines/sec, latency per event type and DB writes."""
+    folder = tempfile.mkdtemp()
+    settings = {"ip": "127.0.0.1", "port": "29070", "rcon": "replay", "logname": args.log,
+                "db_file": os.path.join(folder, "replay.db"), "db_commit_ms": str(args.commit_ms)}
+    plugin = duel.MBIIDuelPlugin(settings=settings)
+
+    # Record RCON instead of sending it; status queries come back empty like an unreachable server
+    sent = []
+    plugin.send_rcon = lambda command, priority=duel.PRIORITY_NORMAL: sent.append(command)
+    plugin.send_rcon_many = lambda commands, priority=duel.PRIORITY_NORMAL: sent.extend(commands)
+    plugin.query_rcon = lambda command: ""
+    writes, jobs = [0], [0]
+    execute, executemany, transact = plugin.db.execute, plugin.db.executemany, plugin.db.transact
+    def counted_execute(sql, params=()):
+        writes[0] += 1
+        execute(sql, params)
+    def counted_executemany(sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        writes[0] += len(seq_of_params)
+        executemany(sql, seq_of_params)
+    def counted_transact(func, *args):
+        jobs[0] += 1
+        return transact(func, *args)
+    plugin.db.execute, plugin.db.executemany, plugin.db.transact = counted_execute, counted_executemany, counted_transact
+
+    # Same decoding as the live tailer: UTF-8 lines, Latin-1 for lines that aren't valid UTF-8
+    with open(args.log, "rb") as f:
+        lines = [line for line in (duel.decode_line(raw).strip() for raw in f) if line]
+    timings = {}
+    clock = time.perf_counter
+    # The plugin's console output still gets formatted, it just doesn't scroll the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        started = clock()
+        for _ in range(args.repeat):
+            for line in lines:
+                t0 = clock()
+                event = duel.classify_line(line)
+                plugin.parse_line(line)
+                timings.setdefault(event or "ignored", []).append(clock() - t0)
+        parsed = clock() - started
+        # Writes are queued; count the time it takes the writer to commit them as part of the run
+        plugin.db.flush()
+        total = clock() - started
+
+    count = len(lines) * args.repeat
+    print(f"{count} lines from {args.log} in {parsed:.3f}s: {count / parsed:,.0f} lines/sec "
+          f"({count / total:,.0f} including the final DB flush)")
+    print(f"{'event':<12} {'lines':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for event, values in sorted(timings.items(), key=lambda kv: -sum(kv[1])):
+        values.sort()
+        cells = " ".join(f"{percentile(values, pct) * 1e6:>7.1f}us" for pct in (50, 95, 99, 100))
+        print(f"{event:<12} {len(values):>7} {cells}")
+    print(f"DB: {writes[0]} writes queued, {jobs[0]} transact jobs ({plugin.db.jobs} run), "
+          f"{plugin.db.statements} statements in {plugin.db.commits} commits, {plugin.db.errors} errors")
+    print(f"RCON: {len(sent)} commands recorded")
+    if args.show_rcon:
+        for command in sent[:args.show_rcon]:
+            print(f"  {command}")
+    plugin.shutdown()
+    shutil.rmtree(folder)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Duel plugin microbenchmarks")
+    sub = parser.add_subparsers(dest="benchmark")
+    sub.required = True
+
+    reg = sub.add_parser("registry", help=bench_registry.__doc__)
+    reg.add_argument("--players", type=int, nargs="+", default=[32, 64], help="player counts to test (default: 32 64)")
+    reg.add_argument("--number", type=int, default=20000, help="lookups per timing run")
+    reg.set_defaults(func=bench_registry)
+
+    search = sub.add_parser("search", help=bench_search.__doc__)
+    search.add_argument("--players", type=int, nargs="+", default=[32, 64], help="online player counts (default: 32 64)")
+    search.add_argument("--offline", type=int, default=50000, help="players in the offline database")
+    search.set_defaults(func=bench_search)
+
+    names = sub.add_parser("names", help=bench_names.__doc__)
+    names.add_argument("--log", help="server log to take names from (default: built-in sample)")
+    names.set_defaults(func=bench_names)
+
+    rate = sub.add_parser("rate", help=bench_rate.__doc__)
+    rate.add_argument("--duels", type=int, default=1000000, help="duels in the ledger (default: 1000000)")
+    rate.add_argument("--players", type=int, default=20000, help="distinct players (default: 20000)")
+    rate.add_argument("--days", type=int, default=365, help="days the duels are spread over, one rating period each")
+    rate.add_argument("--workers", type=int, default=1, help="passed on to duel_rate.py")
+    rate.set_defaults(func=bench_rate)
+
+    inflate = sub.add_parser("inflate", help=bench_inflate.__doc__)
+    inflate.add_argument("--players", type=int, default=1000000, help="players in the database (default: 1000000)")
+    inflate.set_defaults(func=bench_inflate)
+
+    replay = sub.add_parser("replay", help=bench_replay.__doc__)
+    replay.add_argument("--log", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples", "synthetic_server.log"),
+                        help="server log to replay (default: samples/synthetic_server.log)")
+    replay.add_argument("--repeat", type=int, default=1, help="replay the log this many times")
+    replay.add_argument("--commit-ms", type=float, default=5, help="db_commit_ms for the replay (default: 5)")
+    replay.add_argument("--verbose", action="store_true", help="show the plugin's console output")
+    replay.add_argument("--show-rcon", type=int, default=0, metavar="N", help="print the first N recorded RCON commands")
+    replay.set_defaults(func=bench_replay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
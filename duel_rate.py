@@ -0,0 +1,248 @@
+"""Offline Glicko-2 rating-period engine for duel.db.
+
+Replays the duel_results ledger in rating periods and recomputes every player's rating,
+RD and volatility, one vectorized pass per period. Stop the plugin before writing the
+results back: it keeps ratings in memory and would save its own values over them.
+
+Usage: python duel_rate.py [duel.db] [options]
+Run with -h to list the options. Needs NumPy (pip install numpy).
+"""
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SCALE = 173.7178
+DEFAULT_RATING = 1500.0
+DEFAULT_RD = 350.0
+DEFAULT_VOL = 0.06
+# Same floor as the plugin's live update, so batch and live ratings stay comparable
+MIN_RD = 30.0
+EPSILON = 1e-6
+MAX_ITERATIONS = 100
+
+def g(phi):
+    return 1 / np.sqrt(1 + 3 * phi ** 2 / math.pi ** 2)
+
+def solve_volatility(args):
+    """New volatility for a block of players (Glicko-2 step 5, Illinois method, all players at once).
+    Module-level so a process pool can run blocks of a big period in parallel."""
+    phi, sigma, v, delta, tau = args
+    a = np.log(sigma ** 2)
+    phi2, delta2 = phi ** 2, delta ** 2
+
+    def f(x, i):
+        ex = np.exp(x)
+        d = phi2[i] + v[i] + ex
+        return ex * (delta2[i] - phi2[i] - v[i] - ex) / (2 * d * d) - (x - a[i]) / tau ** 2
+
+    everyone = np.arange(len(a))
+    A = a.copy()
+    big = delta2 > phi2 + v
+    B = np.where(big, np.log(np.where(big, delta2 - phi2 - v, 1)), a - tau)
+    # Bracket the root for the rest: step down by tau until f turns non-negative
+    low = np.flatnonzero(~big & (f(B, everyone) < 0))
+    k = 1
+    while len(low) and k < MAX_ITERATIONS:
+        k += 1
+        B[low] = a[low] - k * tau
+        low = low[f(B[low], low) < 0]
+
+    fA, fB = f(A, everyone), f(B, everyone)
+    i = np.flatnonzero(np.abs(B - A) > EPSILON)
+    for _ in range(MAX_ITERATIONS):
+        if not len(i):
+            break
+        C = A[i] + (A[i] - B[i]) * fA[i] / (fB[i] - fA[i])
+        fC = f(C, i)
+        swap = fC * fB[i] <= 0
+        A[i] = np.where(swap, B[i], A[i])
+        fA[i] = np.where(swap, fB[i], fA[i] / 2)
+        B[i], fB[i] = C, fC
+        i = i[np.abs(B[i] - A[i]) > EPSILON]
+    return np.exp(A / 2)
+
+class RatingPeriods:
+    """Every player's Glicko-2 state as arrays (internal scale), updated one rating period at a time."""
+    def __init__(self, guids, mu, phi, sigma, tau=0.5, pool=None, block=50000):
+        self.guids = guids
+        self.mu = mu
+        self.phi = phi
+        self.sigma = sigma
+        self.tau = tau
+        self.pool = pool
+        self.block = block
+        self.periods = 0
+
+    def rate(self, winners, losers):
+        """Applies one rating period. winners/losers are index arrays, one entry per duel."""
+        n = len(self.guids)
+        mu, phi = self.mu, self.phi
+        # Each duel is one game for each side: a 1 for the winner, a 0 for the loser
+        player = np.concatenate((winners, losers))
+        opp = np.concatenate((losers, winners))
+        score = np.concatenate((np.ones(len(winners)), np.zeros(len(losers))))
+
+        g_opp = g(phi[opp])
+        E = 1 / (1 + np.exp(-g_opp * (mu[player] - mu[opp])))
+        v_inv = np.bincount(player, weights=g_opp ** 2 * E * (1 - E), minlength=n)
+        improvement = np.bincount(player, weights=g_opp * (score - E), minlength=n)
+
+        played = np.flatnonzero(v_inv > 0)
+        v = 1 / v_inv[played]
+        delta = v * improvement[played]
+        sigma = self.solve(phi[played], self.sigma[played], v, delta)
+
+        # Players who sat the period out only gain uncertainty
+        idle = np.ones(n, dtype=bool)
+        idle[played] = False
+        phi_new = phi.copy()
+        phi_new[idle] = np.sqrt(phi[idle] ** 2 + self.sigma[idle] ** 2)
+
+        phi_star = np.sqrt(phi[played] ** 2 + sigma ** 2)
+        phi_played = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+        mu[played] += phi_played ** 2 * improvement[played]
+        phi_new[played] = phi_played
+        self.phi = np.clip(phi_new, MIN_RD / SCALE, DEFAULT_RD / SCALE)
+        self.sigma[played] = sigma
+        self.periods += 1
+
+    def idle(self, periods):
+        """Periods nobody played: RD grows by the volatility once per period, nothing else changes."""
+        self.phi = np.minimum(np.sqrt(self.phi ** 2 + periods * self.sigma ** 2), DEFAULT_RD / SCALE)
+        self.periods += periods
+
+    def solve(self, phi, sigma, v, delta):
+        if self.pool is None or len(phi) <= self.block:
+            return solve_volatility((phi, sigma, v, delta, self.tau))
+        blocks = [(phi[i:i + self.block], sigma[i:i + self.block], v[i:i + self.block], delta[i:i + self.block], self.tau)
+                  for i in range(0, len(phi), self.block)]
+        return np.concatenate(list(self.pool.map(solve_volatility, blocks)))
+
+    def ratings(self):
+        """(guid, rating, rd, volatility) rows on the plugin's scale."""
+        rating = DEFAULT_RATING + SCALE * self.mu
+        rd = SCALE * self.phi
+        return list(zip(self.guids, rating.tolist(), rd.tolist(), self.sigma.tolist()))
+
+def column(conn, name, where, params, dtype, convert=None):
+    # One ledger column in rating order. Single-column queries stream straight into NumPy,
+    # which beats fetching whole rows and splitting them up by a wide margin.
+    cursor = conn.execute(f"SELECT {name} FROM duel_results{where} ORDER BY ts, id", params)
+    values = (convert(v) for v, in cursor) if convert else (v for v, in cursor)
+    return np.fromiter(values, dtype=dtype)
+
+def load_results(conn, since=None):
+    """The ledger as arrays: timestamps, winner and loser indexes, the guid for each index and
+    each player's (rating, rd) before their first recorded duel."""
+    where, params = (" WHERE ts >= ?", (since,)) if since is not None else ("", ())
+    index = {}
+    def number(guid):
+        return index.setdefault(guid, len(index))
+    ts = column(conn, "ts", where, params, np.float64)
+    ids = column(conn, "id", where, params, np.int64)
+    winners = column(conn, "winner_guid", where, params, np.int64, number)
+    losers = column(conn, "loser_guid", where, params, np.int64, number)
+
+    # Winner and loser of each duel side by side, in ledger order: a player's first
+    # appearance is the row that holds their rating from before the ledger
+    _, first_seen = np.unique(np.column_stack((winners, losers)).ravel(), return_index=True)
+    first = np.full((len(index), 2), np.nan)
+    wanted = {} # ledger id -> [(player, 0 for winner / 1 for loser)]
+    for player, pos in enumerate(first_seen.tolist()):
+        wanted.setdefault(int(ids[pos // 2]), []).append((player, pos % 2))
+    keys = list(wanted)
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        for row in conn.execute("SELECT id, winner_rating_before, winner_rd_before, loser_rating_before, loser_rd_before "
+                                f"FROM duel_results WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+            for player, side in wanted[row[0]]:
+                first[player] = [np.nan if x is None else x for x in row[1 + 2 * side:3 + 2 * side]]
+    return ts, winners, losers, list(index), first
+
+def run(args):
+    if np is None:
+        print("[SYSTEM] duel_rate.py needs NumPy: pip install numpy")
+        return 1
+    if not os.path.exists(args.db):
+        print(f"[DB ERROR] {args.db} not found")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    started = time.perf_counter()
+    ts, winners, losers, guids, first = load_results(conn, args.since)
+    if not guids:
+        print("[SYSTEM] duel_results is empty, nothing to rate.")
+        return 0
+    loaded = time.perf_counter()
+
+    n = len(guids)
+    if args.fresh:
+        mu, phi = np.zeros(n), np.full(n, DEFAULT_RD / SCALE)
+    else:
+        # Start everyone where the ledger first saw them, so duels from before the ledger still count
+        # (rows written before the plugin had a rating for the player hold NULLs)
+        rating = np.where(np.isnan(first[:, 0]), DEFAULT_RATING, first[:, 0])
+        rd = np.where(np.isnan(first[:, 1]), DEFAULT_RD, first[:, 1])
+        mu, phi = (rating - DEFAULT_RATING) / SCALE, rd / SCALE
+    sigma = np.full(n, DEFAULT_VOL)
+
+    pool = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    try:
+        engine = RatingPeriods(guids, mu, phi, sigma, tau=args.tau, pool=pool)
+        # Period boundaries: every duel in [start, start + period) is rated together
+        period = args.period * 3600
+        bucket = np.floor((ts - ts[0]) / period).astype(np.int64)
+        cuts = np.flatnonzero(np.diff(bucket)) + 1
+        previous = -1
+        for lo, hi in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [len(ts)]))):
+            # Empty periods in between still inflate everyone's RD
+            if bucket[lo] - previous > 1:
+                engine.idle(int(bucket[lo]) - previous - 1)
+            engine.rate(winners[lo:hi], losers[lo:hi])
+            previous = int(bucket[lo])
+    finally:
+        if pool:
+            pool.shutdown()
+    rated = time.perf_counter()
+
+    rows = engine.ratings()
+    print(f"[SYSTEM] Rated {len(ts)} duels between {n} players over {engine.periods} periods "
+          f"(load {loaded - started:.2f}s, rate {rated - loaded:.2f}s)")
+
+    if args.dry_run:
+        rows.sort(key=lambda r: -r[1])
+        print(f"{'guid':<34} {'rating':>8} {'rd':>7} {'vol':>8}")
+        for guid, rating, rd, vol in rows[:args.show]:
+            print(f"{guid:<34} {rating:>8.1f} {rd:>7.1f} {vol:>8.5f}")
+        return 0
+
+    with conn:
+        conn.executemany("UPDATE players SET duel_rating=?, rating_deviation=?, volatility=? WHERE guid=?",
+                         [(rating, rd, vol, guid) for guid, rating, rd, vol in rows])
+    print(f"[SYSTEM] Saved {len(rows)} ratings to {args.db} ({time.perf_counter() - rated:.2f}s)")
+    conn.close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute Glicko-2 ratings from the duel_results ledger")
+    parser.add_argument("db", nargs="?", default="duel.db", help="rating database (default: duel.db)")
+    parser.add_argument("--period", type=float, default=24, help="rating period length in hours (default: 24)")
+    parser.add_argument("--tau", type=float, default=0.5, help="Glicko-2 system constant (default: 0.5)")
+    parser.add_argument("--since", type=float, help="only replay duels from this Unix timestamp on")
+    parser.add_argument("--fresh", action="store_true", help="start every player at 1500/350 instead of their first ledger rating")
+    parser.add_argument("--workers", type=int, default=1, help="processes for the volatility solve in large periods (default: 1)")
+    parser.add_argument("--dry-run", action="store_true", help="print the top ratings instead of saving them")
+    parser.add_argument("--show", type=int, default=20, help="players listed by --dry-run (default: 20)")
+    return run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""Fake MBII server for load-testing the duel plugin on one machine.
+
+Listens for RCON on UDP like a real server (answering `status` with a full player table),
+writes a synthetic server log at the rates you ask for, and times how long the plugin takes
+from an event hitting the log to its RCON reply arriving here.
+
+Usage: python duel_sim.py --run-plugin [options]
+       python duel_sim.py --port 29070 --password secret --log sim_server.log
+Without --run-plugin, point a duel.cfg at the same port, password and log and start the
+plugin yourself. Run with -h to list the options.
+"""
+import argparse
+import collections
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from duel import name_key
+
+HEADER = b"\xff\xff\xff\xff"
+# Real servers split long replies; the plugin reassembles them
+MAX_DATAGRAM = 1400
+
+NAMES = [
+    "^1Dark^7Lord", "Cheems^3une Miku", "{JEDI}Valzhar", "Kyle^5Katarn", "[SITH]Revan", "Obi^4Wan",
+    "Ahsoka", "Mace^6Windu", "Padawan_01", "Rey", "^2Yoda^7", "Grievous", "^6Bo-Katan", "Boba^3Fett",
+    "Echo", "^1R^22^3D^42", "[TCW]Cody", "^5[501st]^7Rex", "^0Darth ^1Maul", "^3Qui-Gon^7 Jinn",
+    "Anakin", "^4Plo ^7Koon", "Ventress", "Dooku", "Luminara", "Shaak^6Ti", "Kit^2Fisto", "Aayla",
+    "^1Savage", "Hondo", "Fives", "Wolffe",
+]
+CHAT_COMMANDS = ["!rank", "!dtop", "!fttop", "!ttop", "!rank valz"]
+DUEL_WIN_PATTERN = re.compile(r'\[DUEL\] \^7(\S+) \^7wins!')
+
+def split_commands(text):
+    """Splits a packed RCON command on ';' outside of quotes."""
+    commands, current, quoted = [], [], False
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        if ch == ';' and not quoted:
+            commands.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    commands.append("".join(current).strip())
+    return [c for c in commands if c]
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return " ".join(f"{'-':>7}" for _ in points)
+    values = sorted(values)
+    return " ".join(f"{values[min(len(values) - 1, int(len(values) * p / 100))] * 1000:>5.0f}ms" for p in points)
+
+class Tracker:
+    """Pairs log events with the RCON replies they cause and keeps the latencies."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chat = collections.defaultdict(collections.deque) # slot -> times of unanswered commands
+        self.duels = collections.defaultdict(collections.deque) # winner's clean name -> times
+        self.latency = {"chat": [], "duel": []}
+        self.unmatched = 0
+
+    def chat_sent(self, slot, stamp):
+        with self.lock:
+            self.chat[slot].append(stamp)
+
+    def duel_ended(self, winner, stamp):
+        with self.lock:
+            self.duels[name_key(winner)].append(stamp)
+
+    def reply(self, command, stamp):
+        with self.lock:
+            if command.startswith("svtell "):
+                slot = command.split(' ', 2)[1]
+                pending = self.chat.get(int(slot)) if slot.isdigit() else None
+                if pending:
+                    # The first line back answers the oldest command; the rest of a multi-line reply is ignored
+                    self.latency["chat"].append(stamp - pending.popleft())
+                return
+            m = DUEL_WIN_PATTERN.search(command)
+            if m:
+                pending = self.duels.get(m.group(1))
+                if pending:
+                    self.latency["duel"].append(stamp - pending.popleft())
+                else:
+                    self.unmatched += 1
+
+    def outstanding(self):
+        with self.lock:
+            return sum(len(q) for q in self.chat.values()), sum(len(q) for q in self.duels.values())
+
+    def forget(self):
+        # A map change drops duels in progress and the plugin skips the lines queued before it
+        with self.lock:
+            self.chat.clear()
+            self.duels.clear()
+
+class FakeServer(threading.Thread):
+    """The server's RCON port: checks the password, answers status, records everything else."""
+    def __init__(self, port, password, players, tracker):
+        super().__init__(name="fake-rcon", daemon=True)
+        self.password = password
+        self.players = players
+        self.tracker = tracker
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", port))
+        self.port = self.sock.getsockname()[1]
+        self.sock.settimeout(0.5)
+        self.prefix = re.compile(rb'^\xff\xff\xff\xffrcon\s+(?:"([^"]*)"|(\S+))\s+(.*)$', re.DOTALL)
+        self.ready = threading.Event()
+        self.closed = False
+
+        # Counters
+        self.packets = 0
+        self.commands = 0
+        self.status_queries = 0
+        self.bad_password = 0
+
+    def status_reply(self):
+        lines = ["map: mb2_duel_sim",
+                 "num score ping name            address               qport  rate",
+                 "--- ----- ---- --------------- --------------------- ------ -----"]
+        for slot, name in enumerate(self.players):
+            lines.append(f"{slot:>3} {random.randint(-5, 60):>5} {random.randint(20, 150):>4} {name:<15} "
+                         f"10.0.{slot // 200}.{slot % 200 + 1}:29070 {random.randint(1000, 65535):>6} 25000")
+        return ("\n".join(lines) + "\n").encode("latin-1")
+
+    def send_reply(self, text, address):
+        for i in range(0, len(text), MAX_DATAGRAM):
+            self.sock.sendto(HEADER + b"print\n" + text[i:i + MAX_DATAGRAM], address)
+
+    def run(self):
+        while not self.closed:
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            stamp = time.monotonic()
+            m = self.prefix.match(data)
+            if not m:
+                continue
+            self.packets += 1
+            password = (m.group(1) or m.group(2) or b"").decode("latin-1")
+            if password != self.password:
+                self.bad_password += 1
+                self.send_reply(b"Bad rconpassword.\n", address)
+                continue
+            for command in split_commands(m.group(3).decode("latin-1")):
+                if command == "status":
+                    self.status_queries += 1
+                    self.ready.set()
+                    self.send_reply(self.status_reply(), address)
+                else:
+                    self.commands += 1
+                    self.tracker.reply(command, stamp)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+class LogWriter:
+    """Appends lines to the fake server log the way the game does: one write and flush per event."""
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="latin-1")
+        self.started = time.monotonic()
+        self.lines = 0
+
+    def write(self, text):
+        elapsed = int(time.monotonic() - self.started)
+        self.file.write(f"{elapsed // 60:>3}:{elapsed % 60:02d} {text}\n")
+        self.file.flush()
+        self.lines += 1
+        return time.monotonic()
+
+    def close(self):
+        self.file.close()
+
+def userinfo(slot, name):
+    return f"ClientUserinfoChanged: {slot} n\\{name}\\t\\{1 + slot % 2}\\model\\kyle/default\\c1\\4\\c2\\5"
+
+def simulate(args, server, tracker, log):
+    rng = random.Random(args.seed)
+    players = server.players
+    for slot, name in enumerate(players):
+        log.write(userinfo(slot, name))
+
+    # Each event kind fires on its own schedule: (next due, kind)
+    now = time.monotonic()
+    interval = {"duel": 1 / args.duels if args.duels > 0 else None,
+                "chat": 1 / args.chat if args.chat > 0 else None,
+                "map": 60 / args.maps if args.maps > 0 else None,
+                "noise": 1 / args.noise if args.noise > 0 else None}
+    due = {kind: now + rng.expovariate(1 / gap) for kind, gap in interval.items() if gap}
+    dueling = {} # slot -> time its duel ends
+    ends = [] # (time, winner, loser)
+    deadline = now + args.duration
+    next_report = now + args.report
+    last = (now, 0, 0, 0)
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        for end in [e for e in ends if e[0] <= now]:
+            ends.remove(end)
+            _, w, l = end
+            stamp = log.write(f"DuelEnd: {players[w]} has defeated {players[l]} in a private duel!")
+            tracker.duel_ended(players[w], stamp)
+            dueling.pop(w, None)
+            dueling.pop(l, None)
+        for kind in [k for k, t in due.items() if t <= now]:
+            due[kind] = now + rng.expovariate(1 / interval[kind])
+            if kind == "duel":
+                idle = [s for s in range(len(players)) if s not in dueling]
+                if len(idle) < 2:
+                    continue
+                a, b = rng.sample(idle, 2)
+                log.write(f"DuelStart: {players[a]} challenged {players[b]} to a private duel!")
+                length = rng.uniform(args.duel_length / 2, args.duel_length * 1.5)
+                dueling[a] = dueling[b] = now + length
+                ends.append((now + length, *((a, b) if rng.random() < 0.5 else (b, a))))
+            elif kind == "chat":
+                slot = rng.randrange(len(players))
+                stamp = log.write(f'{slot}: say: {players[slot]}: "{rng.choice(CHAT_COMMANDS)}"')
+                tracker.chat_sent(slot, stamp)
+            elif kind == "map":
+                log.write("InitGame: \\sv_hostname\\Duel Simulator\\g_gametype\\7\\mapname\\mb2_duel_sim")
+                tracker.forget()
+                dueling.clear()
+                ends.clear()
+                # Clients come back in a moment later, like after a real map change
+                time.sleep(1)
+                for slot, name in enumerate(players):
+                    log.write(userinfo(slot, name))
+            elif kind == "noise":
+                a, b = rng.sample(range(len(players)), 2)
+                log.write(f"Kill: {a} {b} 3: {players[a]} killed {players[b]} by MOD_SABER")
+
+        if now >= next_report:
+            t0, lines0, packets0, commands0 = last
+            span = now - t0
+            chat_open, duel_open = tracker.outstanding()
+            print(f"[SIM] {now - deadline + args.duration:>5.0f}s  log {(log.lines - lines0) / span:>6.0f} lines/s  "
+                  f"rcon {(server.packets - packets0) / span:>5.1f} packets/s {(server.commands - commands0) / span:>5.1f} cmds/s  "
+                  f"waiting on {chat_open} chat / {duel_open} duel replies")
+            last = (now, log.lines, server.packets, server.commands)
+            next_report = now + args.report
+        wake = min([deadline, next_report] + list(due.values()) + [e[0] for e in ends])
+        time.sleep(max(0.0, min(wake - time.monotonic(), 0.05)))
+
+def start_plugin(args, port, log_path, folder):
+    cfg = os.path.join(folder, "duel.cfg")
+    lines = ["[SETTINGS]", "ip = 127.0.0.1", f"port = {port}", f"rcon = {args.password}",
+             f"logname = {log_path}", f"db_file = {os.path.join(folder, 'duel.db')}"]
+    lines += [setting.replace("=", " = ", 1) for setting in args.setting]
+    with open(cfg, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    plugin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "duel.py")
+    output = open(os.path.join(folder, "plugin.log"), "w")
+    print(f"[SIM] Starting plugin, console output in {output.name}")
+    return subprocess.Popen([sys.executable, plugin, cfg], stdout=output, stderr=subprocess.STDOUT)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake MBII server for load-testing the duel plugin")
+    parser.add_argument("--port", type=int, default=0, help="UDP port for RCON (default: any free port with --run-plugin, else 29070)")
+    parser.add_argument("--password", default="simulator", help="RCON password the fake server accepts")
+    parser.add_argument("--log", help="server log to write (default: sim_server.log, or a temp file with --run-plugin)")
+    parser.add_argument("--players", type=int, default=32, help="players on the server (default: 32)")
+    parser.add_argument("--duels", type=float, default=2, help="duels started per second (default: 2)")
+    parser.add_argument("--duel-length", type=float, default=5, help="average seconds a duel lasts (default: 5)")
+    parser.add_argument("--chat", type=float, default=2, help="chat commands per second (default: 2)")
+    parser.add_argument("--maps", type=float, default=0.5, help="map changes per minute (default: 0.5)")
+    parser.add_argument("--noise", type=float, default=20, help="kill lines per second the plugin should ignore (default: 20)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run (default: 60)")
+    parser.add_argument("--report", type=float, default=10, help="seconds between progress lines (default: 10)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run-plugin", action="store_true", help="start duel.py against the simulator with a throwaway database")
+    parser.add_argument("--keep", action="store_true", help="keep the --run-plugin folder (database, config, logs) instead of removing it")
+    parser.add_argument("--setting", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra [SETTINGS] line for --run-plugin, e.g. --setting rcon_rate=50")
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix="duel_sim_") if args.run_plugin else None
+    log_path = args.log or (os.path.join(folder, "server.log") if folder else "sim_server.log")
+    port = args.port or (0 if args.run_plugin else 29070)
+
+    players = [NAMES[i % len(NAMES)] + (f"{i // len(NAMES)}" if i >= len(NAMES) else "") for i in range(args.players)]
+    tracker = Tracker()
+    server = FakeServer(port, args.password, players, tracker)
+    server.start()
+    open(log_path, "a").close() # the plugin starts tailing at the end of the file
+    log = LogWriter(log_path)
+    print(f"[SIM] RCON on 127.0.0.1:{server.port}, writing {log_path}")
+
+    plugin = start_plugin(args, server.port, log_path, folder) if args.run_plugin else None
+    started, elapsed = None, 0
+    try:
+        # The plugin asks for status as soon as it is up; start the clock then
+        print("[SIM] Waiting for the plugin's first status query...")
+        while not server.ready.wait(1):
+            if plugin and plugin.poll() is not None:
+                print("[SIM] Plugin exited before it was ready.")
+                return 1
+        time.sleep(0.5)
+        started = time.monotonic()
+        simulate(args, server, tracker, log)
+        # Give replies still in flight a moment to land
+        time.sleep(2)
+        elapsed = time.monotonic() - started
+    except KeyboardInterrupt:
+        elapsed = time.monotonic() - started if started else 0
+    finally:
+        if plugin:
+            plugin.terminate()
+            plugin.wait()
+        server.close()
+        log.close()
+        if folder:
+            if args.keep:
+                print(f"[SIM] Kept {folder}")
+            else:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    if not elapsed:
+        return 0
+    chat_open, duel_open = tracker.outstanding()
+    print(f"\n[SIM] {elapsed:.0f}s: {log.lines} log lines, {server.packets} RCON packets ({server.packets / elapsed:.1f}/s), "
+          f"{server.commands} commands ({server.commands / elapsed:.1f}/s), {server.status_queries} status queries")
+    print(f"{'reply':<6} {'count':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'unanswered':>11}")
+    for kind, waiting in (("chat", chat_open), ("duel", duel_open)):
+        values = tracker.latency[kind]
+        print(f"{kind:<6} {len(values):>6} {percentiles(values)} {waiting:>11}")
+    if server.bad_password:
+        print(f"[SIM] {server.bad_password} packets had the wrong RCON password")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
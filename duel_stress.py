@@ -0,0 +1,156 @@
+"""Stress test for several plugin processes sharing one duel.db.
+
+Starts a number of worker processes, each a full MBIIDuelPlugin on the same database with its own
+in-memory copy of the same players, and has them all report duels between those players as fast
+as they can through the DuelEnd handler. Afterwards the duel_results ledger is checked: every
+duel must start from the rating the player's previous duel ended on, every row must be a correct
+Glicko-2 update of its own "before" values, and every saved rating must be the last one in the
+ledger. A lost update breaks that chain.
+
+Usage: python duel_stress.py [options]
+Run with -h to list the options. Exits with status 1 if an update was lost.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import duel
+
+def make_settings(db_path, extra):
+    settings = {"ip": "127.0.0.1", "port": "9", "rcon": "stress", "db_file": db_path, "rd_inflation_hours": "0"}
+    settings.update(extra)
+    return settings
+
+def create_players(db_path, count, extra):
+    """Fresh database with `count` players at 1500/350. Returns their guids."""
+    plugin = duel.MBIIDuelPlugin(settings=make_settings(db_path, extra))
+    guids = [f"{i:032X}" for i in range(1, count + 1)]
+    plugin.db.executemany("INSERT INTO players (guid, name, clean_name, duel_rating, rating_deviation) VALUES (?, ?, ?, 1500, 350)",
+                          [(guid, f"Stress{i:03d}", duel.name_key(f"Stress{i:03d}")) for i, guid in enumerate(guids, 1)])
+    plugin.shutdown()
+    return guids
+
+def worker(index, db_path, duels, seed, extra, ready, go, results):
+    # Every process prints its own startup lines; the totals come back through `results`
+    sys.stdout = open(os.devnull, "w")
+    random.seed(seed + index)
+    plugin = duel.MBIIDuelPlugin(settings=make_settings(db_path, extra))
+    plugin.send_rcon = plugin.send_rcon_many = lambda *args, **kwargs: ""
+
+    # Loaded once, like a plugin that synced its players a while ago; the copies go stale
+    # as soon as another process rates one of them
+    roster = []
+    for slot, (guid, name, rating, rd) in enumerate(plugin.db.query("SELECT guid, name, duel_rating, rating_deviation FROM players")):
+        player = duel.Player(slot, name, guid, rating, rd)
+        player.db_guid = guid
+        roster.append(plugin.players.add(player))
+
+    ready.put(index)
+    go.wait()
+    for n in range(duels):
+        winner, loser = random.sample(roster, 2)
+        plugin.active_duels.add(tuple(sorted([winner.clean_name, loser.clean_name])))
+        plugin.handle_duel_end(f"{index}:{n} DuelEnd: {winner.name} has defeated {loser.name} in a private duel")
+    plugin.shutdown()
+    results.put((index, plugin.rating_conflicts, plugin.db.busy, plugin.db.errors))
+
+def verify(db_path, guids, expected):
+    """Problems found in the ledger and the saved ratings, as readable lines."""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("""SELECT winner_guid, loser_guid,
+                                  winner_rating_before, winner_rd_before, loser_rating_before, loser_rd_before,
+                                  winner_rating_after, winner_rd_after, loser_rating_after, loser_rd_after
+                           FROM duel_results ORDER BY id""").fetchall()
+    problems = []
+    if len(rows) != expected:
+        problems.append(f"{expected} duels reported but {len(rows)} in the ledger")
+
+    last = {guid: (1500.0, 350.0) for guid in guids}
+    for number, row in enumerate(rows, 1):
+        winner, loser, before, after = row[0], row[1], row[2:6], row[6:10]
+        if duel.glicko2_duel(*before) != after:
+            problems.append(f"duel {number}: saved result is not the update of its own before values")
+        for guid, rating_before, rating_after in ((winner, before[0:2], after[0:2]), (loser, before[2:4], after[2:4])):
+            if last[guid] != rating_before:
+                problems.append(f"duel {number}: {guid[-6:]} started from {rating_before[0]:.2f}, "
+                                f"but their previous duel ended on {last[guid][0]:.2f}")
+            last[guid] = rating_after
+
+    for guid, rating, rd in conn.execute("SELECT guid, duel_rating, rating_deviation FROM players"):
+        if last.get(guid, (1500.0, 350.0)) != (rating, rd):
+            problems.append(f"{guid[-6:]} is saved at {rating:.2f}, the ledger ends on {last[guid][0]:.2f}")
+    conn.close()
+    return problems
+
+def run(args):
+    folder = None
+    if args.db:
+        if os.path.exists(args.db):
+            print(f"[STRESS] {args.db} already exists; pick a new path, the test needs a fresh database")
+            return 1
+        db_path = args.db
+    else:
+        folder = tempfile.mkdtemp(prefix="duel_stress_")
+        db_path = os.path.join(folder, "duel.db")
+    extra = dict(setting.split("=", 1) for setting in args.setting)
+
+    guids = create_players(db_path, args.players, extra)
+    print(f"[STRESS] {args.processes} processes x {args.duels} duels between {args.players} players on {db_path}")
+
+    context = multiprocessing.get_context("spawn")
+    ready, results, go = context.Queue(), context.Queue(), context.Event()
+    workers = [context.Process(target=worker, args=(i, db_path, args.duels, args.seed, extra, ready, go, results))
+               for i in range(args.processes)]
+    for process in workers:
+        process.start()
+    # Wait for every plugin to finish starting up so the duels really overlap
+    for _ in workers:
+        ready.get()
+    started = time.perf_counter()
+    go.set()
+    totals = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    for process in workers:
+        process.join()
+
+    expected = args.processes * args.duels
+    conflicts = sum(t[1] for t in totals)
+    busy = sum(t[2] for t in totals)
+    errors = sum(t[3] for t in totals)
+    print(f"[STRESS] {expected} duels in {elapsed:.2f}s ({expected / elapsed:.0f}/s), "
+          f"{busy} busy retries, {errors} DB errors")
+    print(f"[STRESS] {conflicts} duels started from ratings another process had changed "
+          f"(each one an update a read-modify-write from memory would have lost)")
+
+    problems = verify(db_path, guids, expected)
+    if problems:
+        print(f"[STRESS] FAILED: {len(problems)} problems")
+        for line in problems[:20]:
+            print(f"[STRESS]   {line}")
+        return 1
+    print("[STRESS] OK: the ledger chains up for every player and matches the saved ratings")
+    if folder and not args.keep:
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+        os.rmdir(folder)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that plugin processes sharing one duel.db never lose a rating update")
+    parser.add_argument("--processes", type=int, default=4, help="plugin processes (default: 4)")
+    parser.add_argument("--players", type=int, default=16, help="players they all share (default: 16)")
+    parser.add_argument("--duels", type=int, default=500, help="duels rated by each process (default: 500)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="database to create (default: a temporary one, removed if the test passes)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary database")
+    parser.add_argument("--setting", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra [SETTINGS] line for every process, e.g. --setting db_busy_timeout_ms=500")
+    return run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())